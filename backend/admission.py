@@ -0,0 +1,238 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+from extractor import (
+    extract_raw_detections_from_list,
+    extract_raw_detections_from_tree,
+    infer_resolution_from_graph_or_boxes,
+    is_enhanced_schema,
+)
+
+ZONES = ("header", "body", "footer")
+
+
+def _env_float(name, default):
+    """读取数值型环境变量，非法时返回默认值"""
+    try:
+        return float(os.getenv(name) or default)
+    except ValueError:
+        return float(default)
+
+def _zone_counts(data):
+    """按页面区域（与语义图构建的 zone 划分一致）统计节点数
+
+    增强语义图直接读取 topology.zone；原始树/列表只提取检测框，
+    不做可见性裁剪，因此是裁剪后节点数的上界。
+    """
+    counts = dict.fromkeys(ZONES, 0)
+    if not data:
+        return counts
+    if is_enhanced_schema(data):
+        for e in data.get("elements", []):
+            z = (e.get("topology") or {}).get("zone") or "body"
+            counts[z] = counts.get(z, 0) + 1
+        return counts
+    raw = extract_raw_detections_from_list(data) if isinstance(data, list) else extract_raw_detections_from_tree(data)
+    _, h = infer_resolution_from_graph_or_boxes(data, raw)
+    for it in raw:
+        cy = (it["box"][1] + it["box"][3]) / 2.0 / h
+        counts["header" if cy < 0.15 else "footer" if cy > 0.85 else "body"] += 1
+    return counts
+
+def estimate_cost(design_data, code_data, design_candidates=0):
+    """在构建语义图之前估算一次对比的开销
+
+    参数:
+    - design_data / code_data: 已解析的设计端/运行时数据
+    - design_candidates: 省略设计端时从设计稿库检索的候选数，
+      每个候选都要完整匹配一次，设计端按与运行时同规模估算
+
+    返回:
+    - dict: design_nodes、runtime_nodes、cells（各区域匹配代价矩阵单元数之和）、
+      est_issues（缺失/新增问题数的下界，决定规划阶段的调用量）
+    """
+    runtime = _zone_counts(code_data)
+    design = _zone_counts(design_data) if design_data else dict(runtime)
+    cells = sum(design[z] * runtime[z] for z in ZONES)
+    if not design_data:
+        cells *= max(1, int(design_candidates or 3)) + 1
+    nd, nr = sum(design.values()), sum(runtime.values())
+    return {
+        "design_nodes": nd,
+        "runtime_nodes": nr,
+        "cells": int(cells),
+        "est_issues": sum(abs(design[z] - runtime[z]) for z in ZONES),
+    }
+
+def sum_costs(costs):
+    """累加多次对比的开销估算（如矩阵对比中各设备与同一设计的比较）"""
+    out = {"design_nodes": 0, "runtime_nodes": 0, "cells": 0, "est_issues": 0}
+    for c in costs:
+        for k in out:
+            out[k] += int(c.get(k, 0))
+    return out
+
+def parse_wait(value, max_wait_s):
+    """解析请求中的 admission_wait_s：缺省返回 None，结果不超过 max_wait_s
+
+    异常:
+    - ValueError: 非数值、非有限值或负数
+    """
+    if value in (None, ''):
+        return None
+    try:
+        wait = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"admission_wait_s must be a number, got {value!r}")
+    if not math.isfinite(wait) or wait < 0:
+        raise ValueError(f"admission_wait_s must be a non-negative number, got {value!r}")
+    return min(wait, max_wait_s)
+
+
+class AdmissionRejected(RuntimeError):
+    """请求未被准入（队列已满或排队超时），附带建议的重试等待秒数"""
+    def __init__(self, reason, retry_after_s):
+        super().__init__(f"server busy ({reason}), retry after {retry_after_s}s")
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class AdmissionController:
+    """对比请求的准入控制
+
+    每个请求按 estimate_cost 的结果折算为各资源池的权重：
+    - cpu: 1 + cells // cells_per_unit，对应构建与匹配阶段的计算量；
+    - llm: 1 + est_issues // issues_per_unit，对应规划阶段的模型调用量。
+    权重不超过资源池容量（超大请求独占运行而不是永远无法准入）。
+    请求须同时取得全部资源池的权重才开始执行，容量不足时按到达顺序排队
+    （先进先出，大请求不会被源源不断的小请求饿死）；队列长度与等待时间都有上限，
+    超出时抛出 AdmissionRejected，重试等待按在途与排队权重及单位权重的平均耗时估算。
+    计数为进程内状态，多进程部署时每个进程各自限流。
+    """
+    def __init__(self, config=None):
+        """初始化准入控制器
+
+        参数:
+        - config: 可选，{"capacity": {"cpu", "llm"}, "max_queue", "max_wait_s",
+          "cells_per_unit", "issues_per_unit"}；默认读取环境变量
+        """
+        self.config = config or {
+            "capacity": {
+                "cpu": int(_env_float("UI_COMPARE_ADMIT_CPU", max(2, os.cpu_count() or 2))),
+                "llm": int(_env_float("UI_COMPARE_ADMIT_LLM", 8)),
+            },
+            "max_queue": int(_env_float("UI_COMPARE_ADMIT_QUEUE", 32)),
+            "max_wait_s": _env_float("UI_COMPARE_ADMIT_WAIT_S", 30),
+            "cells_per_unit": 250000,
+            "issues_per_unit": 20,
+        }
+        self.capacity = {k: max(1, int(v)) for k, v in self.config["capacity"].items()}
+        self._cond = threading.Condition()
+        self._in_use = dict.fromkeys(self.capacity, 0)
+        self._queue = deque()
+        self._waits = deque(maxlen=512)
+        self._unit_s = 1.0
+        self._counts = {"admitted": 0, "completed": 0, "queue_full": 0, "wait_timeout": 0}
+
+    def weigh(self, cost):
+        """将开销估算折算为各资源池的权重"""
+        raw = {
+            "cpu": 1 + int(cost.get("cells", 0)) // int(self.config.get("cells_per_unit", 250000)),
+            "llm": 1 + int(cost.get("est_issues", 0)) // int(self.config.get("issues_per_unit", 20)),
+        }
+        return {k: min(raw.get(k, 1), cap) for k, cap in self.capacity.items()}
+
+    def _fits(self, weights):
+        return all(self._in_use[k] + w <= self.capacity[k] for k, w in weights.items())
+
+    def _retry_after(self):
+        """估算排队清空所需秒数（调用方持有锁）"""
+        pending = sum(t["weights"]["cpu"] for t in self._queue) + self._in_use["cpu"]
+        return int(min(300, max(1, math.ceil(pending * self._unit_s / self.capacity["cpu"]))))
+
+    def acquire(self, cost, max_wait_s=None):
+        """申请准入，成功返回票据（须以 release 归还）
+
+        参数:
+        - cost: estimate_cost 的结果
+        - max_wait_s: 可选，最长排队秒数，默认 config["max_wait_s"]
+
+        异常:
+        - AdmissionRejected: 队列已满（queue_full）或排队超时（wait_timeout）
+        """
+        ticket = {"weights": self.weigh(cost), "cost": cost, "queued_at": time.monotonic()}
+        wait = float(self.config.get("max_wait_s", 30) if max_wait_s is None else max_wait_s)
+        with self._cond:
+            if not self._queue and self._fits(ticket["weights"]):
+                return self._grant(ticket)
+            if len(self._queue) >= int(self.config.get("max_queue", 32)):
+                self._counts["queue_full"] += 1
+                raise AdmissionRejected("queue_full", self._retry_after())
+            self._queue.append(ticket)
+            end = ticket["queued_at"] + wait
+            while not (self._queue[0] is ticket and self._fits(ticket["weights"])):
+                left = end - time.monotonic()
+                if left <= 0:
+                    self._queue.remove(ticket)
+                    self._counts["wait_timeout"] += 1
+                    self._cond.notify_all()
+                    raise AdmissionRejected("wait_timeout", self._retry_after())
+                self._cond.wait(left)
+            self._queue.popleft()
+            self._cond.notify_all()
+            return self._grant(ticket)
+
+    def _grant(self, ticket):
+        """占用权重并记录排队耗时（调用方持有锁）"""
+        for k, w in ticket["weights"].items():
+            self._in_use[k] += w
+        ticket["started_at"] = time.monotonic()
+        ticket["waited_ms"] = round((ticket["started_at"] - ticket["queued_at"]) * 1000.0, 2)
+        self._waits.append(ticket["waited_ms"])
+        self._counts["admitted"] += 1
+        return ticket
+
+    def release(self, ticket):
+        """归还权重并更新单位权重平均耗时"""
+        held = time.monotonic() - ticket["started_at"]
+        with self._cond:
+            for k, w in ticket["weights"].items():
+                self._in_use[k] -= w
+            self._unit_s = 0.8 * self._unit_s + 0.2 * held / max(1, ticket["weights"]["cpu"])
+            self._counts["completed"] += 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, cost, max_wait_s=None):
+        """acquire/release 的上下文管理器形式"""
+        ticket = self.acquire(cost, max_wait_s)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def snapshot(self):
+        """返回当前状态：容量与占用、队列深度与排队权重、等待耗时分位数、计数与重试建议"""
+        with self._cond:
+            waits = np.asarray(self._waits, dtype=np.float64)
+            wait_ms = None
+            if len(waits):
+                p50, p95 = np.percentile(waits, [50, 95])
+                wait_ms = {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "max": round(float(waits.max()), 2), "samples": int(len(waits))}
+            return {
+                "capacity": dict(self.capacity),
+                "in_use": dict(self._in_use),
+                "queue_depth": len(self._queue),
+                "queued_weight": {k: sum(t["weights"][k] for t in self._queue) for k in self.capacity},
+                "oldest_wait_ms": round((time.monotonic() - self._queue[0]["queued_at"]) * 1000.0, 2) if self._queue else 0.0,
+                "wait_ms": wait_ms,
+                "unit_s": round(self._unit_s, 4),
+                "retry_after_s": self._retry_after(),
+                "counts": dict(self._counts),
+            }
@@ -1,23 +1,59 @@
 from flask import Flask, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_cors import CORS
 try:
     from dotenv import load_dotenv
 except Exception:
     def load_dotenv():
         return None
+import atexit
+import hashlib
+import heapq
 import json
+import math
 import os
+import threading
+from collections import OrderedDict
 from io import BytesIO
 import base64
+import time
 import uuid
-from semantic_graph import UISemanticBuilder
+import numpy as np
+from extractor import (
+    normalize_to_components,
+    is_enhanced_schema,
+    extract_raw_detections_from_list,
+    extract_page_info,
+)
 from matcher import UIFuzzyMatcher
 from differ import UISemanticDiffer
+from image_differ import ImageDecodeError, UIImageDiffer, decode_image
+from tile_hash import TileMaskError, changed_tile_mask, parse_tile_mask, split_by_tiles
+from graph_codec import MAGIC as GRAPH_MAGIC, GraphValidationError, decode_graph, unpack_msgpack, validate_graph
+from payload import InvalidPayload, PayloadTooLarge, UnsupportedEncoding, max_payload_bytes, read_stream
+from pipeline import build_semantic_graph, compare_device_matrix, compare_pages
+from parallel_match import get_pool, parse_workers, pool_size, shutdown_pool
+from history import ReportHistory
+from design_library import DesignLibrary
+from viewport_index import ViewportIndex
+from artifacts import ArtifactStore
+from admission import AdmissionController, AdmissionRejected, estimate_cost, parse_wait, sum_costs
+from planner.resilience import Deadline
 from planner.service import LangChainPlanner, build_issue_context
 
 load_dotenv()
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = max_payload_bytes()
 CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=False)
+OUTPUT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'output'))
+UPLOAD_DIR = os.path.join(OUTPUT_ROOT, 'uploads')
+history = ReportHistory()
+artifacts = ArtifactStore(OUTPUT_ROOT)
+design_library = DesignLibrary()
+admission = AdmissionController()
+_viewport_cache = OrderedDict()
+_viewport_lock = threading.Lock()
+VIEWPORT_CACHE_SIZE = 16
 
 class ComponentComparator:
     """组件集合比较器
@@ -46,36 +82,91 @@ class ComponentComparator:
         
         return intersection / union if union > 0 else 0.0
     
+    def _candidate_pairs(self, design_components, code_components):
+        """扫描线生成候选对
+
+        按 x1 排序扫描两组框，用以 x2 为键的小顶堆淘汰已离开扫描线的框，
+        只对 x/y 区间均有重叠、且满足 IoU 阈值必要条件的框计算 IoU。
+        IoU >= t 蕴含两框在各轴上的重叠长度不小于 t 倍较大边长、面积比不小于 t。
+
+        返回:
+        - dict: 设计下标 -> [(代码下标, IoU)]，仅包含 IoU 达到阈值的候选
+        """
+        t = self.match_threshold
+        tt = t * (1.0 - 1e-9)
+        events = []
+        for side, comps in ((0, design_components), (1, code_components)):
+            for idx, comp in enumerate(comps):
+                bb = comp['bounding_box']
+                if bb['width'] > 0 and bb['height'] > 0:
+                    events.append((bb['x'], side, idx, bb))
+        events.sort(key=lambda e: (e[0], e[1], e[2]))
+        active = ({}, {})
+        expiry = ([], [])
+        cands = {}
+        for x1, side, idx, bb in events:
+            for s in (0, 1):
+                heap = expiry[s]
+                while heap and heap[0][0] <= x1:
+                    active[s].pop(heapq.heappop(heap)[1], None)
+            other = 1 - side
+            y1 = bb['y']
+            y2 = bb['y'] + bb['height']
+            area = bb['width'] * bb['height']
+            for oidx, ob in active[other].items():
+                oy1 = ob['y']
+                oy2 = ob['y'] + ob['height']
+                iy = min(y2, oy2) - max(y1, oy1)
+                if iy <= 0 or iy < tt * max(bb['height'], ob['height']):
+                    continue
+                ix = min(x1 + bb['width'], ob['x'] + ob['width']) - max(x1, ob['x'])
+                if ix < tt * max(bb['width'], ob['width']):
+                    continue
+                oarea = ob['width'] * ob['height']
+                if min(area, oarea) < tt * max(area, oarea):
+                    continue
+                d_idx, c_idx = (idx, oidx) if side == 0 else (oidx, idx)
+                d_bb, c_bb = (bb, ob) if side == 0 else (ob, bb)
+                iou = self.calculate_iou(d_bb, c_bb)
+                if iou >= t:
+                    cands.setdefault(d_idx, []).append((c_idx, iou))
+            active[side][idx] = bb
+            heapq.heappush(expiry[side], (x1 + bb['width'], idx))
+        return cands
+
     def compare_components(self, design_components, code_components):
-        """比较两组组件并返回匹配结果与统计信息"""
+        """比较两组组件并返回匹配结果与统计信息
+
+        候选对由扫描线生成，按设计组件顺序贪心选取 IoU 最高（并列取靠前）
+        的未匹配代码组件，结果与逐对比较一致。
+        """
         matches = []
         unmatched_design = []
         unmatched_code = []
         
-        # Create copies to track unmatched components
-        remaining_code = code_components.copy()
+        cands = self._candidate_pairs(design_components, code_components)
+        taken = [False] * len(code_components)
         
-        for design_comp in design_components:
+        for i, design_comp in enumerate(design_components):
             best_match = None
             best_iou = 0
             
-            for i, code_comp in enumerate(remaining_code):
-                iou = self.calculate_iou(design_comp['bounding_box'], code_comp['bounding_box'])
-                if iou > best_iou and iou >= self.match_threshold:
+            for j, iou in sorted(cands.get(i, ())):
+                if not taken[j] and iou > best_iou:
                     best_iou = iou
-                    best_match = i
+                    best_match = j
             
             if best_match is not None:
                 matches.append({
                     'design_component': design_comp,
-                    'code_component': remaining_code[best_match],
+                    'code_component': code_components[best_match],
                     'iou': best_iou
                 })
-                remaining_code.pop(best_match)
+                taken[best_match] = True
             else:
                 unmatched_design.append(design_comp)
         
-        unmatched_code = remaining_code
+        unmatched_code = [c for j, c in enumerate(code_components) if not taken[j]]
         
         return {
             'matches': matches,
@@ -127,144 +218,367 @@ class ComponentComparator:
 
 comparator = ComponentComparator()
 
-def parse_bounds(bounds_str):
-    """解析字符串格式的 bounds，返回 {x,y,width,height}
+def components_from_input(data):
+    """将任意输入形式转换为 ComponentComparator 使用的组件列表"""
+    if is_enhanced_schema(data):
+        out = []
+        for e in data.get('elements', []):
+            x1, y1, x2, y2 = (e.get('geometry', {}).get('abs') or [0, 0, 0, 0])[:4]
+            out.append({'id': str(e.get('id')), 'type': e.get('type', {}).get('label') or 'component',
+                        'bounding_box': {'x': x1, 'y': y1, 'width': max(0, x2 - x1), 'height': max(0, y2 - y1)}})
+        return out
+    if isinstance(data, list):
+        out = []
+        for i, it in enumerate(extract_raw_detections_from_list(data)):
+            x1, y1, x2, y2 = it['box']
+            out.append({'id': str(i), 'type': it.get('label') or 'component',
+                        'bounding_box': {'x': x1, 'y': y1, 'width': max(0, x2 - x1), 'height': max(0, y2 - y1)}})
+        return out
+    return normalize_to_components(data)
+
+def iou_compare(design_data, code_data):
+    """仅基于 IoU 的快速对比（不构建语义图、不调用规划器），用于超大层级的预检查"""
+    t = time.perf_counter()
+    result = comparator.compare_components(components_from_input(design_data), components_from_input(code_data))
+    return {
+        'success': True,
+        'mode': 'iou',
+        'metrics': comparator.generate_metrics(result),
+        'comparison_result': result,
+        'ai_suggestions': comparator.generate_ai_suggestions(result),
+        'timings': {'match': _elapsed_ms(t)},
+    }
+
+def time_budget_ms(data):
+    """读取 fast 模式的匹配时间预算 time_budget_ms（默认 200）
 
-    参数:
-    - bounds_str: 类似 "[x1,y1][x2,y2]" 或包含四个整数的字符串
-    返回 None 表示解析失败
+    异常:
+    - ValueError: 非数值、非有限值或不大于 0
     """
+    value = data.get('time_budget_ms')
+    if value in (None, ''):
+        return 200.0
     try:
-        nums = [int(n) for n in __import__("re").findall(r"-?\d+", str(bounds_str))]
-        if len(nums) >= 4:
-            x1, y1, x2, y2 = nums[:4]
-            w = max(0, x2 - x1)
-            h = max(0, y2 - y1)
-            return {"x": x1, "y": y1, "width": w, "height": h}
-    except Exception:
-        pass
-    return None
+        budget = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'time_budget_ms must be a number, got {value!r}')
+    if not math.isfinite(budget) or budget <= 0:
+        raise ValueError(f'time_budget_ms must be a positive number, got {value!r}')
+    return budget
+
+def _array_digest(arr):
+    """numpy 数组（截图像素、瓦片掩码）的内容摘要，未提供时返回 None"""
+    if arr is None:
+        return None
+    return hashlib.sha256(repr((arr.shape, arr.dtype.str)).encode('utf-8') + np.ascontiguousarray(arr).tobytes()).hexdigest()
+
+def _elapsed_ms(start):
+    """返回自 start（perf_counter）以来的毫秒数"""
+    return round((time.perf_counter() - start) * 1000.0, 2)
+
+def _upload_path(image_id):
+    """上传截图的存储路径（output/uploads/<image_id>.img）"""
+    return os.path.join(UPLOAD_DIR, f'{image_id}.img')
 
-def normalize_to_components(data):
-    """从原始层级数据抽取为组件列表
+def load_request_image(data, key):
+    """读取请求中附带的截图并解码（每张截图只解码一次）
 
-    识别字典节点的 attributes/bounds/type/text 等信息并生成统一格式。
+    支持两种形式:
+    - <key>: base64 字符串或 data URL
+    - <key>_id: /api/upload-image 返回的 image_id
+    返回 None 表示未提供
+
+    异常:
+    - ImageDecodeError: 截图无法解码，或 image_id 非法/不存在（可能已过期清理）
     """
-    result = []
-    idx = 0
-
-    def rec(node):
-        nonlocal idx
-        if isinstance(node, dict):
-            attrs = node.get("attributes") if isinstance(node.get("attributes"), dict) else None
-            if attrs:
-                bounds = attrs.get("bounds")
-                bb = parse_bounds(bounds) if isinstance(bounds, str) else None
-                t = attrs.get("type") or "component"
-                if bb and t != "root" and bb["width"] > 0 and bb["height"] > 0:
-                    comp_id = attrs.get("accessibilityId") or attrs.get("hashcode") or str(idx)
-                    idx += 1
-                    comp = {
-                        "id": str(comp_id),
-                        "type": t,
-                        "bounding_box": bb
-                    }
-                    txt = attrs.get("text")
-                    if isinstance(txt, str) and txt:
-                        comp["text"] = txt
-                    result.append(comp)
-            children = node.get("children")
-            if isinstance(children, list):
-                for c in children:
-                    rec(c)
-        elif isinstance(node, list):
-            for it in node:
-                rec(it)
-
-    rec(data)
-    return result
-
-def is_enhanced_schema(obj):
-    """判断对象是否为增强语义图结构（包含 meta/elements）"""
-    return isinstance(obj, dict) and isinstance(obj.get("meta"), dict) and isinstance(obj.get("elements"), list)
-
-def extract_raw_detections_from_list(data):
-    """从简单列表结构提取原始检测项
-
-    每项需包含 box=[x1,y1,x2,y2]，可选 label/conf/text/ocr_conf
+    raw = data.get(key)
+    if raw:
+        img = decode_image(raw)
+        if img is None:
+            raise ImageDecodeError(f'{key} is not a decodable image')
+        return img
+    image_id = data.get(f'{key}_id')
+    if image_id in (None, ''):
+        return None
+    path = _upload_path(image_id) if isinstance(image_id, str) and image_id.isalnum() else None
+    if path is None or not os.path.exists(path):
+        raise ImageDecodeError(f'{key}_id {image_id!r} does not refer to an uploaded image')
+    with open(path, 'rb') as f:
+        img = decode_image(f.read())
+    if img is None:
+        raise ImageDecodeError(f'{key}_id {image_id!r} is not a decodable image')
+    return img
+
+def resolve_tile_mask(data, runtime_img=None):
+    """确定本次对比的变化瓦片掩码
+
+    优先使用请求中的 changed_tiles；否则在提供 baseline_image
+    （上一版本运行时截图）时与 runtime_image 计算。均未提供返回 None。
+    changed_tiles 非法时抛出 TileMaskError（请求返回 400）。
     """
-    out = []
-    if isinstance(data, list):
-        for it in data:
-            box = it.get("box")
-            if isinstance(box, (list, tuple)) and len(box) >= 4:
-                out.append({
-                    "label": it.get("label", "unknown"),
-                    "box": [box[0], box[1], box[2], box[3]],
-                    "conf": it.get("conf", 0.0),
-                    "text": it.get("text"),
-                    "ocr_conf": it.get("ocr_conf", 0.0),
-                })
-    return out
-
-def extract_raw_detections_from_tree(data):
-    """从树形结构（含 children/attributes）提取原始检测项"""
-    out = []
-    def rec(node):
-        if isinstance(node, dict):
-            attrs = node.get("attributes") if isinstance(node.get("attributes"), dict) else None
-            if attrs:
-                bounds = attrs.get("bounds")
-                bb = parse_bounds(bounds) if isinstance(bounds, str) else None
-                t = attrs.get("type") or attrs.get("label") or "unknown"
-                if bb and t != "root" and bb["width"] > 0 and bb["height"] > 0:
-                    x1 = bb["x"]
-                    y1 = bb["y"]
-                    x2 = x1 + bb["width"]
-                    y2 = y1 + bb["height"]
-                    out.append({
-                        "label": t,
-                        "box": [x1, y1, x2, y2],
-                        "conf": 0.0,
-                        "text": attrs.get("text"),
-                        "ocr_conf": 0.0,
-                    })
-            children = node.get("children")
-            if isinstance(children, list):
-                for c in children:
-                    rec(c)
-        elif isinstance(node, list):
-            for it in node:
-                rec(it)
-    rec(data)
-    return out
-
-def infer_resolution_from_graph_or_boxes(obj, raw_detections):
-    """推断分辨率
-
-    优先从增强语义图的 meta.resolution 获取；
-    其次取检测框的最大 x2/y2；最后尝试解析树根 bounds。
+    if data.get('changed_tiles') is not None:
+        return parse_tile_mask(data.get('changed_tiles'))
+    baseline_img = load_request_image(data, 'baseline_image')
+    if baseline_img is None or runtime_img is None:
+        return None
+    tiles = changed_tile_mask(baseline_img, runtime_img, data.get('tile_rows', 16), data.get('tile_cols', 8), data.get('phash_threshold'))
+    return parse_tile_mask(tiles)
+
+def _form_value(value):
+    """解析表单字段：能按 JSON 解析的取解析结果（true/200/[[...]]），否则保留字符串"""
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return value
+
+def _parse_part(raw, graph_only=False):
+    """解析 multipart 上传的一份数据（已解压）
+
+    列式二进制按预构建语义图解码；graph_only 时其余格式也按语义图解码，
+    否则按 JSON 原始层级数据解析（增强结构仍会被校验）。
+    """
+    if graph_only or raw[:len(GRAPH_MAGIC)] == GRAPH_MAGIC:
+        return decode_graph(raw)
+    return json.loads(raw)
+
+def read_json_body():
+    """读取 JSON/MessagePack 请求体，支持 Content-Encoding: gzip/zstd
+
+    压缩请求体按块流式解压，解压后大小受 UI_COMPARE_MAX_BODY_BYTES 限制。
+    压缩数据损坏或请求体不是对象时抛出 InvalidPayload（请求返回 400）。
+    """
+    encoding = (request.headers.get('Content-Encoding') or '').strip().lower()
+    msgpack_body = (request.mimetype or '').endswith('msgpack')
+    if encoding and encoding != 'identity':
+        raw = read_stream(request.stream, encoding, max_payload_bytes())
+    elif msgpack_body:
+        raw = request.get_data()
+    else:
+        raw = None
+    if raw is None:
+        data = request.get_json()
+    elif msgpack_body:
+        data = unpack_msgpack(raw)
+    else:
+        data = json.loads(raw)
+    if data is not None and not isinstance(data, dict):
+        raise InvalidPayload('request body must be an object')
+    return data
+
+def read_compare_payload():
+    """读取对比请求，返回 (选项 dict, 设计端数据, 运行时数据)
+
+    支持的请求形式:
+    - application/json: design_json / code_json 为对象或 JSON 字符串
+    - application/msgpack: 请求体为 MessagePack 映射，字段同 JSON 形式
+    - 以上两种均可带 Content-Encoding: gzip/zstd 压缩
+    - multipart/form-data: design_json / code_json 文件为原始层级数据（JSON），
+      design_graph / runtime_graph 文件为预构建语义图（列式二进制、MessagePack 或 JSON），
+      文件可为 gzip/zstd 压缩（按魔数识别），其余表单字段为选项
+    上传文件按块读取，每个文件解压后只解析一次；预构建语义图在此一次性完成结构校验，
+    后续直接跳过语义图构建。
     """
-    if is_enhanced_schema(obj):
-        res = obj.get("meta", {}).get("resolution")
-        if isinstance(res, list) and len(res) == 2:
-            return int(res[0]) or 1, int(res[1]) or 1
-    max_x2 = 1
-    max_y2 = 1
-    for it in raw_detections:
-        box = it.get("box")
-        if isinstance(box, (list, tuple)) and len(box) >= 4:
-            max_x2 = max(max_x2, int(box[2]))
-            max_y2 = max(max_y2, int(box[3]))
-    if max_x2 > 1 and max_y2 > 1:
-        return max_x2, max_y2
-    if isinstance(obj, dict):
-        attrs = obj.get('attributes') if isinstance(obj.get('attributes'), dict) else None
-        if attrs and isinstance(attrs.get('bounds'), str):
-            bb = parse_bounds(attrs.get('bounds'))
-            if bb:
-                return max(1, int(bb['width'])), max(1, int(bb['height']))
-    return 1, 1
+    if request.files:
+        data = {k: _form_value(v) for k, v in request.form.items()}
+        parts = []
+        limit = max_payload_bytes()
+        for key, fallback in (('design_graph', 'design_json'), ('runtime_graph', 'code_json')):
+            f = request.files.get(key)
+            if f is not None:
+                parts.append(_parse_part(read_stream(f.stream, None, limit), graph_only=True))
+                continue
+            f = request.files.get(fallback)
+            parts.append(_parse_part(read_stream(f.stream, None, limit)) if f is not None else data.get(fallback))
+    else:
+        data = read_json_body()
+        parts = [data.get('design_json'), data.get('code_json')]
+    design, code = [json.loads(p) if isinstance(p, str) else p for p in parts]
+    for obj in (design, code):
+        if is_enhanced_schema(obj):
+            validate_graph(obj)
+    return data, design, code
+
+def _run_compare(data, design_data, code_data, ticket):
+    """在准入之后执行完整对比（见 compare_designs），返回响应"""
+    timings = {'admission': ticket['waited_ms']}
+    t = time.perf_counter()
+    prune = data.get('prune', True) is not False
+    collapse = bool(data.get('collapse_wrappers'))
+    semantic_graph_runtime = build_semantic_graph(code_data, "runtime", prune, collapse)
+    design_lookup = None
+    if design_data:
+        semantic_graph_design = build_semantic_graph(design_data, "design", prune, collapse)
+    else:
+        t_lookup = time.perf_counter()
+        found, candidates = design_library.lookup(semantic_graph_runtime, int(data.get('design_candidates') or 0) or None)
+        if found is None:
+            return jsonify({'error': 'Missing design_json and no design in library'}), 400
+        design_data = found
+        design_lookup = {'design_id': candidates[0]['design_id'], 'candidates': candidates}
+        semantic_graph_design = build_semantic_graph(found, "design", prune, collapse)
+        timings['lookup'] = _elapsed_ms(t_lookup)
+    timings['build'] = _elapsed_ms(t)
+
+    design_img = load_request_image(data, 'design_image')
+    runtime_img = load_request_image(data, 'runtime_image')
+    tile_mask = resolve_tile_mask(data, runtime_img)
+    t = time.perf_counter()
+    matcher = UIFuzzyMatcher()
+    if data.get('match_mode') == 'fast':
+        matcher.config['solver'] = {'mode': 'fast', 'time_budget_ms': time_budget_ms(data)}
+    carried = []
+    if tile_mask is not None:
+        design_active, design_idle = split_by_tiles(semantic_graph_design.get('elements', []), tile_mask)
+        runtime_active, runtime_idle = split_by_tiles(semantic_graph_runtime.get('elements', []), tile_mask)
+        carried, rest_design, rest_runtime = matcher.carry_forward(design_idle, runtime_idle)
+        matching = matcher.run({'elements': design_active + rest_design}, {'elements': runtime_active + rest_runtime})
+        matching['tiles'] = {
+            'rows': int(tile_mask.shape[0]),
+            'cols': int(tile_mask.shape[1]),
+            'changed': int(tile_mask.sum()),
+            'active_design': len(design_active),
+            'active_runtime': len(runtime_active),
+            'carried': len(carried),
+            'idle_unpaired': len(rest_design) + len(rest_runtime),
+        }
+    else:
+        matching = matcher.run(semantic_graph_design, semantic_graph_runtime)
+    timings['match'] = _elapsed_ms(t)
+    t = time.perf_counter()
+    differ = UISemanticDiffer()
+    diagnostic_report = differ.analyze(matching, semantic_graph_design.get('meta'), semantic_graph_runtime.get('meta'))
+    timings['diff'] = _elapsed_ms(t)
+    if design_img is not None and runtime_img is not None:
+        t = time.perf_counter()
+        visual = UIImageDiffer().analyze(matching.get('matches', []), design_img, runtime_img)
+        diagnostic_report['issues'].extend(visual['issues'])
+        diagnostic_report['visual'] = {'checked': visual['checked'], 'issue_count': len(visual['issues'])}
+        timings['visual'] = _elapsed_ms(t)
+    matching['matches'].extend(carried)
+    diagnostic_report['report_id'] = differ.report_id(
+        matching, diagnostic_report['issues'], semantic_graph_design.get('meta'), semantic_graph_runtime.get('meta'),
+        {'design_image': _array_digest(design_img), 'runtime_image': _array_digest(runtime_img), 'tile_mask': _array_digest(tile_mask)},
+    )
+    page = extract_page_info(code_data)
+    if not page['page_path'] and not page['bundle_name']:
+        page = extract_page_info(design_data)
+    if design_lookup and not page['page_path'] and not page['bundle_name']:
+        page = {'page_path': design_lookup['candidates'][0].get('page_path'), 'bundle_name': design_lookup['candidates'][0].get('bundle_name')}
+    run_id = None
+    try:
+        run_id = history.record_report(
+            diagnostic_report, matching,
+            semantic_graph_design.get('meta'), semantic_graph_runtime.get('meta'),
+            data.get('page_path') or page['page_path'],
+            data.get('bundle_name') or page['bundle_name'],
+        )
+    except Exception:
+        pass
+    t = time.perf_counter()
+    req_id = uuid.uuid4().hex[:8]
+    folder_id = diagnostic_report.get('report_id') or req_id
+    outputs = {'dir': os.path.join(OUTPUT_ROOT, folder_id)}
+    try:
+        outputs = artifacts.write_report(
+            folder_id,
+            {'step1_design': semantic_graph_design, 'step1_runtime': semantic_graph_runtime},
+            {'step2_matching': matching, 'step3_diagnostic': diagnostic_report},
+        )
+    except Exception:
+        pass
+    timings['write'] = _elapsed_ms(t)
+    t = time.perf_counter()
+    planner = LangChainPlanner()
+    deadline = Deadline(float(data.get('planning_deadline_s') or os.getenv('PLANNER_DEADLINE_S') or 60))
+    issues = diagnostic_report.get('issues', [])
+    contexts = [build_issue_context(semantic_graph_design.get('elements', []), it.get('node_id')) for it in issues]
+    batch_group = os.getenv('PLANNER_BATCH_GROUP') or 'parent'
+    if batch_group == 'off':
+        ai_blueprints = [planner.plan(it, ctx, deadline) for it, ctx in zip(issues, contexts)]
+    else:
+        ai_blueprints = planner.plan_batch(issues, contexts, batch_group, int(os.getenv('PLANNER_BATCH_TOKENS') or 3000), deadline)
+    if not ai_blueprints:
+        ai_blueprints.append({
+            'plan_id': f"plan_{uuid.uuid4().hex[:8]}",
+            'target_file': '',
+            'confidence': 'high',
+            'action_type': 'NO_ACTION',
+            'location_hint': {},
+            'reasoning': '设计与实现一致，无需修改',
+            'parent_container_path': None,
+        })
+    timings['plan'] = _elapsed_ms(t)
+    if run_id is not None:
+        try:
+            history.record_timings(run_id, timings)
+            history.record_planner(run_id, planner.ledger.calls, planner.ledger.issues)
+        except Exception:
+            pass
+    try:
+        outputs['step4_blueprints'] = artifacts.write_file(folder_id, 'step4_blueprints', {
+            'report_id': diagnostic_report.get('report_id'),
+            'blueprints': ai_blueprints,
+            'planner': planner.ledger.summary(),
+        })
+    except Exception:
+        pass
+    artifacts.maybe_maintain()
+    metrics = {
+        'difference_count': len(matching.get('missing', [])) + len(matching.get('added', [])),
+        'match_rate': 0,
+        'total_components': semantic_graph_design.get('meta', {}).get('node_count', 0),
+        'completeness': 0,
+    }
+    comparison_result = {
+        'matches': [],
+        'unmatched_design': matching.get('missing', []),
+        'unmatched_code': matching.get('added', []),
+        'total_design_components': semantic_graph_design.get('meta', {}).get('node_count', 0),
+        'total_code_components': semantic_graph_runtime.get('meta', {}).get('node_count', 0),
+        'matched_components': len(matching.get('matches', [])),
+        'unmatched_design_count': len(matching.get('missing', [])),
+        'unmatched_code_count': len(matching.get('added', [])),
+    }
+    suggestions = []
+    
+    return jsonify({
+        'success': True,
+        'metrics': metrics,
+        'comparison_result': comparison_result,
+        'ai_suggestions': suggestions,
+        'ai_blueprints': ai_blueprints,
+        'semantic_graph_design': semantic_graph_design,
+        'semantic_graph_runtime': semantic_graph_runtime,
+        'matching': {
+            'matches': [{
+                'design_id': it['design'].get('id'),
+                'runtime_id': it['runtime'].get('id'),
+                'cost': it['cost']
+            } for it in matching.get('matches', [])],
+            'missing': [it.get('id') for it in matching.get('missing', [])],
+            'added': [it.get('id') for it in matching.get('added', [])],
+            'solver': matching.get('solver', {'mode': 'exact'}),
+            'aliases': {
+                'design': (semantic_graph_design.get('meta', {}).get('collapsed') or {}).get('aliases', {}),
+                'runtime': (semantic_graph_runtime.get('meta', {}).get('collapsed') or {}).get('aliases', {}),
+            },
+        },
+        'diagnostic_report': diagnostic_report,
+        'pruned': {
+            'design': semantic_graph_design.get('meta', {}).get('pruned'),
+            'runtime': semantic_graph_runtime.get('meta', {}).get('pruned'),
+        },
+        'design_lookup': design_lookup,
+        'admission': {'weights': ticket['weights'], 'cost': ticket['cost'], 'waited_ms': ticket['waited_ms']},
+        'timings': timings,
+        'outputs': outputs
+    })
+
+def _busy_response(e):
+    """准入被拒绝（AdmissionRejected）时的 503 响应，附 Retry-After 头"""
+    resp = jsonify({'error': str(e), 'reason': e.reason, 'retry_after_s': e.retry_after_s})
+    resp.headers['Retry-After'] = str(e.retry_after_s)
+    return resp, 503
 
 @app.route('/api/compare', methods=['POST'])
 def compare_designs():
@@ -273,6 +587,28 @@ def compare_designs():
     请求体:
     - design_json: 设计端原始/增强数据（字符串或对象）
     - code_json: 运行时原始/增强数据（字符串或对象）
+    - design_graph / runtime_graph: multipart 文件形式的预构建语义图（见 read_compare_payload）
+    - design_image / runtime_image: 可选截图（base64 或对应的 *_image_id），提供时追加像素级比较
+    - changed_tiles / baseline_image: 可选变化瓦片掩码或上一版本截图，提供时仅对变化区域内的元素匹配与比较
+    - page_path / bundle_name: 可选，写入历史库的页面标识（默认从原始树属性中读取）
+    - mode: 可选，"iou" 时仅执行基于 IoU 的快速预检查
+    - match_mode: 可选，"exact"（默认，匈牙利算法）或 "fast"（拍卖算法，配合 time_budget_ms）
+    - time_budget_ms: 可选，fast 模式下匹配阶段的时间预算（默认 200），非正数或非数值返回 400
+    - prune: 可选，默认 true；为 false 时不裁剪不可见/被遮挡节点
+    - collapse_wrappers: 可选，为 true 时合并边界相同的单子节点包装链，
+      响应 matching.aliases 给出保留节点到被合并原始节点 ID 的映射
+    - planning_deadline_s: 可选，蓝图规划阶段的截止秒数（默认读取 PLANNER_DEADLINE_S，60），
+      到期后已完成的蓝图原样返回，其余使用规则回退蓝图
+    - design_candidates: 可选，省略 design_json 时从设计稿库检索的候选数（默认 3），
+      候选逐一完整匹配后取最佳者，响应 design_lookup 给出所选设计与候选得分；
+      候选均低于最低相似度/匹配比例时视同库中无设计稿（400）
+    - admission_wait_s: 可选，最长排队秒数（不超过服务端配置），非数值或负数返回 400
+
+    准入控制:
+    - 解析请求后先估算开销（节点数、各区域匹配规模、问题数下界），按权重申请
+      cpu/llm 资源池（见 admission.AdmissionController），容量不足时排队；
+    - 队列已满或排队超时返回 503，附 Retry-After 头与 retry_after_s；
+    - 响应 admission 给出权重、开销估算与排队耗时，timings.admission 为排队毫秒数
 
     流程:
     - 规范化输入为语义图
@@ -281,157 +617,396 @@ def compare_designs():
     - 返回各阶段产物路径与汇总数据
     """
     try:
-        data = request.json
-        design_json = data.get('design_json')
-        code_json = data.get('code_json')
-        
-        if not design_json or not code_json:
+        data, design_data, code_data = read_compare_payload()
+
+        if not code_data or (not design_data and data.get('mode') == 'iou'):
             return jsonify({'error': 'Missing JSON data'}), 400
-        
-        design_data = json.loads(design_json) if isinstance(design_json, str) else design_json
-        code_data = json.loads(code_json) if isinstance(code_json, str) else code_json
 
-        design_raw = []
-        runtime_raw = []
-        if is_enhanced_schema(design_data):
-            semantic_graph_design = design_data
-        else:
-            design_raw = extract_raw_detections_from_list(design_data) if isinstance(design_data, list) else extract_raw_detections_from_tree(design_data)
-            dw, dh = infer_resolution_from_graph_or_boxes(design_data, design_raw)
-            builder_d = UISemanticBuilder(dw, dh, "design")
-            semantic_graph_design = builder_d.build(design_raw)
-        if is_enhanced_schema(code_data):
-            semantic_graph_runtime = code_data
-        else:
-            runtime_raw = extract_raw_detections_from_list(code_data) if isinstance(code_data, list) else extract_raw_detections_from_tree(code_data)
-            rw, rh = infer_resolution_from_graph_or_boxes(code_data, runtime_raw)
-            builder_r = UISemanticBuilder(rw, rh, "runtime")
-            semantic_graph_runtime = builder_r.build(runtime_raw)
+        if data.get('mode') == 'iou':
+            return jsonify(iou_compare(design_data, code_data))
 
-        matcher = UIFuzzyMatcher()
-        matching = matcher.run(semantic_graph_design, semantic_graph_runtime)
-        differ = UISemanticDiffer()
-        diagnostic_report = differ.analyze(matching, semantic_graph_design.get('meta'), semantic_graph_runtime.get('meta'))
-        req_id = uuid.uuid4().hex[:8]
-        root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-        out_root = os.path.join(root_dir, 'output')
-        os.makedirs(out_root, exist_ok=True)
-        folder_id = diagnostic_report.get('report_id') or req_id
-        out_dir = os.path.join(out_root, folder_id)
-        os.makedirs(out_dir, exist_ok=True)
-        p_step1_design = os.path.join(out_dir, 'step1_design.json')
-        p_step1_runtime = os.path.join(out_dir, 'step1_runtime.json')
-        p_step2 = os.path.join(out_dir, 'step2_matching.json')
-        p_step3 = os.path.join(out_dir, 'step3_diagnostic.json')
-        p_step4 = os.path.join(out_dir, 'step4_blueprints.json')
         try:
-            with open(p_step1_design, 'w', encoding='utf-8') as f:
-                json.dump(semantic_graph_design, f, ensure_ascii=False, indent=2)
-            with open(p_step1_runtime, 'w', encoding='utf-8') as f:
-                json.dump(semantic_graph_runtime, f, ensure_ascii=False, indent=2)
-            with open(p_step2, 'w', encoding='utf-8') as f:
-                json.dump(matching, f, ensure_ascii=False, indent=2)
-            with open(p_step3, 'w', encoding='utf-8') as f:
-                json.dump(diagnostic_report, f, ensure_ascii=False, indent=2)
-        except Exception:
-            pass
-        planner = LangChainPlanner()
-        ai_blueprints = []
-        for it in diagnostic_report.get('issues', []):
-            ctx = build_issue_context(semantic_graph_design.get('elements', []), it.get('node_id'))
-            bp = planner.plan(it, ctx)
-            ai_blueprints.append(bp)
-        if not ai_blueprints:
-            ai_blueprints.append({
-                'plan_id': f"plan_{uuid.uuid4().hex[:8]}",
-                'target_file': '',
-                'confidence': 'high',
-                'action_type': 'NO_ACTION',
-                'location_hint': {},
-                'reasoning': '设计与实现一致，无需修改',
-                'parent_container_path': None,
+            wait = parse_wait(data.get('admission_wait_s'), admission.config['max_wait_s'])
+            time_budget_ms(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        cost = estimate_cost(design_data, code_data, int(data.get('design_candidates') or 0))
+        with admission.admit(cost, wait) as ticket:
+            return _run_compare(data, design_data, code_data, ticket)
+
+    except AdmissionRejected as e:
+        return _busy_response(e)
+    except (PayloadTooLarge, RequestEntityTooLarge) as e:
+        return jsonify({'error': str(e)}), 413
+    except UnsupportedEncoding as e:
+        return jsonify({'error': str(e)}), 415
+    except (GraphValidationError, TileMaskError, ImageDecodeError, InvalidPayload, json.JSONDecodeError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/compare-matrix', methods=['POST'])
+def compare_matrix():
+    """多设备矩阵对比入口
+
+    请求体:
+    - design_json: 设计端数据（字符串或对象）
+    - devices: [{"device_id": 设备标识（不可重复，重复时返回 400）, "code_json": 运行时数据}]
+    - workers: 可选，并行度（整数，限制在 [1, CPU 核数]，非整数返回 400）
+    - admission_wait_s: 可选，最长排队秒数，同 /api/compare
+
+    设计图只规范化与预计算一次，各设备并行比较，
+    返回按设备的问题矩阵及所有设备共有的问题（不调用规划器）。
+    经准入控制执行，开销为各设备与设计图比较的估算之和；准入被拒绝时返回 503。
+    """
+    try:
+        data = read_json_body()
+        design_json = data.get('design_json')
+        devices = data.get('devices')
+        if not design_json or not isinstance(devices, list) or not devices:
+            return jsonify({'error': 'Missing design_json or devices'}), 400
+        design_data = json.loads(design_json) if isinstance(design_json, str) else design_json
+        parsed = []
+        for dev in devices:
+            code_json = dev.get('code_json') if isinstance(dev, dict) else None
+            if not code_json:
+                return jsonify({'error': 'Each device requires code_json'}), 400
+            parsed.append({
+                'device_id': dev.get('device_id'),
+                'code_json': json.loads(code_json) if isinstance(code_json, str) else code_json,
             })
+        workers = parse_workers(data.get('workers'))
+        wait = parse_wait(data.get('admission_wait_s'), admission.config['max_wait_s'])
+        cost = sum_costs(estimate_cost(design_data, dev['code_json']) for dev in parsed)
+        with admission.admit({**cost, 'est_issues': 0}, wait):
+            result = compare_device_matrix(design_data, parsed, workers)
+        return jsonify({'success': True, **result})
+    except AdmissionRejected as e:
+        return _busy_response(e)
+    except (PayloadTooLarge, RequestEntityTooLarge) as e:
+        return jsonify({'error': str(e)}), 413
+    except UnsupportedEncoding as e:
+        return jsonify({'error': str(e)}), 415
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/compare-pages', methods=['POST'])
+def compare_pages_api():
+    """多窗口/多页面对比入口
+
+    请求体与 /api/compare 相同（design_json/code_json，支持压缩与 multipart），另可指定:
+    - workers: 可选，并行度（整数，限制在 [1, CPU 核数]，非整数返回 400）
+    - prune / collapse_wrappers / admission_wait_s: 同 /api/compare
+
+    两侧转储按 hostWindowId 拆分为窗口分区，按页面路径/包名配对后并行比较，
+    返回按分区的问题列表与未配对的分区（不调用规划器）。
+    经准入控制执行，开销按两侧整份转储估算；准入被拒绝时返回 503。
+    """
+    try:
+        data, design_data, code_data = read_compare_payload()
+        if not design_data or not code_data:
+            return jsonify({'error': 'Missing JSON data'}), 400
         try:
-            with open(p_step4, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'report_id': diagnostic_report.get('report_id'),
-                    'blueprints': ai_blueprints
-                }, f, ensure_ascii=False, indent=2)
-        except Exception:
-            pass
-        metrics = {
-            'difference_count': len(matching.get('missing', [])) + len(matching.get('added', [])),
-            'match_rate': 0,
-            'total_components': semantic_graph_design.get('meta', {}).get('node_count', 0),
-            'completeness': 0,
-        }
-        comparison_result = {
-            'matches': [],
-            'unmatched_design': matching.get('missing', []),
-            'unmatched_code': matching.get('added', []),
-            'total_design_components': semantic_graph_design.get('meta', {}).get('node_count', 0),
-            'total_code_components': semantic_graph_runtime.get('meta', {}).get('node_count', 0),
-            'matched_components': len(matching.get('matches', [])),
-            'unmatched_design_count': len(matching.get('missing', [])),
-            'unmatched_code_count': len(matching.get('added', [])),
-        }
-        suggestions = []
-        
-        return jsonify({
-            'success': True,
-            'metrics': metrics,
-            'comparison_result': comparison_result,
-            'ai_suggestions': suggestions,
-            'ai_blueprints': ai_blueprints,
-            'semantic_graph_design': semantic_graph_design,
-            'semantic_graph_runtime': semantic_graph_runtime,
-            'matching': {
-                'matches': [{
-                    'design_id': it['design'].get('id'),
-                    'runtime_id': it['runtime'].get('id'),
-                    'cost': it['cost']
-                } for it in matching.get('matches', [])],
-                'missing': [it.get('id') for it in matching.get('missing', [])],
-                'added': [it.get('id') for it in matching.get('added', [])]
-            },
-            'diagnostic_report': diagnostic_report,
-            'outputs': {
-                'dir': out_dir,
-                'step1_design': p_step1_design,
-                'step1_runtime': p_step1_runtime,
-                'step2_matching': p_step2,
-                'step3_diagnostic': p_step3,
-                'step4_blueprints': p_step4
-            }
-        })
+            wait = parse_wait(data.get('admission_wait_s'), admission.config['max_wait_s'])
+            workers = parse_workers(data.get('workers'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        with admission.admit({**estimate_cost(design_data, code_data), 'est_issues': 0}, wait):
+            result = compare_pages(
+                design_data,
+                code_data,
+                workers,
+                data.get('prune', True) is not False,
+                bool(data.get('collapse_wrappers')),
+            )
+        return jsonify({'success': True, **result})
+    except AdmissionRejected as e:
+        return _busy_response(e)
+    except (PayloadTooLarge, RequestEntityTooLarge) as e:
+        return jsonify({'error': str(e)}), 413
+    except UnsupportedEncoding as e:
+        return jsonify({'error': str(e)}), 415
+    except (GraphValidationError, InvalidPayload, json.JSONDecodeError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/library/designs', methods=['GET', 'POST'])
+def library_designs():
+    """设计稿库
+
+    - GET: 列出已注册的设计稿
+    - POST: 注册设计稿，请求体 design_json（必填）、name / page_path / bundle_name（可选），
+      返回条目元数据；相同内容重复注册返回既有条目
+    """
+    try:
+        if request.method == 'GET':
+            return jsonify({'success': True, 'designs': design_library.entries()})
+        data = read_json_body() or {}
+        design_json = data.get('design_json')
+        if not design_json:
+            return jsonify({'error': 'Missing design_json'}), 400
+        design_data = json.loads(design_json) if isinstance(design_json, str) else design_json
+        if is_enhanced_schema(design_data):
+            validate_graph(design_data)
+        entry = design_library.register(design_data, data.get('name'), data.get('page_path'), data.get('bundle_name'))
+        return jsonify({'success': True, 'design': entry})
+    except (PayloadTooLarge, RequestEntityTooLarge) as e:
+        return jsonify({'error': str(e)}), 413
+    except UnsupportedEncoding as e:
+        return jsonify({'error': str(e)}), 415
+    except (GraphValidationError, InvalidPayload, json.JSONDecodeError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/library/search', methods=['POST'])
+def library_search():
+    """按运行时数据检索设计稿库
+
+    请求体:
+    - code_json: 运行时数据
+    - k: 可选，返回候选数（默认 5）
+    - admission_wait_s: 可选，最长排队秒数，同 /api/compare
+
+    仅按布局签名排序，不执行完整匹配。经准入控制执行，开销只计运行时语义图的构建
+    （与运行时节点数成正比）；准入被拒绝时返回 503。
+    """
+    try:
+        data = read_json_body() or {}
+        code_json = data.get('code_json')
+        if not code_json:
+            return jsonify({'error': 'Missing code_json'}), 400
+        code_data = json.loads(code_json) if isinstance(code_json, str) else code_json
+        try:
+            wait = parse_wait(data.get('admission_wait_s'), admission.config['max_wait_s'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        prune = data.get('prune', True) is not False
+        nodes = estimate_cost(None, code_data)['runtime_nodes']
+        with admission.admit({'design_nodes': 0, 'runtime_nodes': nodes, 'cells': nodes, 'est_issues': 0}, wait):
+            runtime_graph = build_semantic_graph(code_data, "runtime", prune)
+            candidates = design_library.search(runtime_graph, int(data.get('k') or 5))
+        return jsonify({'success': True, 'candidates': candidates})
+    except AdmissionRejected as e:
+        return _busy_response(e)
+    except (PayloadTooLarge, RequestEntityTooLarge) as e:
+        return jsonify({'error': str(e)}), 413
+    except UnsupportedEncoding as e:
+        return jsonify({'error': str(e)}), 415
+    except (GraphValidationError, InvalidPayload, json.JSONDecodeError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _history_filters():
+    """读取历史查询的公共参数"""
+    return request.args.get('page_path') or None, request.args.get('bundle_name') or None
+
+@app.route('/api/history/trend', methods=['GET'])
+def history_trend():
+    """历史趋势查询
+
+    参数（query string）:
+    - page_path / bundle_name: 可选筛选条件
+    - limit: 最近的运行次数（默认 200）
+    """
+    try:
+        page_path, bundle_name = _history_filters()
+        limit = int(request.args.get('limit') or 200)
+        return jsonify({'success': True, 'runs': history.trend(page_path, bundle_name, limit)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/top-issues', methods=['GET'])
+def history_top_issues():
+    """高频问题查询
+
+    参数（query string）:
+    - page_path / bundle_name: 可选筛选条件
+    - runs: 统计的最近运行次数（默认 200）
+    - limit: 返回条数（默认 20）
+    - group_by: 逗号分隔的分组字段，可选 type/widget_role/node/severity
+    """
+    try:
+        page_path, bundle_name = _history_filters()
+        runs = int(request.args.get('runs') or 200)
+        limit = int(request.args.get('limit') or 20)
+        group_by = tuple(g.strip() for g in (request.args.get('group_by') or 'type,widget_role').split(',') if g.strip())
+        return jsonify({'success': True, 'issues': history.top_issues(page_path, bundle_name, runs, limit, group_by)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/planner', methods=['GET'])
+def history_planner():
+    """规划阶段统计
+
+    参数（query string）:
+    - since: 可选，起始时间戳（秒）
+    - group_by: 逗号分隔的调用分组字段，可选 kind/outcome/model/issue_types（默认 kind,outcome）
+
+    返回按分组的调用次数、耗时分位数与 token 合计，以及按问题类型的回退率。
+    """
+    try:
+        since = request.args.get('since')
+        group_by = tuple(g.strip() for g in (request.args.get('group_by') or 'kind,outcome').split(',') if g.strip())
+        return jsonify({'success': True, **history.planner_stats(float(since) if since else None, group_by)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _viewport_index(report_id, source):
+    """读取（或从缓存取得）报告一侧的视口索引，报告不存在时返回 None
+
+    缓存条目记录构建时 manifest 的 created_at 与 blob 摘要，每次取用前与当前 manifest 比对，
+    报告被同名重写或删除后不会再返回旧索引（归档不改变 manifest，缓存继续有效）。
+    """
+    key = (report_id, source)
+    manifest = artifacts.manifest(report_id)
+    version = (manifest.get('created_at'), tuple(sorted((manifest.get('blobs') or {}).items()))) if manifest else None
+    with _viewport_lock:
+        cached = _viewport_cache.get(key)
+        if cached is not None and version is not None and cached[0] == version:
+            _viewport_cache.move_to_end(key)
+            return cached[1]
+        _viewport_cache.pop(key, None)
+    graph = artifacts.load(report_id, f'step1_{source}')
+    if graph is None:
+        return None
+    diagnostic = artifacts.load(report_id, 'step3_diagnostic') or {}
+    matching = artifacts.load(report_id, 'step2_matching') if source == 'runtime' else None
+    index = ViewportIndex(graph, diagnostic.get('issues'), matching, source)
+    if version is not None:
+        with _viewport_lock:
+            _viewport_cache[key] = (version, index)
+            while len(_viewport_cache) > VIEWPORT_CACHE_SIZE:
+                _viewport_cache.popitem(last=False)
+    return index
 
+@app.route('/api/reports/<report_id>/viewport', methods=['GET'])
+def report_viewport(report_id):
+    """按视口查询报告中的元素框
+
+    参数（query string）:
+    - source: "design"（默认）或 "runtime"
+    - x1 / y1 / x2 / y2: 可选，视口范围（页面像素坐标），默认整页
+    - scale: 屏幕像素 / 页面像素（默认 1）
+    - limit: 可选，逐个返回的元素上限
+
+    只返回视口内在当前缩放下可辨识的元素框，过小的元素与远景子区域
+    聚合为 clusters，视口内的问题标记全部返回；响应大小与页面元素总数基本无关。
+    """
+    try:
+        source = request.args.get('source') or 'design'
+        if source not in ('design', 'runtime'):
+            return jsonify({'error': 'source must be design or runtime'}), 400
+        index = _viewport_index(report_id, source)
+        if index is None:
+            return jsonify({'error': 'Report not found'}), 404
+        coords = [request.args.get(k) for k in ('x1', 'y1', 'x2', 'y2')]
+        rect = [float(v) for v in coords] if all(v not in (None, '') for v in coords) else None
+        limit = request.args.get('limit')
+        result = index.query(rect, float(request.args.get('scale') or 1.0), int(limit) if limit else None)
+        return jsonify({'success': True, 'report_id': report_id, **result})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admission', methods=['GET'])
+def admission_status():
+    """准入控制状态：资源池占用、队列深度、等待耗时分位数、准入/拒绝计数与当前重试建议"""
+    return jsonify({'success': True, **admission.snapshot()})
+
+@app.route('/api/maintenance/retention', methods=['POST'])
+def run_retention():
+    """立即执行一次产物维护（归档、按预算清理与 blob 回收），返回处理摘要"""
+    try:
+        return jsonify({'success': True, **artifacts.maintain()})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/upload-image', methods=['POST'])
 def upload_image():
-    """图片上传示例接口（当前未处理图像）"""
+    """截图上传接口
+
+    校验图片可解码后保存为 output/uploads/<image_id>.img，返回 image_id，
+    可在 /api/compare 中通过 design_image_id / runtime_image_id 引用；
+    上传截图由产物维护任务按 UI_COMPARE_UPLOAD_TTL_HOURS 过期清理。
+    """
     try:
         if 'image' not in request.files:
             return jsonify({'error': 'No image file provided'}), 400
         
         image_file = request.files['image']
-        # For now, just return success without processing
-        # In a real implementation, you'd process the image here
+        content = image_file.read()
+        img = decode_image(content)
+        if img is None:
+            return jsonify({'error': 'Invalid image file'}), 400
+        image_id = uuid.uuid4().hex
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        with open(_upload_path(image_id), 'wb') as f:
+            f.write(content)
         
         return jsonify({
             'success': True,
             'message': 'Image uploaded successfully',
-            'filename': image_file.filename
+            'filename': image_file.filename,
+            'image_id': image_id,
+            'width': int(img.shape[1]),
+            'height': int(img.shape[0])
         })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/tile-diff', methods=['POST'])
+def tile_diff():
+    """截图分块变化检测接口
+
+    请求（multipart 或 JSON）:
+    - baseline_image / runtime_image: 两张截图（文件、base64 或 *_id）
+    - rows / cols: 网格尺寸（默认 16×8）
+    - phash_threshold: 可选，感知哈希容差
+    返回变化瓦片掩码，可直接作为 /api/compare 的 changed_tiles 传入。
+    """
+    try:
+        if request.files:
+            data = request.form.to_dict()
+            imgs = {}
+            for key in ('baseline_image', 'runtime_image'):
+                f = request.files.get(key)
+                imgs[key] = decode_image(f.read()) if f else load_request_image(data, key)
+        else:
+            data = request.json or {}
+            imgs = {key: load_request_image(data, key) for key in ('baseline_image', 'runtime_image')}
+        if imgs['baseline_image'] is None or imgs['runtime_image'] is None:
+            return jsonify({'error': 'Two decodable images are required'}), 400
+        thr = data.get('phash_threshold')
+        tiles = changed_tile_mask(
+            imgs['baseline_image'], imgs['runtime_image'],
+            int(data.get('rows') or 16), int(data.get('cols') or 8),
+            int(thr) if thr not in (None, '') else None,
+        )
+        return jsonify({'success': True, **tiles})
+    except ImageDecodeError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
     return jsonify({'status': 'healthy'})
 
+def start_worker_pool():
+    """应用启动时预热进程级共享的进程池（大小见 parallel_match.pool_size，大于 1 时），进程退出时关闭"""
+    if pool_size() > 1:
+        get_pool()
+
+atexit.register(shutdown_pool)
+
 if __name__ == '__main__':
+    start_worker_pool()
     app.run(debug=True, host='0.0.0.0', port=5050)
@@ -0,0 +1,366 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import threading
+import time
+
+RESERVED_DIRS = {"uploads", "blobs", "archive", "library"}
+
+
+def _env_float(name, default):
+    """读取数值型环境变量，非法时返回默认值"""
+    try:
+        return float(os.getenv(name) or default)
+    except ValueError:
+        return float(default)
+
+def _dir_size(path):
+    """统计目录下全部文件的字节数"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ArtifactStore:
+    """对比产物存储
+
+    - 每次对比的产物写入 output/<report_id>/，语义图以内容寻址方式
+      存入 output/blobs/（gzip 压缩，相同内容只存一份），报告目录中的
+      manifest.json 记录引用关系；
+    - 后台维护任务按时间将旧报告压缩归档到 output/archive/，
+      并按保留天数、报告数量与总字节数预算清理，最后回收无引用的 blob；
+      output/uploads/ 中的上传截图超过 upload_ttl_hours 后删除。
+    """
+    def __init__(self, root, config=None):
+        """初始化产物存储
+
+        参数:
+        - root: 输出根目录
+        - config: 可选，保留策略配置；默认读取环境变量
+        """
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.archive_dir = os.path.join(root, "archive")
+        self.config = config or {
+            "max_age_days": _env_float("UI_COMPARE_RETENTION_DAYS", 30),
+            "max_reports": int(_env_float("UI_COMPARE_MAX_REPORTS", 500)),
+            "max_bytes": int(_env_float("UI_COMPARE_MAX_BYTES", 2 * 1024 ** 3)),
+            "compact_after_hours": _env_float("UI_COMPARE_COMPACT_AFTER_HOURS", 24),
+            "maintain_interval_s": _env_float("UI_COMPARE_MAINTAIN_INTERVAL_S", 600),
+            "upload_ttl_hours": _env_float("UI_COMPARE_UPLOAD_TTL_HOURS", 24),
+            "blob_grace_s": 3600,
+        }
+        self._lock = threading.Lock()
+        self._manifest_lock = threading.Lock()
+        self._last_maintain = 0.0
+
+    def _blob_path(self, digest):
+        """返回 blob 的存储路径"""
+        return os.path.join(self.blob_dir, digest[:2], f"{digest}.json.gz")
+
+    def put_blob(self, obj):
+        """以内容寻址方式写入 JSON 对象，已存在时直接复用
+
+        返回:
+        - tuple: (sha256 摘要, 文件路径)
+        """
+        data = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if os.path.exists(path):
+            os.utime(path, None)
+            return digest, path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, "wb", compresslevel=6) as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return digest, path
+
+    def get_blob(self, digest):
+        """读取 blob 内容，不存在时返回 None"""
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rb") as f:
+            return json.loads(f.read().decode("utf-8"))
+
+    def _write_json(self, path, obj, **kwargs):
+        """原子写入 JSON 文件（临时文件 + os.replace），并发写同一路径不会读到半截内容"""
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False, **kwargs)
+        os.replace(tmp, path)
+
+    def write_report(self, report_id, blobs, files):
+        """写入一次对比的产物
+
+        参数:
+        - report_id: 报告 ID（目录名）
+        - blobs: {名称: 对象}，以内容寻址方式存储并在 manifest 中引用
+        - files: {名称: 对象}，直接写入报告目录的 <名称>.json
+
+        返回:
+        - dict: 名称 -> 文件路径（含 dir 与 manifest）
+        """
+        out_dir = os.path.join(self.root, report_id)
+        os.makedirs(out_dir, exist_ok=True)
+        paths = {"dir": out_dir}
+        manifest = {"report_id": report_id, "created_at": time.time(), "blobs": {}, "files": []}
+        for name, obj in blobs.items():
+            digest, path = self.put_blob(obj)
+            manifest["blobs"][name] = digest
+            paths[name] = path
+        for name, obj in files.items():
+            path = os.path.join(out_dir, f"{name}.json")
+            self._write_json(path, obj, separators=(",", ":"))
+            manifest["files"].append(name)
+            paths[name] = path
+        p_manifest = os.path.join(out_dir, "manifest.json")
+        self._write_json(p_manifest, manifest)
+        paths["manifest"] = p_manifest
+        return paths
+
+    def write_file(self, report_id, name, obj):
+        """向已有报告追加一个产物文件并更新 manifest，返回文件路径"""
+        out_dir = os.path.join(self.root, report_id)
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f"{name}.json")
+        self._write_json(path, obj, separators=(",", ":"))
+        p_manifest = os.path.join(out_dir, "manifest.json")
+        with self._manifest_lock:
+            try:
+                with open(p_manifest, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = {"report_id": report_id, "created_at": time.time(), "blobs": {}, "files": []}
+            if name not in manifest["files"]:
+                manifest["files"].append(name)
+            self._write_json(p_manifest, manifest)
+        return path
+
+    def _valid_report_id(self, report_id):
+        """report_id 是否为合法的报告目录名（拒绝路径穿越与保留目录）"""
+        return bool(report_id) and os.path.basename(report_id) == report_id and not report_id.startswith(".") and report_id not in RESERVED_DIRS
+
+    def manifest(self, report_id):
+        """读取报告的 manifest（报告目录中的或归档旁的副本），报告不存在时返回 None
+
+        manifest 的 created_at 与 blob 摘要在每次 write_report 时更新，可用作报告内容的版本。
+        """
+        if not self._valid_report_id(report_id):
+            return None
+        for path in (os.path.join(self.root, report_id, "manifest.json"),
+                     os.path.join(self.archive_dir, f"{report_id}.manifest.json")):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                continue
+        return None
+
+    def load(self, report_id, name):
+        """读取报告中的一个产物（manifest 引用的 blob 或报告目录中的文件）
+
+        已压缩归档的报告从归档中读取；报告或产物不存在时返回 None。
+        """
+        if not self._valid_report_id(report_id):
+            return None
+        out_dir = os.path.join(self.root, report_id)
+        archive = os.path.join(self.archive_dir, f"{report_id}.tar.gz")
+        if os.path.isdir(out_dir):
+            def read(member):
+                path = os.path.join(out_dir, member)
+                if not os.path.exists(path):
+                    return None
+                with open(path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        elif os.path.exists(archive):
+            def read(member):
+                with tarfile.open(archive, "r:gz") as tar:
+                    try:
+                        f = tar.extractfile(f"{report_id}/{member}")
+                    except KeyError:
+                        return None
+                    return json.loads(f.read().decode("utf-8")) if f is not None else None
+        else:
+            return None
+        manifest = read("manifest.json") or {}
+        digest = (manifest.get("blobs") or {}).get(name)
+        if digest:
+            return self.get_blob(digest)
+        return read(f"{name}.json")
+
+    def _reports(self):
+        """列出现存报告（目录与归档），按时间升序
+
+        返回:
+        - list[dict]: {id, kind(dir|archive), path, mtime, size}
+        """
+        out = []
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                path = os.path.join(self.root, name)
+                if name in RESERVED_DIRS or not os.path.isdir(path):
+                    continue
+                if not (os.path.exists(os.path.join(path, "manifest.json")) or os.path.exists(os.path.join(path, "step3_diagnostic.json"))):
+                    continue
+                out.append({"id": name, "kind": "dir", "path": path, "mtime": os.path.getmtime(path), "size": _dir_size(path)})
+        if os.path.isdir(self.archive_dir):
+            for name in os.listdir(self.archive_dir):
+                if not name.endswith(".tar.gz"):
+                    continue
+                path = os.path.join(self.archive_dir, name)
+                out.append({"id": name[:-len(".tar.gz")], "kind": "archive", "path": path, "mtime": os.path.getmtime(path), "size": os.path.getsize(path)})
+        out.sort(key=lambda r: r["mtime"])
+        return out
+
+    def _remove(self, rep):
+        """删除一份报告（目录或归档及其 manifest 副本）"""
+        if rep["kind"] == "dir":
+            shutil.rmtree(rep["path"], ignore_errors=True)
+        else:
+            for p in (rep["path"], os.path.join(self.archive_dir, f"{rep['id']}.manifest.json")):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+
+    def compact(self, rep):
+        """将报告目录压缩为归档，manifest 另存一份用于 blob 引用计数"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        target = os.path.join(self.archive_dir, f"{rep['id']}.tar.gz")
+        tmp = target + ".tmp"
+        with tarfile.open(tmp, "w:gz") as tar:
+            tar.add(rep["path"], arcname=rep["id"])
+        manifest = os.path.join(rep["path"], "manifest.json")
+        if os.path.exists(manifest):
+            shutil.copyfile(manifest, os.path.join(self.archive_dir, f"{rep['id']}.manifest.json"))
+        os.replace(tmp, target)
+        os.utime(target, (rep["mtime"], rep["mtime"]))
+        shutil.rmtree(rep["path"], ignore_errors=True)
+
+    def _referenced_blobs(self):
+        """收集所有 manifest（报告目录与归档）引用的 blob 摘要"""
+        refs = set()
+        manifests = []
+        for rep in self._reports():
+            if rep["kind"] == "dir":
+                manifests.append(os.path.join(rep["path"], "manifest.json"))
+            else:
+                manifests.append(os.path.join(self.archive_dir, f"{rep['id']}.manifest.json"))
+        for p in manifests:
+            try:
+                with open(p, "r", encoding="utf-8") as f:
+                    refs.update((json.load(f).get("blobs") or {}).values())
+            except (OSError, ValueError):
+                pass
+        return refs
+
+    def _collect_blobs(self, now):
+        """删除无引用且超过宽限期的 blob，返回删除数量"""
+        if not os.path.isdir(self.blob_dir):
+            return 0
+        refs = self._referenced_blobs()
+        removed = 0
+        grace = float(self.config["blob_grace_s"])
+        for root, _, files in os.walk(self.blob_dir):
+            for name in files:
+                digest = name.split(".", 1)[0]
+                path = os.path.join(root, name)
+                if digest in refs:
+                    continue
+                try:
+                    if now - os.path.getmtime(path) > grace:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def _expire_uploads(self, before):
+        """删除修改时间早于 before 的上传截图，返回删除数量"""
+        upload_dir = os.path.join(self.root, "uploads")
+        removed = 0
+        try:
+            names = os.listdir(upload_dir)
+        except OSError:
+            return 0
+        for name in names:
+            path = os.path.join(upload_dir, name)
+            try:
+                if os.path.isfile(path) and os.path.getmtime(path) < before:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def maintain(self, now=None):
+        """执行一次完整维护：压缩旧报告、按预算清理、回收 blob、过期上传截图
+
+        返回:
+        - dict: 各步骤处理数量与剩余占用
+        """
+        now = now or time.time()
+        summary = {"compacted": 0, "expired": 0, "over_count": 0, "over_size": 0, "blobs_removed": 0, "uploads_removed": 0}
+        with self._lock:
+            compact_before = now - float(self.config["compact_after_hours"]) * 3600
+            for rep in self._reports():
+                if rep["kind"] == "dir" and rep["mtime"] < compact_before:
+                    self.compact(rep)
+                    summary["compacted"] += 1
+            reports = self._reports()
+            expire_before = now - float(self.config["max_age_days"]) * 86400
+            keep = []
+            for rep in reports:
+                if rep["mtime"] < expire_before:
+                    self._remove(rep)
+                    summary["expired"] += 1
+                else:
+                    keep.append(rep)
+            max_reports = int(self.config["max_reports"])
+            while len(keep) > max_reports:
+                self._remove(keep.pop(0))
+                summary["over_count"] += 1
+            summary["blobs_removed"] += self._collect_blobs(now)
+            max_bytes = int(self.config["max_bytes"])
+            total = sum(r["size"] for r in keep) + _dir_size(self.blob_dir)
+            while keep and total > max_bytes:
+                rep = keep.pop(0)
+                self._remove(rep)
+                total -= rep["size"]
+                summary["over_size"] += 1
+            if summary["over_size"]:
+                summary["blobs_removed"] += self._collect_blobs(now)
+                total = sum(r["size"] for r in keep) + _dir_size(self.blob_dir)
+            summary["uploads_removed"] = self._expire_uploads(now - float(self.config.get("upload_ttl_hours", 24)) * 3600)
+            summary["reports"] = len(keep)
+            summary["bytes"] = total
+            self._last_maintain = now
+        return summary
+
+    def maybe_maintain(self):
+        """距上次维护超过间隔时，在后台线程中执行维护（不阻塞请求）"""
+        if time.time() - self._last_maintain < float(self.config["maintain_interval_s"]):
+            return False
+        if self._lock.locked():
+            return False
+        self._last_maintain = time.time()
+        threading.Thread(target=self._maintain_quietly, daemon=True).start()
+        return True
+
+    def _maintain_quietly(self):
+        """后台维护入口，吞掉异常避免影响服务"""
+        try:
+            self.maintain()
+        except Exception:
+            pass
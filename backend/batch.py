@@ -0,0 +1,223 @@
+"""离线批量对比
+
+在目录树中发现设计/运行时数据对，使用进程池并行完成
+抽取、语义图构建、匹配与差异分析，结果逐行写入 JSON Lines 文件。
+不依赖 Flask，可直接用于夜间任务：
+
+    python batch.py <根目录> --out results.jsonl [--workers N] [--resume]
+
+数据对按文件名后缀识别：同一目录下 <前缀>design.json 与 <前缀>runtime.json
+（后缀可通过参数修改），例如 home_design.json / home_runtime.json，
+或某目录下的 design.json / runtime.json。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from differ import UISemanticDiffer
+from extractor import extract_page_info
+from matcher import UIFuzzyMatcher
+from pipeline import build_semantic_graph
+
+
+def discover_pairs(root, design_suffix="design.json", runtime_suffix="runtime.json"):
+    """在目录树中发现设计/运行时数据对
+
+    返回:
+    - list[dict]: {pair, design, runtime}，pair 为相对根目录、去掉后缀的标识，按 pair 排序
+    """
+    pairs = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        names = set(filenames)
+        for name in filenames:
+            if not name.endswith(design_suffix):
+                continue
+            prefix = name[:-len(design_suffix)]
+            other = prefix + runtime_suffix
+            if other not in names:
+                continue
+            rel = os.path.relpath(os.path.join(dirpath, prefix), root)
+            pair = rel.rstrip("_-. ") if prefix else os.path.relpath(dirpath, root)
+            pairs.append({
+                "pair": pair.replace(os.sep, "/"),
+                "design": os.path.join(dirpath, name),
+                "runtime": os.path.join(dirpath, other),
+            })
+    pairs.sort(key=lambda p: p["pair"])
+    return pairs
+
+def load_done(out_path, retry_errors=False):
+    """读取已有结果文件中已完成的数据对（用于断点续跑）
+
+    无法解析的行（例如中断时写了一半的末行）会被忽略。
+    """
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(rec, dict) and rec.get("pair") and (rec.get("ok") or not retry_errors):
+                done.add(rec["pair"])
+    return done
+
+def compare_pair(item, options=None):
+    """比较一个数据对，返回结果记录（异常时记录错误而不抛出）
+
+    参数:
+    - item: discover_pairs 返回的一项
+    - options: 可选，{"prune": bool, "collapse": bool, "include_issues": bool}
+    """
+    options = options or {}
+    t = time.perf_counter()
+    rec = {"pair": item["pair"], "design": item["design"], "runtime": item["runtime"]}
+    try:
+        with open(item["design"], "r", encoding="utf-8") as f:
+            design_data = json.load(f)
+        with open(item["runtime"], "r", encoding="utf-8") as f:
+            runtime_data = json.load(f)
+        prune = options.get("prune", True)
+        collapse = options.get("collapse", False)
+        design_graph = build_semantic_graph(design_data, "design", prune, collapse)
+        runtime_graph = build_semantic_graph(runtime_data, "runtime", prune, collapse)
+        matching = UIFuzzyMatcher().run(design_graph, runtime_graph)
+        report = UISemanticDiffer().analyze(matching, design_graph.get("meta"), runtime_graph.get("meta"))
+        page = extract_page_info(runtime_data)
+        if not page["page_path"] and not page["bundle_name"]:
+            page = extract_page_info(design_data)
+        issues = report.get("issues", [])
+        severities = {}
+        for it in issues:
+            severities[it.get("severity")] = severities.get(it.get("severity"), 0) + 1
+        rec.update({
+            "ok": True,
+            "report_id": report.get("report_id"),
+            "page_path": page["page_path"],
+            "bundle_name": page["bundle_name"],
+            "design_nodes": design_graph.get("meta", {}).get("node_count", 0),
+            "runtime_nodes": runtime_graph.get("meta", {}).get("node_count", 0),
+            "matched": len(matching.get("matches", [])),
+            "missing": len(matching.get("missing", [])),
+            "added": len(matching.get("added", [])),
+            "issue_count": len(issues),
+            "severity": severities,
+        })
+        if options.get("include_issues", True):
+            rec["issues"] = issues
+    except Exception as e:
+        rec.update({"ok": False, "error": f"{type(e).__name__}: {e}"})
+    rec["duration_ms"] = round((time.perf_counter() - t) * 1000.0, 2)
+    return rec
+
+def _progress(done, total, rec, started, stream):
+    """输出单行进度（完成数、速率、预计剩余时间）"""
+    elapsed = max(time.time() - started, 1e-6)
+    rate = done / elapsed
+    eta = (total - done) / rate if rate > 0 else 0.0
+    status = "ok" if rec.get("ok") else "ERROR"
+    stream.write(f"[{done}/{total}] {rec['pair']} {status} {rec['duration_ms']:.0f}ms  {rate:.1f}/s  eta {eta:.0f}s\n")
+    stream.flush()
+
+def run_batch(pairs, out_path, workers=None, options=None, progress=sys.stderr):
+    """并行比较全部数据对并追加写入 JSON Lines
+
+    结果按完成顺序逐行写入并立即刷新，中断后可通过 load_done 续跑；
+    在途任务数不超过 workers 的 4 倍，避免一次性提交全部任务。
+    工作进程崩溃（BrokenProcessPool）等任务级异常记为对应数据对失败，
+    进程池损坏时重建后继续处理其余数据对，不中止整批任务。
+
+    返回:
+    - dict: {total, ok, failed}
+    """
+    workers = workers or os.cpu_count() or 1
+    summary = {"total": len(pairs), "ok": 0, "failed": 0}
+    started = time.time()
+    parent = os.path.dirname(os.path.abspath(out_path))
+    os.makedirs(parent, exist_ok=True)
+    if os.path.exists(out_path) and os.path.getsize(out_path) > 0:
+        with open(out_path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    with open(out_path, "a", encoding="utf-8") as out:
+        def emit(rec):
+            out.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+            out.flush()
+            summary["ok" if rec.get("ok") else "failed"] += 1
+            if progress is not None:
+                _progress(summary["ok"] + summary["failed"], summary["total"], rec, started, progress)
+
+        if workers <= 1:
+            for item in pairs:
+                emit(compare_pair(item, options))
+            return summary
+        pending = iter(pairs)
+        in_flight = {}
+        pool = {"ex": ProcessPoolExecutor(max_workers=workers)}
+
+        def submit(item):
+            try:
+                in_flight[pool["ex"].submit(compare_pair, item, options)] = item
+            except BrokenProcessPool:
+                pool["ex"].shutdown(wait=False)
+                pool["ex"] = ProcessPoolExecutor(max_workers=workers)
+                in_flight[pool["ex"].submit(compare_pair, item, options)] = item
+
+        try:
+            for item in pending:
+                submit(item)
+                if len(in_flight) >= workers * 4:
+                    break
+            while in_flight:
+                finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for f in finished:
+                    item = in_flight.pop(f)
+                    try:
+                        rec = f.result()
+                    except Exception as e:
+                        rec = {"pair": item["pair"], "design": item["design"], "runtime": item["runtime"],
+                               "ok": False, "error": f"{type(e).__name__}: {e}", "duration_ms": 0.0}
+                    emit(rec)
+                    nxt = next(pending, None)
+                    if nxt is not None:
+                        submit(nxt)
+        finally:
+            pool["ex"].shutdown()
+    return summary
+
+def main(argv=None):
+    """命令行入口，返回进程退出码（存在失败的数据对时为 1）"""
+    parser = argparse.ArgumentParser(description="Batch design/runtime comparison without the HTTP server")
+    parser.add_argument("root", help="directory tree containing dump pairs")
+    parser.add_argument("--out", required=True, help="JSON Lines output file (overwritten; appended with --resume)")
+    parser.add_argument("--workers", type=int, default=None, help="process count (default: CPU count)")
+    parser.add_argument("--design-suffix", default="design.json")
+    parser.add_argument("--runtime-suffix", default="runtime.json")
+    parser.add_argument("--resume", action="store_true", help="skip pairs already present in --out")
+    parser.add_argument("--retry-errors", action="store_true", help="with --resume, rerun pairs that failed before")
+    parser.add_argument("--no-prune", action="store_true", help="keep invisible/occluded nodes")
+    parser.add_argument("--collapse-wrappers", action="store_true", help="merge same-bounds wrapper chains")
+    parser.add_argument("--summary-only", action="store_true", help="omit per-issue details from the output")
+    parser.add_argument("--quiet", action="store_true", help="no progress output")
+    args = parser.parse_args(argv)
+    pairs = discover_pairs(args.root, args.design_suffix, args.runtime_suffix)
+    if args.resume:
+        done = load_done(args.out, args.retry_errors)
+        pairs = [p for p in pairs if p["pair"] not in done]
+    elif os.path.exists(args.out):
+        os.remove(args.out)
+    options = {"prune": not args.no_prune, "collapse": args.collapse_wrappers, "include_issues": not args.summary_only}
+    summary = run_batch(pairs, args.out, args.workers, options, None if args.quiet else sys.stderr)
+    sys.stderr.write(json.dumps(summary) + "\n")
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台：仅有进程内互斥，注册须由单一进程完成
+    fcntl = None
+
+from extractor import extract_page_info, is_enhanced_schema
+from matcher import UIFuzzyMatcher
+from pipeline import build_semantic_graph
+
+TYPE_BINS = 32
+GRID = 8
+TEXT_BINS = 64
+SIGNATURE_DIM = TYPE_BINS + GRID * GRID + TEXT_BINS
+
+
+def _env_float(name, default):
+    """读取数值型环境变量，非法时返回默认值"""
+    try:
+        return float(os.getenv(name) or default)
+    except ValueError:
+        return float(default)
+
+def _bucket(token, bins):
+    """将字符串稳定地散列到 [0, bins)"""
+    return zlib.crc32(token.encode("utf-8")) % bins
+
+def _unit(vec):
+    """L2 归一化，零向量原样返回"""
+    n = float(np.linalg.norm(vec))
+    return vec / n if n > 0 else vec
+
+def _shingles(text, n=3):
+    """去空白后的字符 n-gram，短于 n 时取整串"""
+    s = "".join(str(text).lower().split())
+    if not s:
+        return []
+    if len(s) <= n:
+        return [s]
+    return [s[i:i + n] for i in range(len(s) - n + 1)]
+
+def layout_signature(graph, weights=None):
+    """计算语义图的紧凑布局签名
+
+    由三段分别归一化后加权拼接，整体再归一化，签名间点积即余弦相似度：
+    - 类型直方图：组件类型散列到 TYPE_BINS 个桶；
+    - 粗粒度空间网格：各元素相对坐标框在 GRID×GRID 网格上的覆盖面积；
+    - 文本 shingle：文本字符 3-gram 散列到 TEXT_BINS 个桶。
+
+    参数:
+    - graph: 语义图（meta/elements）
+    - weights: 可选，(类型, 网格, 文本) 三段权重，默认均为 1
+
+    返回:
+    - np.ndarray: float32，长度 SIGNATURE_DIM
+    """
+    wt, wg, wx = weights or (1.0, 1.0, 1.0)
+    elements = graph.get("elements", []) if isinstance(graph, dict) else []
+    types = np.zeros(TYPE_BINS, dtype=np.float64)
+    texts = np.zeros(TEXT_BINS, dtype=np.float64)
+    rels = []
+    for e in elements:
+        label = (e.get("type") or {}).get("label") or "unknown"
+        types[_bucket(label, TYPE_BINS)] += 1.0
+        rel = (e.get("geometry") or {}).get("rel")
+        if isinstance(rel, (list, tuple)) and len(rel) >= 4:
+            rels.append(rel[:4])
+        text = (e.get("content") or {}).get("text")
+        if isinstance(text, str):
+            for sh in _shingles(text):
+                texts[_bucket(sh, TEXT_BINS)] += 1.0
+    grid = np.zeros((GRID, GRID), dtype=np.float64)
+    if rels:
+        r = np.clip(np.asarray(rels, dtype=np.float64), 0.0, 1.0)
+        edges = np.linspace(0.0, 1.0, GRID + 1)
+        ox = np.clip(np.minimum(r[:, 2:3], edges[1:]) - np.maximum(r[:, 0:1], edges[:-1]), 0.0, None)
+        oy = np.clip(np.minimum(r[:, 3:4], edges[1:]) - np.maximum(r[:, 1:2], edges[:-1]), 0.0, None)
+        grid = oy.T @ ox
+    sig = np.concatenate([wt * _unit(types), wg * _unit(grid.ravel()), wx * _unit(texts)])
+    return _unit(sig).astype(np.float32)
+
+
+class DesignLibrary:
+    """设计稿库与检索索引
+
+    目录结构:
+    - index.json: 条目元数据（design_id、名称、页面路径、包名、节点数、签名行号）
+    - signatures.f32: 按注册顺序追加的签名矩阵（float32，N×SIGNATURE_DIM），
+      检索时以内存映射方式只读打开，一次矩阵乘得到全部相似度
+    - graphs/<design_id>.json.gz: 预构建的设计语义图
+    - index.lock: 注册时持有的文件锁（fcntl.flock），多个进程并发注册时串行化“读索引-追加-替换”
+
+    design_id 由语义图内容摘要得出，同一设计重复注册只保留一份。
+    """
+    def __init__(self, root=None, config=None):
+        """初始化设计稿库
+
+        参数:
+        - root: 库目录，默认读取 UI_COMPARE_LIBRARY_DIR 或 output/library
+        - config: 可选，{"weights": (类型, 网格, 文本), "rerank": 精排候选数,
+          "min_score": 最低签名相似度, "min_match_ratio": 最低匹配节点比例}
+        """
+        default = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'output', 'library'))
+        self.root = root or os.getenv("UI_COMPARE_LIBRARY_DIR") or default
+        self.config = config or {
+            "weights": (1.0, 1.0, 1.0),
+            "rerank": 3,
+            "min_score": _env_float("UI_COMPARE_LIBRARY_MIN_SCORE", 0.6),
+            "min_match_ratio": _env_float("UI_COMPARE_LIBRARY_MIN_MATCH", 0.5),
+        }
+        self.index_path = os.path.join(self.root, "index.json")
+        self.sig_path = os.path.join(self.root, "signatures.f32")
+        self.lock_path = os.path.join(self.root, "index.lock")
+        self._lock = threading.Lock()
+        self._entries = []
+        self._mtime = None
+        self._mm = None
+
+    def _load(self):
+        """按需重新读取索引（其他进程注册后 index.json 的修改时间会变化）"""
+        try:
+            mtime = os.path.getmtime(self.index_path)
+        except OSError:
+            self._entries, self._mtime, self._mm = [], None, None
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            self._entries = json.load(f).get("entries", [])
+        self._mtime = mtime
+        self._mm = None
+
+    def _matrix(self):
+        """返回签名矩阵的内存映射（只读），库为空时返回 None"""
+        n = len(self._entries)
+        if n == 0:
+            return None
+        if self._mm is None or self._mm.shape[0] != n:
+            self._mm = np.memmap(self.sig_path, dtype=np.float32, mode="r", shape=(n, SIGNATURE_DIM))
+        return self._mm
+
+    @contextmanager
+    def _write_lock(self):
+        """跨进程写锁：持有 index.lock 的排他 flock，平台不支持 fcntl 时退化为空操作"""
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.lock_path, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _graph_path(self, design_id):
+        """返回设计语义图的存储路径"""
+        return os.path.join(self.root, "graphs", f"{design_id}.json.gz")
+
+    def entries(self):
+        """列出全部条目"""
+        with self._lock:
+            self._load()
+            return [dict(e) for e in self._entries]
+
+    def register(self, design_data, name=None, page_path=None, bundle_name=None):
+        """注册一份设计稿：构建语义图、计算签名并追加到索引
+
+        参数:
+        - design_data: 设计端原始/增强数据（已解析）
+        - name: 可选，显示名称
+        - page_path / bundle_name: 可选，缺省时从原始树属性中读取
+
+        返回:
+        - dict: 条目元数据（已存在时返回既有条目）
+
+        进程内由 self._lock、跨进程由 index.lock 文件锁保护；持锁后强制重读索引，
+        避免修改时间精度不足时基于旧索引追加而覆盖其他进程刚写入的条目。
+        """
+        graph = build_semantic_graph(design_data, "design")
+        body = json.dumps(graph, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        design_id = "design_" + hashlib.sha256(body).hexdigest()[:16]
+        if not is_enhanced_schema(design_data):
+            page = extract_page_info(design_data)
+            page_path = page_path or page["page_path"]
+            bundle_name = bundle_name or page["bundle_name"]
+        sig = layout_signature(graph, self.config.get("weights"))
+        with self._lock, self._write_lock():
+            self._mtime = None
+            self._load()
+            for e in self._entries:
+                if e["design_id"] == design_id:
+                    return dict(e)
+            os.makedirs(os.path.join(self.root, "graphs"), exist_ok=True)
+            gpath = self._graph_path(design_id)
+            tmp = f"{gpath}.{os.getpid()}.tmp"
+            with gzip.open(tmp, "wb", compresslevel=6) as f:
+                f.write(body)
+            os.replace(tmp, gpath)
+            entry = {
+                "design_id": design_id,
+                "name": name or page_path or design_id,
+                "page_path": page_path,
+                "bundle_name": bundle_name,
+                "node_count": graph.get("meta", {}).get("node_count", len(graph.get("elements", []))),
+                "row": len(self._entries),
+            }
+            with open(self.sig_path, "r+b" if os.path.exists(self.sig_path) else "wb") as f:
+                f.seek(entry["row"] * SIGNATURE_DIM * 4)
+                f.write(sig.tobytes())
+                f.truncate()
+            entries = self._entries + [entry]
+            tmp = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"dim": SIGNATURE_DIM, "entries": entries}, f, ensure_ascii=False)
+            os.replace(tmp, self.index_path)
+            self._entries, self._mm = entries, None
+            self._mtime = os.path.getmtime(self.index_path)
+            return dict(entry)
+
+    def get_graph(self, design_id):
+        """读取设计语义图，不存在时返回 None"""
+        path = self._graph_path(design_id)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rb") as f:
+            return json.loads(f.read().decode("utf-8"))
+
+    def search(self, runtime_graph, k=5):
+        """按布局签名检索最相似的 k 份设计稿
+
+        参数:
+        - runtime_graph: 运行时语义图
+
+        返回:
+        - list[dict]: 条目元数据附加 score（余弦相似度），按得分降序
+        """
+        sig = layout_signature(runtime_graph, self.config.get("weights"))
+        with self._lock:
+            self._load()
+            mm = self._matrix()
+            if mm is None:
+                return []
+            scores = np.asarray(mm @ sig)
+            entries = list(self._entries)
+        k = max(1, min(int(k), len(entries)))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((top, -scores[top]))]
+        return [{**entries[i], "score": round(float(scores[i]), 6)} for i in top]
+
+    def lookup(self, runtime_graph, k=None):
+        """为运行时语义图自动选择设计稿
+
+        先按签名检索前 k 个候选（默认 config["rerank"]），再对候选逐一执行完整匹配，
+        取匹配节点占两侧较大节点数比例最高者。签名相似度低于 config["min_score"]
+        或匹配比例低于 config["min_match_ratio"] 的候选不会被选中，
+        全部不达标时视为库中没有该页面的设计稿。
+
+        返回:
+        - tuple: (设计语义图或 None, 候选列表（含 score 与 match_ratio）)
+        """
+        candidates = self.search(runtime_graph, k or self.config.get("rerank", 3))
+        min_score = float(self.config.get("min_score", 0.0))
+        min_ratio = float(self.config.get("min_match_ratio", 0.0))
+        best, best_graph, best_ratio = None, None, -1.0
+        n_runtime = len(runtime_graph.get("elements", []))
+        for cand in candidates:
+            graph = self.get_graph(cand["design_id"])
+            if graph is None:
+                continue
+            matching = UIFuzzyMatcher().run(graph, runtime_graph)
+            ratio = len(matching.get("matches", [])) / max(1, len(graph.get("elements", [])), n_runtime)
+            cand["match_ratio"] = round(ratio, 4)
+            if cand["score"] >= min_score and ratio >= min_ratio and ratio > best_ratio:
+                best, best_graph, best_ratio = cand, graph, ratio
+        if best is not None:
+            candidates.sort(key=lambda c: c is not best)
+        return best_graph, candidates
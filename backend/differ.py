@@ -1,5 +1,8 @@
+import hashlib
+import json
 import re
-import uuid
+
+import numpy as np
 
 
 class UISemanticDiffer:
@@ -33,7 +36,13 @@ class UISemanticDiffer:
                     "number": r"^\d+$",
                 },
             },
+            "coalesce": {
+                "enabled": True,
+                "tolerance_px": 5,
+            },
         }
+        self._dynamic_re, self._dynamic_groups, self._dynamic_singles = self._compile_dynamic(self.config.get("text", {}).get("dynamic_patterns") or {})
+        self._dynamic_cache = {}
 
     def _median(self, arr):
         """计算数组的中位数
@@ -75,6 +84,46 @@ class UISemanticDiffer:
         med = self._median(diffs)
         return med / max(h_px, 1.0)
 
+    def _compile_dynamic(self, pats):
+        """将全部动态文本规则编译为单个组合正则
+
+        每条规则放在独立的零宽前瞻分组中，一次 match 即可得到文本命中的全部规则，
+        与逐条 re.match 的结果一致。规则含捕获组（组合后编号与反向引用会错位）
+        或无法组合（如开头的全局内联标志 (?i)）时，退化为逐条匹配。
+
+        返回:
+        - tuple: (组合正则或 None, 分组名列表, 逐条编译的正则列表)
+
+        异常:
+        - re.error: 某条规则本身不是合法正则
+        """
+        singles = [re.compile(p) for p in pats.values()]
+        groups = [f"_dyn{i}" for i in range(len(singles))]
+        if any(r.groups for r in singles):
+            return None, groups, singles
+        try:
+            combined = re.compile("".join(f"(?=(?P<{g}>{r.pattern})|)" for g, r in zip(groups, singles)))
+        except re.error:
+            return None, groups, singles
+        return combined, groups, singles
+
+    def _dynamic_mask(self, text):
+        """计算文本命中的动态规则位掩码（带缓存）"""
+        mask = self._dynamic_cache.get(text)
+        if mask is None:
+            if self._dynamic_re is None:
+                mask = sum(1 << i for i, r in enumerate(self._dynamic_singles) if r.match(text))
+                self._dynamic_cache[text] = mask
+                return mask
+            m = self._dynamic_re.match(text)
+            mask = 0
+            if m:
+                for i, g in enumerate(self._dynamic_groups):
+                    if m.group(g) is not None:
+                        mask |= 1 << i
+            self._dynamic_cache[text] = mask
+        return mask
+
     def _text_dynamic(self, a, b):
         """判断两段文本是否都符合同类动态模式
 
@@ -88,11 +137,7 @@ class UISemanticDiffer:
         返回:
         - bool: 是否属于同类动态文本
         """
-        pats = self.config["text"]["dynamic_patterns"]
-        for _, p in pats.items():
-            if re.match(p, a or "") and re.match(p, b or ""):
-                return True
-        return False
+        return (self._dynamic_mask(a or "") & self._dynamic_mask(b or "")) != 0
 
     def _text_diff(self, d, r):
         """分析文本差异
@@ -171,6 +216,156 @@ class UISemanticDiffer:
             issues.append({"type": "SIZE_MISMATCH_H", "severity": "major", "delta_px": round(hr - hd, 1), "direction": "expand" if hr > hd else "shrink"})
         return issues
 
+    def _geometry_arrays(self, matches):
+        """将匹配对的几何信息一次性读取为数组
+
+        参数:
+        - matches: 匹配列表
+
+        返回:
+        - tuple: (设计中心 n×2, 运行时中心 n×2, 设计相对框 n×4, 运行时相对框 n×4)
+        """
+        n = len(matches)
+        cd = np.zeros((n, 2), dtype=np.float64)
+        cr = np.zeros((n, 2), dtype=np.float64)
+        rd = np.zeros((n, 4), dtype=np.float64)
+        rr = np.zeros((n, 4), dtype=np.float64)
+        for i, m in enumerate(matches):
+            gd = (m.get("design") or {}).get("geometry", {})
+            gr = (m.get("runtime") or {}).get("geometry", {})
+            cd[i] = gd.get("center") or [0.0, 0.0]
+            cr[i] = gr.get("center") or [0.0, 0.0]
+            rd[i] = gd.get("rel") or [0.0, 0.0, 0.0, 0.0]
+            rr[i] = gr.get("rel") or [0.0, 0.0, 0.0, 0.0]
+        return cd, cr, rd, rr
+
+    def _layout_diff_batch(self, geom, w_px, h_px, offset_y):
+        """批量分析布局与尺寸差异
+
+        与 _layout_diff 的判定规则完全一致，但位移、尺寸差与阈值比较
+        均在整个匹配集上以数组运算完成。
+
+        参数:
+        - geom: _geometry_arrays 的返回值
+        - w_px: 屏幕宽度像素
+        - h_px: 屏幕高度像素
+        - offset_y: 全局 Y 方向偏移（归一化）
+
+        返回:
+        - list[list[dict]]: 与匹配对一一对应的问题列表
+        """
+        cd, cr, rd, rr = geom
+        n = cd.shape[0]
+        dx = (cr[:, 0] - cd[:, 0]) * w_px
+        dy = (cr[:, 1] - cd[:, 1] - float(offset_y)) * h_px
+        pos_thr = float(self.config["layout"]["pos_threshold_px"])
+        wd = (rd[:, 2] - rd[:, 0]) * w_px
+        hd = (rd[:, 3] - rd[:, 1]) * h_px
+        wr = (rr[:, 2] - rr[:, 0]) * w_px
+        hr = (rr[:, 3] - rr[:, 1]) * h_px
+        size_abs = float(self.config["layout"]["size_abs_threshold_px"])
+        size_pct = float(self.config["layout"]["size_threshold_pct"])
+        flag_x = np.abs(dx) > pos_thr
+        flag_y = np.abs(dy) > pos_thr
+        flag_w = np.abs(wr - wd) > np.maximum(size_abs, wd * size_pct)
+        flag_h = np.abs(hr - hd) > np.maximum(size_abs, hd * size_pct)
+        out = [[] for _ in range(n)]
+        for i in np.flatnonzero(flag_x | flag_y | flag_w | flag_h).tolist():
+            issues = out[i]
+            if flag_x[i]:
+                v = float(dx[i])
+                issues.append({"type": "LAYOUT_SHIFT_X", "severity": "major", "delta_px": round(v, 1), "direction": "right" if v > 0 else "left"})
+            if flag_y[i]:
+                v = float(dy[i])
+                issues.append({"type": "LAYOUT_SHIFT_Y", "severity": "major", "delta_px": round(v, 1), "direction": "down" if v > 0 else "up"})
+            if flag_w[i]:
+                a = float(wd[i])
+                b = float(wr[i])
+                issues.append({"type": "SIZE_MISMATCH_W", "severity": "major", "delta_px": round(b - a, 1), "direction": "expand" if b > a else "shrink"})
+            if flag_h[i]:
+                a = float(hd[i])
+                b = float(hr[i])
+                issues.append({"type": "SIZE_MISMATCH_H", "severity": "major", "delta_px": round(b - a, 1), "direction": "expand" if b > a else "shrink"})
+        return out
+
+    def _coalesce_layout(self, matches, missing, layout, geom, w_px, h_px, offset_y):
+        """按设计图层级关系合并可由祖先位移/尺寸变化解释的后代布局问题
+
+        自上而下处理每个存在布局问题的匹配节点，取其最近的已匹配祖先
+        （跳过未匹配节点）：若该祖先本身存在布局问题，且本节点相对祖先的
+        残余位移不超过 容差 + 祖先同轴尺寸变化量、尺寸问题与祖先同轴且
+        变化量不超过祖先变化量 + 容差，则本节点的布局问题全部并入祖先所属
+        的根因问题（写入其 affected_nodes），并从 layout 中移除。
+
+        参数:
+        - matches / missing: 匹配结果（用于建立设计节点的父链）
+        - layout: _layout_diff_batch 的结果（就地修改）
+        - geom: _geometry_arrays 的结果
+        - w_px / h_px / offset_y: 同 _layout_diff_batch
+
+        返回:
+        - dict: {"folded": 被合并的节点数, "root_causes": 根因节点数}
+        """
+        cfg = self.config.get("coalesce") or {}
+        if not cfg.get("enabled", True) or not matches:
+            return {"folded": 0, "root_causes": 0}
+        tol = float(cfg.get("tolerance_px", self.config["layout"]["pos_threshold_px"]))
+        cd, cr, rd, rr = geom
+        dx = ((cr[:, 0] - cd[:, 0]) * w_px).tolist()
+        dy = ((cr[:, 1] - cd[:, 1] - float(offset_y)) * h_px).tolist()
+        dw = (((rr[:, 2] - rr[:, 0]) - (rd[:, 2] - rd[:, 0])) * w_px).tolist()
+        dh = (((rr[:, 3] - rr[:, 1]) - (rd[:, 3] - rd[:, 1])) * h_px).tolist()
+        parent = {}
+        for node in [m.get("design") or {} for m in matches] + list(missing):
+            parent[node.get("id")] = (node.get("topology") or {}).get("parent_id")
+        pos = {(m.get("design") or {}).get("id"): i for i, m in enumerate(matches)}
+        ids = [(m.get("design") or {}).get("id") for m in matches]
+        depth = {}
+
+        def depth_of(nid):
+            chain = []
+            while nid is not None and nid not in depth and len(chain) <= len(parent):
+                chain.append(nid)
+                nid = parent.get(nid)
+            d = depth.get(nid, -1) if nid is not None else -1
+            for c in reversed(chain):
+                d += 1
+                depth[c] = d
+            return depth[chain[0]] if chain else d
+
+        def matched_ancestor(nid):
+            p = parent.get(nid)
+            hops = 0
+            while p is not None and p not in pos and hops <= len(parent):
+                p = parent.get(p)
+                hops += 1
+            return pos.get(p)
+
+        had = [{it["type"] for it in li} for li in layout]
+        root = {}
+        affected = {}
+        folded = 0
+        for i in sorted((i for i in range(len(matches)) if layout[i]), key=lambda i: depth_of(ids[i])):
+            a = matched_ancestor(ids[i])
+            explained = a is not None and bool(had[a])
+            if explained:
+                explained = abs(dx[i] - dx[a]) <= tol + abs(dw[a]) and abs(dy[i] - dy[a]) <= tol + abs(dh[a])
+            if explained and "SIZE_MISMATCH_W" in had[i]:
+                explained = "SIZE_MISMATCH_W" in had[a] and dw[i] * dw[a] > 0 and abs(dw[i]) <= abs(dw[a]) + tol
+            if explained and "SIZE_MISMATCH_H" in had[i]:
+                explained = "SIZE_MISMATCH_H" in had[a] and dh[i] * dh[a] > 0 and abs(dh[i]) <= abs(dh[a]) + tol
+            if not explained:
+                root[i] = i
+                continue
+            r = root.get(a, a)
+            root[i] = r
+            affected.setdefault(r, []).append(ids[i])
+            layout[i] = []
+            folded += 1
+        for r, nodes in affected.items():
+            layout[r][0]["affected_nodes"] = nodes
+        return {"folded": folded, "root_causes": len(affected)}
+
     def _area_px(self, node, w_px, h_px):
         """计算节点面积（像素）
 
@@ -204,6 +399,28 @@ class UISemanticDiffer:
             return "minor"
         return "major"
 
+    def report_id(self, match_results, issues, design_meta=None, runtime_meta=None, extra=None):
+        """由两侧元素内容、匹配结果与问题列表派生确定性的报告 ID（相同输入得到相同 ID）
+
+        节点 ID 只由层级路径决定，骨架相同而文本/几何不同的页面节点 ID 相同，
+        因此摘要覆盖参与匹配的完整元素与两侧分辨率，而不仅是节点 ID。
+        调用方在 analyze 之后追加了问题（如截图比较）或匹配（如瓦片沿用）时，
+        应以最终的匹配与问题列表重新计算，并通过 extra 传入截图、瓦片掩码等其余输入的摘要。
+        """
+        h = hashlib.sha256()
+        def feed(obj):
+            h.update(json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str, separators=(",", ":")).encode("utf-8"))
+            h.update(b"\n")
+        feed([(design_meta or {}).get("resolution"), (runtime_meta or {}).get("resolution")])
+        for m in match_results.get("matches", []):
+            feed([m.get("design"), m.get("runtime")])
+        feed(match_results.get("missing", []))
+        feed(match_results.get("added", []))
+        feed(issues)
+        if extra:
+            feed(extra)
+        return f"diff_{h.hexdigest()[:12]}"
+
     def analyze(self, match_results, design_meta=None, runtime_meta=None):
         """对匹配结果进行全面差异分析
 
@@ -232,9 +449,16 @@ class UISemanticDiffer:
             dw = 1
         if dh <= 0:
             dh = 1
-        offset_norm = self._global_offset_y(match_results.get("matches", []), dh)
+        matches = match_results.get("matches", [])
+        geom = self._geometry_arrays(matches)
+        offset_norm = 0.0
+        if matches:
+            diffs = (geom[1][:, 1] * dh - geom[0][:, 1] * dh).tolist()
+            offset_norm = self._median(diffs) / max(dh, 1.0)
+        layout = self._layout_diff_batch(geom, dw, dh, offset_norm)
+        coalesced = self._coalesce_layout(matches, match_results.get("missing", []), layout, geom, dw, dh, offset_norm)
         issues = []
-        for m in match_results.get("matches", []):
+        for m, li in zip(matches, layout):
             d = m.get("design")
             r = m.get("runtime")
             ti = self._text_diff(d, r)
@@ -242,7 +466,6 @@ class UISemanticDiffer:
                 ti["node_id"] = d.get("id")
                 ti["widget_role"] = d.get("type", {}).get("label")
                 issues.append(ti)
-            li = self._layout_diff(d, r, dw, dh, offset_norm)
             for it in li:
                 it["node_id"] = d.get("id")
                 it["widget_role"] = d.get("type", {}).get("label")
@@ -255,7 +478,8 @@ class UISemanticDiffer:
             sev = self._severity_for_added(add, screen_area_px)
             issues.append({"type": "ADDED_WIDGET", "severity": sev, "node_id": add.get("id"), "widget_role": add.get("type", {}).get("label")})
         return {
-            "report_id": f"diff_{uuid.uuid4().hex[:8]}",
+            "report_id": self.report_id(match_results, issues, design_meta, runtime_meta),
             "global_calibration": {"y_offset_px": round(offset_norm * dh, 1)},
+            "coalesced": coalesced,
             "issues": issues,
         }
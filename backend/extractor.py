@@ -0,0 +1,291 @@
+import re
+
+
+def parse_bounds(bounds_str):
+    """解析字符串格式的 bounds，返回 {x,y,width,height}
+
+    参数:
+    - bounds_str: 类似 "[x1,y1][x2,y2]" 或包含四个整数的字符串
+    返回 None 表示解析失败
+    """
+    try:
+        nums = [int(n) for n in re.findall(r"-?\d+", str(bounds_str))]
+        if len(nums) >= 4:
+            x1, y1, x2, y2 = nums[:4]
+            w = max(0, x2 - x1)
+            h = max(0, y2 - y1)
+            return {"x": x1, "y": y1, "width": w, "height": h}
+    except Exception:
+        pass
+    return None
+
+def normalize_to_components(data):
+    """从原始层级数据抽取为组件列表
+
+    识别字典节点的 attributes/bounds/type/text 等信息并生成统一格式。
+    """
+    result = []
+    idx = 0
+
+    def rec(node):
+        nonlocal idx
+        if isinstance(node, dict):
+            attrs = node.get("attributes") if isinstance(node.get("attributes"), dict) else None
+            if attrs:
+                bounds = attrs.get("bounds")
+                bb = parse_bounds(bounds) if isinstance(bounds, str) else None
+                t = attrs.get("type") or "component"
+                if bb and t != "root" and bb["width"] > 0 and bb["height"] > 0:
+                    comp_id = attrs.get("accessibilityId") or attrs.get("hashcode") or str(idx)
+                    idx += 1
+                    comp = {
+                        "id": str(comp_id),
+                        "type": t,
+                        "bounding_box": bb
+                    }
+                    txt = attrs.get("text")
+                    if isinstance(txt, str) and txt:
+                        comp["text"] = txt
+                    result.append(comp)
+            children = node.get("children")
+            if isinstance(children, list):
+                for c in children:
+                    rec(c)
+        elif isinstance(node, list):
+            for it in node:
+                rec(it)
+
+    rec(data)
+    return result
+
+def is_enhanced_schema(obj):
+    """判断对象是否为增强语义图结构（包含 meta/elements）"""
+    return isinstance(obj, dict) and isinstance(obj.get("meta"), dict) and isinstance(obj.get("elements"), list)
+
+def extract_raw_detections_from_list(data):
+    """从简单列表结构提取原始检测项
+
+    每项需包含 box=[x1,y1,x2,y2]，可选 label/conf/text/ocr_conf
+    """
+    out = []
+    if isinstance(data, list):
+        for it in data:
+            box = it.get("box")
+            if isinstance(box, (list, tuple)) and len(box) >= 4:
+                out.append({
+                    "label": it.get("label", "unknown"),
+                    "box": [box[0], box[1], box[2], box[3]],
+                    "conf": it.get("conf", 0.0),
+                    "text": it.get("text"),
+                    "ocr_conf": it.get("ocr_conf", 0.0),
+                })
+    return out
+
+def _path_segments(children):
+    """为兄弟节点生成层级路径段
+
+    开发者设置了 id/key 时使用 "类型@标识"，否则使用 "类型[同类型兄弟序号]"，
+    插入其他类型的兄弟节点不会改变既有节点的路径段。
+    """
+    counts = {}
+    out = []
+    for c in children:
+        attrs = c.get("attributes") if isinstance(c, dict) and isinstance(c.get("attributes"), dict) else {}
+        t = attrs.get("type") or ""
+        ident = attrs.get("id") or attrs.get("key")
+        if ident:
+            out.append(f"{t}@{ident}")
+        else:
+            k = counts.get(t, 0)
+            counts[t] = k + 1
+            out.append(f"{t}[{k}]")
+    return out
+
+def extract_raw_detections_from_tree(data):
+    """从树形结构（含 children/attributes）提取原始检测项
+
+    每项附带 key（层级路径，遇到带 id/key 的节点从该节点重新起算），
+    供语义图构建生成跨运行稳定的节点 ID；以及 parent（最近的已产出祖先
+    在结果列表中的下标，无则为 None），保留源树的父子关系。
+    root、零尺寸节点与带 _pruned 标记的节点（见 VisibilityPruner）不产出检测项，
+    其子节点挂到更上层的祖先，但仍参与兄弟序号计算。结果按先序排列，
+    父项总在子项之前。
+    """
+    out = []
+    def rec(node, path, parent):
+        if isinstance(node, dict):
+            if node.get("_pruned") == "subtree":
+                return
+            attrs = node.get("attributes") if isinstance(node.get("attributes"), dict) else None
+            if attrs and not node.get("_pruned"):
+                bounds = attrs.get("bounds")
+                bb = parse_bounds(bounds) if isinstance(bounds, str) else None
+                t = attrs.get("type") or attrs.get("label") or "unknown"
+                if bb and t != "root" and bb["width"] > 0 and bb["height"] > 0:
+                    x1 = bb["x"]
+                    y1 = bb["y"]
+                    x2 = x1 + bb["width"]
+                    y2 = y1 + bb["height"]
+                    out.append({
+                        "label": t,
+                        "box": [x1, y1, x2, y2],
+                        "conf": 0.0,
+                        "text": attrs.get("text"),
+                        "ocr_conf": 0.0,
+                        "key": path,
+                        "parent": parent,
+                    })
+                    parent = len(out) - 1
+            children = node.get("children")
+            if isinstance(children, list):
+                for c, seg in zip(children, _path_segments(children)):
+                    rec(c, seg if "@" in seg else f"{path}/{seg}", parent)
+        elif isinstance(node, list):
+            for c, seg in zip(node, _path_segments(node)):
+                rec(c, seg if "@" in seg else f"{path}/{seg}", parent)
+    rec(data, "", None)
+    return out
+
+def infer_resolution_from_graph_or_boxes(obj, raw_detections):
+    """推断分辨率
+
+    优先从增强语义图的 meta.resolution 获取；
+    其次取检测框的最大 x2/y2；最后尝试解析树根 bounds。
+    """
+    if is_enhanced_schema(obj):
+        res = obj.get("meta", {}).get("resolution")
+        if isinstance(res, list) and len(res) == 2:
+            return int(res[0]) or 1, int(res[1]) or 1
+    max_x2 = 1
+    max_y2 = 1
+    for it in raw_detections:
+        box = it.get("box")
+        if isinstance(box, (list, tuple)) and len(box) >= 4:
+            max_x2 = max(max_x2, int(box[2]))
+            max_y2 = max(max_y2, int(box[3]))
+    if max_x2 > 1 and max_y2 > 1:
+        return max_x2, max_y2
+    if isinstance(obj, dict):
+        attrs = obj.get('attributes') if isinstance(obj.get('attributes'), dict) else None
+        if attrs and isinstance(attrs.get('bounds'), str):
+            bb = parse_bounds(attrs.get('bounds'))
+            if bb:
+                return max(1, int(bb['width'])), max(1, int(bb['height']))
+    return 1, 1
+
+def extract_page_info(data):
+    """从原始树中提取页面路径与包名
+
+    返回首个带有非空 pagePath/bundleName 属性的节点取值，
+    未找到时对应字段为 None。
+    """
+    info = {"page_path": None, "bundle_name": None}
+    stack = [data]
+    while stack and (info["page_path"] is None or info["bundle_name"] is None):
+        node = stack.pop()
+        if isinstance(node, dict):
+            attrs = node.get("attributes") if isinstance(node.get("attributes"), dict) else None
+            if attrs:
+                if info["page_path"] is None and attrs.get("pagePath"):
+                    info["page_path"] = attrs.get("pagePath")
+                if info["bundle_name"] is None and attrs.get("bundleName"):
+                    info["bundle_name"] = attrs.get("bundleName")
+            children = node.get("children")
+            if isinstance(children, list):
+                stack.extend(reversed(children))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+    return info
+
+def _window_of(node):
+    """返回节点的 hostWindowId（空串/缺失时为 None）"""
+    attrs = node.get("attributes") if isinstance(node.get("attributes"), dict) else {}
+    wid = attrs.get("hostWindowId")
+    return str(wid) if wid not in (None, "") else None
+
+def partition_windows(data):
+    """按窗口拆分原始树
+
+    hostWindowId 与所在分区不同的节点开启新分区（状态栏、弹窗、页面本身各成一区），
+    该节点的子树从原分区中移出；hostWindowId 为空的节点归属所在分区。
+    只剩根容器、不含任何子节点的无窗口分区被丢弃。没有 hostWindowId 的输入
+    整体作为一个分区。
+
+    分区键依次取 pagePath、bundleName、abilityName，均缺失时为 "window"
+    （窗口 ID 在两次运行之间不稳定，不参与键），重复的键追加 "#n"。
+
+    返回:
+    - list[dict]: {key, window_id, bundle_name, ability_name, page_path, tree}，按先序出现顺序
+    """
+    parts = []
+
+    def carve(node, wid):
+        """复制当前分区内的节点，遇到其他窗口的子节点时另起分区"""
+        out = dict(node)
+        children = node.get("children")
+        if isinstance(children, list):
+            kept = []
+            for c in children:
+                cw = _window_of(c) if isinstance(c, dict) else None
+                if cw is not None and cw != wid:
+                    start(c, cw)
+                else:
+                    kept.append(carve(c, wid) if isinstance(c, dict) else c)
+            out["children"] = kept
+        return out
+
+    def start(node, wid):
+        entry = {"window_id": wid, "tree": None}
+        parts.append(entry)
+        entry["tree"] = carve(node, wid)
+
+    if isinstance(data, list):
+        data = {"children": data}
+    if not isinstance(data, dict):
+        return []
+    start(data, _window_of(data))
+    out = []
+    seen = {}
+    for p in parts:
+        if p["window_id"] is None and not p["tree"].get("children") and len(parts) > 1:
+            continue
+        info = extract_page_info(p["tree"])
+        ability = None
+        stack = [p["tree"]]
+        while stack and ability is None:
+            n = stack.pop()
+            attrs = n.get("attributes") if isinstance(n, dict) and isinstance(n.get("attributes"), dict) else {}
+            ability = attrs.get("abilityName") or None
+            if isinstance(n, dict) and isinstance(n.get("children"), list):
+                stack.extend(reversed(n["children"]))
+        key = info["page_path"] or info["bundle_name"] or ability or "window"
+        seen[key] = seen.get(key, 0) + 1
+        if seen[key] > 1:
+            key = f"{key}#{seen[key]}"
+        out.append({
+            "key": key,
+            "window_id": p["window_id"],
+            "bundle_name": info["bundle_name"],
+            "ability_name": ability,
+            "page_path": info["page_path"],
+            "tree": p["tree"],
+        })
+    return out
+
+def pair_partitions(design_parts, runtime_parts):
+    """按分区键配对设计与运行时分区
+
+    两侧各只有一个分区时直接配对（例如设计稿缺少页面信息）。
+
+    返回:
+    - tuple: ([(design_part, runtime_part)], 未配对的设计分区键, 未配对的运行时分区键)
+    """
+    if len(design_parts) == 1 and len(runtime_parts) == 1:
+        return [(design_parts[0], runtime_parts[0])], [], []
+    by_key = {p["key"]: p for p in runtime_parts}
+    pairs = []
+    for p in design_parts:
+        if p["key"] in by_key:
+            pairs.append((p, by_key.pop(p["key"])))
+    paired = set(p["key"] for p, _ in pairs)
+    return pairs, [p["key"] for p in design_parts if p["key"] not in paired], [p["key"] for p in runtime_parts if p["key"] in by_key]
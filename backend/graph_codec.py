@@ -0,0 +1,318 @@
+import json
+import math
+import struct
+
+import numpy as np
+
+try:
+    import msgpack
+except Exception:
+    msgpack = None
+
+MAGIC = b"UIGC\x01"
+ZONES = ("header", "body", "footer")
+_STD_KEYS = {"id", "type", "geometry", "content", "topology"}
+_STD_TOPOLOGY = {"zone", "parent_id", "layer_level", "children"}
+
+
+class GraphValidationError(ValueError):
+    """预构建语义图结构校验失败"""
+
+
+def _numbers(value, size, what):
+    """校验定长数值列表"""
+    if not isinstance(value, (list, tuple)) or len(value) != size:
+        raise GraphValidationError(f"{what} must be a list of {size} numbers")
+    for v in value:
+        if isinstance(v, bool) or not isinstance(v, (int, float)) or not math.isfinite(v):
+            raise GraphValidationError(f"{what} must contain finite numbers")
+
+def validate_graph(graph):
+    """一次遍历校验增强语义图结构（meta/elements）
+
+    校验匹配与差异分析依赖的字段：ID 唯一、type.label、geometry.abs/rel/center、
+    topology.zone 取值与 parent_id 引用；不补全、不拷贝数据。
+
+    返回:
+    - dict: 原图对象；不合法时抛出 GraphValidationError
+    """
+    if not isinstance(graph, dict) or not isinstance(graph.get("meta"), dict) or not isinstance(graph.get("elements"), list):
+        raise GraphValidationError("graph must be an object with meta and elements")
+    res = graph["meta"].get("resolution")
+    if res is not None:
+        _numbers(res, 2, "meta.resolution")
+    ids = set()
+    parents = []
+    for k, e in enumerate(graph["elements"]):
+        if not isinstance(e, dict):
+            raise GraphValidationError(f"elements[{k}] must be an object")
+        nid = e.get("id")
+        if not isinstance(nid, str) or not nid:
+            raise GraphValidationError(f"elements[{k}].id must be a non-empty string")
+        if nid in ids:
+            raise GraphValidationError(f"duplicate element id {nid}")
+        ids.add(nid)
+        t = e.get("type")
+        if not isinstance(t, dict) or not isinstance(t.get("label"), str):
+            raise GraphValidationError(f"elements[{k}].type.label must be a string")
+        g = e.get("geometry")
+        if not isinstance(g, dict):
+            raise GraphValidationError(f"elements[{k}].geometry must be an object")
+        _numbers(g.get("abs"), 4, f"elements[{k}].geometry.abs")
+        _numbers(g.get("rel"), 4, f"elements[{k}].geometry.rel")
+        _numbers(g.get("center"), 2, f"elements[{k}].geometry.center")
+        c = e.get("content")
+        if c is not None and (not isinstance(c, dict) or not isinstance(c.get("text"), (str, type(None)))):
+            raise GraphValidationError(f"elements[{k}].content.text must be a string or null")
+        topo = e.get("topology")
+        if not isinstance(topo, dict) or topo.get("zone") not in ZONES:
+            raise GraphValidationError(f"elements[{k}].topology.zone must be one of {', '.join(ZONES)}")
+        if topo.get("parent_id") is not None:
+            parents.append(topo["parent_id"])
+    for p in parents:
+        if p not in ids:
+            raise GraphValidationError(f"parent_id {p} does not reference an element")
+    return graph
+
+def _column(arr, columns, chunks, offset):
+    """登记一列并返回下一个 8 字节对齐的偏移"""
+    arr = np.ascontiguousarray(arr)
+    columns.append((arr.dtype.str, list(arr.shape), offset))
+    chunks.append(arr.tobytes())
+    pad = (-arr.nbytes) % 8
+    if pad:
+        chunks.append(b"\0" * pad)
+    return offset + arr.nbytes + pad
+
+_COLUMNS = ("abs", "rel", "center", "conf", "ocr_conf", "label", "zone", "parent", "level",
+            "child_off", "child_idx", "id_off", "text_off", "text_null", "strings")
+# 各列允许的 dtype 类别（numpy dtype.kind），未列出的列为数值（整数或浮点）
+_COLUMN_KINDS = {
+    "label": "iu", "zone": "iu", "parent": "iu", "level": "iu", "child_off": "iu", "child_idx": "iu",
+    "id_off": "iu", "text_off": "iu", "text_null": "biu", "strings": "u",
+}
+
+def encode_graph(graph, fmt="columnar"):
+    """将增强语义图编码为紧凑二进制
+
+    参数:
+    - graph: 增强语义图（meta/elements）
+    - fmt: "columnar"（默认，定长数值列 + 字符串表）或 "msgpack"（需安装 msgpack）
+
+    列式格式中 geometry.abs 全为 int32 范围内的整数时按 int32 存储，
+    否则按 float64 存储，小数坐标原样往返。
+
+    返回:
+    - bytes
+    """
+    validate_graph(graph)
+    if fmt == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed")
+        return msgpack.packb(graph, use_bin_type=True)
+    elements = graph["elements"]
+    n = len(elements)
+    index = {e["id"]: k for k, e in enumerate(elements)}
+    labels = {}
+    strings = bytearray()
+    id_off = [0]
+    text_null = np.zeros(n, dtype=np.uint8)
+    child_off = [0]
+    child_idx = []
+    extras = {}
+    for k, e in enumerate(elements):
+        strings += e["id"].encode("utf-8")
+        id_off.append(len(strings))
+    text_off = [len(strings)]
+    for k, e in enumerate(elements):
+        text = (e.get("content") or {}).get("text")
+        if text is None:
+            text_null[k] = 1
+        else:
+            strings += text.encode("utf-8")
+        text_off.append(len(strings))
+        topo = e["topology"]
+        child_idx.extend(index[c] for c in topo.get("children") or [] if c in index)
+        child_off.append(len(child_idx))
+        labels.setdefault(e["type"]["label"], len(labels))
+        extra = {key: v for key, v in e.items() if key not in _STD_KEYS}
+        extra_topo = {key: v for key, v in topo.items() if key not in _STD_TOPOLOGY}
+        if extra_topo:
+            extra["topology"] = extra_topo
+        if extra:
+            extras[str(k)] = extra
+    boxes = [e["geometry"]["abs"] for e in elements]
+    integral = all(isinstance(v, int) and -2 ** 31 <= v < 2 ** 31 for b in boxes for v in b)
+    arrays = {
+        "abs": np.array(boxes, dtype=np.int32 if integral else np.float64).reshape(n, 4),
+        "rel": np.array([e["geometry"]["rel"] for e in elements], dtype=np.float64).reshape(n, 4),
+        "center": np.array([e["geometry"]["center"] for e in elements], dtype=np.float64).reshape(n, 2),
+        "conf": np.array([float(e["type"].get("conf", 0.0)) for e in elements], dtype=np.float64),
+        "ocr_conf": np.array([float((e.get("content") or {}).get("ocr_conf", 0.0)) for e in elements], dtype=np.float64),
+        "label": np.array([labels[e["type"]["label"]] for e in elements], dtype=np.int32),
+        "zone": np.array([ZONES.index(e["topology"]["zone"]) for e in elements], dtype=np.uint8),
+        "parent": np.array([index.get(e["topology"].get("parent_id"), -1) for e in elements], dtype=np.int32),
+        "level": np.array([int(e["topology"].get("layer_level", 0)) for e in elements], dtype=np.int32),
+        "child_off": np.array(child_off, dtype=np.int64),
+        "child_idx": np.array(child_idx, dtype=np.int32),
+        "id_off": np.array(id_off, dtype=np.int64),
+        "text_off": np.array(text_off, dtype=np.int64),
+        "text_null": text_null,
+        "strings": np.frombuffer(bytes(strings), dtype=np.uint8),
+    }
+    columns = []
+    chunks = []
+    offset = 0
+    for name in _COLUMNS:
+        offset = _column(arrays[name], columns, chunks, offset)
+    header = json.dumps({
+        "meta": graph["meta"],
+        "n": n,
+        "labels": list(labels),
+        "columns": dict(zip(_COLUMNS, columns)),
+        "extras": extras,
+    }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    head = MAGIC + struct.pack("<I", len(header)) + header
+    head += b"\0" * ((-len(head)) % 8)
+    return head + b"".join(chunks)
+
+def _decode_columnar(buf):
+    """解码列式格式：数值列以 np.frombuffer 直接引用输入缓冲区，构建元素时同步校验
+
+    零拷贝只覆盖读取与校验阶段：匹配、差异分析、规划与响应序列化都以逐元素的
+    dict 为输入，因此校验通过后各列仍转换为元素 dict，匹配器并不直接消费数组。
+    """
+    view = memoryview(buf)
+    if len(view) < len(MAGIC) + 4:
+        raise GraphValidationError("truncated graph header")
+    (hlen,) = struct.unpack_from("<I", view, len(MAGIC))
+    start = len(MAGIC) + 4
+    if start + hlen > len(view):
+        raise GraphValidationError("truncated graph header")
+    try:
+        header = json.loads(bytes(view[start:start + hlen]).decode("utf-8"))
+        n = int(header["n"])
+        labels = list(header["labels"])
+        spec = header["columns"]
+        meta = header["meta"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise GraphValidationError(f"invalid graph header: {e}")
+    if not isinstance(meta, dict):
+        raise GraphValidationError("graph meta must be an object")
+    if meta.get("resolution") is not None:
+        _numbers(meta["resolution"], 2, "meta.resolution")
+    base = start + hlen + (-(start + hlen)) % 8
+    expected = {
+        "abs": (n, 4), "rel": (n, 4), "center": (n, 2), "conf": (n,), "ocr_conf": (n,), "label": (n,),
+        "zone": (n,), "parent": (n,), "level": (n,), "child_off": (n + 1,), "id_off": (n + 1,),
+        "text_off": (n + 1,), "text_null": (n,),
+    }
+    cols = {}
+    for name in _COLUMNS:
+        if name not in spec:
+            raise GraphValidationError(f"missing column {name}")
+        try:
+            dtype, shape, offset = spec[name]
+            dt = np.dtype(dtype)
+        except (ValueError, TypeError) as e:
+            raise GraphValidationError(f"invalid column {name}: {e}")
+        if dt.kind not in _COLUMN_KINDS.get(name, "if") or (name == "strings" and dt.itemsize != 1):
+            raise GraphValidationError(f"column {name} has dtype {dt.str}, expected kind {_COLUMN_KINDS.get(name, 'if')!r}")
+        count = int(np.prod(shape)) if shape else 1
+        lo = base + int(offset)
+        if lo < base or lo + count * dt.itemsize > len(view):
+            raise GraphValidationError(f"column {name} is out of bounds")
+        if name in expected and tuple(shape) != expected[name]:
+            raise GraphValidationError(f"column {name} has shape {shape}, expected {list(expected[name])}")
+        cols[name] = np.frombuffer(view, dtype=dt, count=count, offset=lo).reshape(shape)
+    if not (np.isfinite(cols["abs"]).all() and np.isfinite(cols["rel"]).all() and np.isfinite(cols["center"]).all()):
+        raise GraphValidationError("geometry must contain finite numbers")
+    if n and (cols["label"].min() < 0 or cols["label"].max() >= len(labels)):
+        raise GraphValidationError("label index out of range")
+    if n and (cols["zone"].min() < 0 or cols["zone"].max() >= len(ZONES)):
+        raise GraphValidationError("zone index out of range")
+    if n and (cols["parent"].min() < -1 or cols["parent"].max() >= n):
+        raise GraphValidationError("parent index out of range")
+    blob = cols["strings"]
+    for name, limit in (("id_off", len(blob)), ("text_off", len(blob)), ("child_off", len(cols["child_idx"]))):
+        off = cols[name]
+        if off[0] < 0 or off[-1] > limit or (np.diff(off) < 0).any():
+            raise GraphValidationError(f"column {name} is not a valid offset table")
+    if len(cols["child_idx"]) and (cols["child_idx"].min() < 0 or cols["child_idx"].max() >= n):
+        raise GraphValidationError("child index out of range")
+    raw = blob.tobytes()
+    id_off = cols["id_off"].tolist()
+    ids = [raw[id_off[k]:id_off[k + 1]].decode("utf-8") for k in range(n)]
+    if len(set(ids)) != n or (n and not all(ids)):
+        raise GraphValidationError("element ids must be unique non-empty strings")
+    text_off = cols["text_off"].tolist()
+    text_null = cols["text_null"].tolist()
+    abs_ = cols["abs"].tolist()
+    rel = cols["rel"].tolist()
+    center = cols["center"].tolist()
+    conf = cols["conf"].tolist()
+    ocr_conf = cols["ocr_conf"].tolist()
+    label = cols["label"].tolist()
+    zone = cols["zone"].tolist()
+    parent = cols["parent"].tolist()
+    level = cols["level"].tolist()
+    child_off = cols["child_off"].tolist()
+    child_idx = cols["child_idx"].tolist()
+    extras = header.get("extras") or {}
+    elements = []
+    for k in range(n):
+        x1, y1, x2, y2 = abs_[k]
+        w = max(0, x2 - x1)
+        h = max(0, y2 - y1)
+        node = {
+            "id": ids[k],
+            "type": {"label": labels[label[k]], "conf": conf[k]},
+            "geometry": {"abs": abs_[k], "rel": rel[k], "center": center[k], "area": w * h, "width": w, "height": h},
+            "content": {
+                "text": None if text_null[k] else raw[text_off[k]:text_off[k + 1]].decode("utf-8"),
+                "ocr_conf": ocr_conf[k],
+            },
+            "topology": {
+                "zone": ZONES[zone[k]],
+                "parent_id": ids[parent[k]] if parent[k] >= 0 else None,
+                "layer_level": level[k],
+                "children": [ids[c] for c in child_idx[child_off[k]:child_off[k + 1]]],
+            },
+        }
+        extra = extras.get(str(k))
+        if extra:
+            node["topology"].update(extra.pop("topology", {}))
+            node.update(extra)
+        elements.append(node)
+    return {"meta": meta, "elements": elements}
+
+def decode_graph(data):
+    """解码并校验预构建语义图
+
+    按内容自动识别格式：列式二进制（MAGIC 开头）、JSON 文本、MessagePack（需安装 msgpack）。
+
+    参数:
+    - data: bytes/bytearray/memoryview
+
+    返回:
+    - dict: 校验通过的增强语义图；失败抛出 GraphValidationError
+    """
+    head = bytes(data[:len(MAGIC)])
+    if head == MAGIC:
+        return _decode_columnar(data)
+    if head[:1] in (b"{", b" ", b"\n", b"\r", b"\t"):
+        try:
+            obj = json.loads(bytes(data).decode("utf-8"))
+        except ValueError as e:
+            raise GraphValidationError(f"invalid JSON graph: {e}")
+        return validate_graph(obj)
+    return validate_graph(unpack_msgpack(data))
+
+def unpack_msgpack(data):
+    """解码 MessagePack 载荷，未安装 msgpack 时抛出 GraphValidationError"""
+    if msgpack is None:
+        raise GraphValidationError("msgpack payloads require the msgpack package")
+    try:
+        return msgpack.unpackb(bytes(data), raw=False)
+    except Exception as e:
+        raise GraphValidationError(f"invalid msgpack payload: {e}")
@@ -0,0 +1,316 @@
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    report_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    page_path TEXT,
+    bundle_name TEXT,
+    design_nodes INTEGER,
+    runtime_nodes INTEGER,
+    matched INTEGER,
+    missing INTEGER,
+    added INTEGER,
+    issue_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_reports_page_time ON reports(page_path, created_at);
+CREATE INDEX IF NOT EXISTS idx_reports_bundle_time ON reports(bundle_name, created_at);
+CREATE INDEX IF NOT EXISTS idx_reports_time ON reports(created_at);
+CREATE INDEX IF NOT EXISTS idx_reports_report_id ON reports(report_id);
+CREATE TABLE IF NOT EXISTS issues (
+    run_id INTEGER NOT NULL,
+    type TEXT,
+    severity TEXT,
+    node_id TEXT,
+    widget_role TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_issues_run ON issues(run_id);
+CREATE INDEX IF NOT EXISTS idx_issues_type ON issues(type, widget_role);
+CREATE TABLE IF NOT EXISTS stage_timings (
+    run_id INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    duration_ms REAL
+);
+CREATE INDEX IF NOT EXISTS idx_timings_run ON stage_timings(run_id);
+CREATE TABLE IF NOT EXISTS planner_calls (
+    run_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    kind TEXT,
+    model TEXT,
+    issue_types TEXT,
+    issue_count INTEGER,
+    outcome TEXT,
+    error TEXT,
+    duration_ms REAL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    estimated INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_planner_calls_run ON planner_calls(run_id);
+CREATE INDEX IF NOT EXISTS idx_planner_calls_time ON planner_calls(created_at);
+CREATE TABLE IF NOT EXISTS planner_issues (
+    run_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    issue_type TEXT,
+    source TEXT,
+    fallback_reason TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_planner_issues_run ON planner_issues(run_id);
+CREATE INDEX IF NOT EXISTS idx_planner_issues_time ON planner_issues(created_at);
+"""
+
+_GROUP_COLUMNS = {"type": "type", "widget_role": "widget_role", "node": "node_id", "severity": "severity"}
+_PLANNER_COLUMNS = {"kind": "kind", "outcome": "outcome", "model": "model", "issue_types": "issue_types"}
+
+
+class ReportHistory:
+    """基于 SQLite 的报告历史库
+
+    每次对比写入一条报告记录、其问题列表与各阶段耗时，
+    并按页面路径、包名与时间建立索引，支持趋势与高频问题查询。
+    """
+    def __init__(self, path=None):
+        """初始化历史库
+
+        参数:
+        - path: 数据库文件路径，默认读取 UI_COMPARE_HISTORY_DB 或 output/history.sqlite3
+        """
+        default = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'output', 'history.sqlite3'))
+        self.path = path or os.getenv("UI_COMPARE_HISTORY_DB") or default
+        self._lock = threading.Lock()
+        self._ready = False
+        self._keeper = None
+        if self.path == ":memory:":
+            self._uri = f"file:history_{id(self)}?mode=memory&cache=shared"
+            self._keeper = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+
+    def _connect(self):
+        """打开连接，首次使用时建表
+
+        ":memory:" 使用共享缓存的命名内存库，由实例持有的连接保持存活，
+        各次调用打开的连接看到的是同一个库（而不是各自新建的空库）。
+        """
+        if self._keeper is not None:
+            conn = sqlite3.connect(self._uri, uri=True, timeout=10)
+        else:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(_SCHEMA)
+                    conn.commit()
+                    self._ready = True
+        return conn
+
+    def record_report(self, report, matching, design_meta=None, runtime_meta=None, page_path=None, bundle_name=None, created_at=None):
+        """写入一次对比的报告与问题列表
+
+        返回:
+        - int: 本次运行的 run_id（同一 report_id 可对应多次运行）
+        """
+        issues = report.get("issues") or []
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                "INSERT INTO reports (report_id, created_at, page_path, bundle_name, design_nodes, runtime_nodes, matched, missing, added, issue_count) VALUES (?,?,?,?,?,?,?,?,?,?)",
+                (
+                    report.get("report_id") or "",
+                    float(created_at if created_at is not None else time.time()),
+                    page_path,
+                    bundle_name,
+                    int((design_meta or {}).get("node_count") or 0),
+                    int((runtime_meta or {}).get("node_count") or 0),
+                    len(matching.get("matches", [])),
+                    len(matching.get("missing", [])),
+                    len(matching.get("added", [])),
+                    len(issues),
+                ),
+            )
+            run_id = cur.lastrowid
+            conn.executemany(
+                "INSERT INTO issues (run_id, type, severity, node_id, widget_role) VALUES (?,?,?,?,?)",
+                [(run_id, it.get("type"), it.get("severity"), it.get("node_id"), it.get("widget_role")) for it in issues],
+            )
+            conn.commit()
+            return run_id
+        finally:
+            conn.close()
+
+    def record_timings(self, run_id, timings):
+        """写入各阶段耗时（毫秒）"""
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "INSERT INTO stage_timings (run_id, stage, duration_ms) VALUES (?,?,?)",
+                [(run_id, k, float(v)) for k, v in (timings or {}).items()],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def record_planner(self, run_id, calls, issues, created_at=None):
+        """写入规划阶段的调用台账与每条问题的蓝图来源（见 planner.accounting.PlannerLedger）"""
+        ts = float(created_at if created_at is not None else time.time())
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "INSERT INTO planner_calls (run_id, created_at, kind, model, issue_types, issue_count, outcome, error, duration_ms, prompt_tokens, completion_tokens, estimated) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                [(
+                    run_id, ts, c.get("kind"), c.get("model"), ",".join(c.get("issue_types") or []), int(c.get("issue_count") or 0),
+                    c.get("outcome"), c.get("error"), float(c.get("duration_ms") or 0.0),
+                    int(c.get("prompt_tokens") or 0), int(c.get("completion_tokens") or 0), 1 if c.get("estimated") else 0,
+                ) for c in calls or []],
+            )
+            conn.executemany(
+                "INSERT INTO planner_issues (run_id, created_at, issue_type, source, fallback_reason) VALUES (?,?,?,?,?)",
+                [(run_id, ts, it.get("issue_type"), it.get("source"), it.get("fallback_reason")) for it in issues or []],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def planner_stats(self, since=None, group_by=("kind", "outcome")):
+        """汇总规划阶段的调用与回退情况
+
+        参数:
+        - since: 可选，只统计该时间戳（秒）之后的记录
+        - group_by: 调用的分组字段，可选 kind/outcome/model/issue_types
+
+        返回:
+        - dict: calls（分组后的调用次数、耗时 p50/p95/max、token 合计）与
+          issue_types（按问题类型的问题数、各来源计数、回退率与回退原因分布）
+        """
+        cols = [_PLANNER_COLUMNS[g] for g in group_by if g in _PLANNER_COLUMNS] or ["kind"]
+        names = [g for g in group_by if g in _PLANNER_COLUMNS] or ["kind"]
+        since = float(since) if since is not None else 0.0
+        conn = self._connect()
+        try:
+            call_rows = conn.execute(
+                f"SELECT {', '.join(cols)}, duration_ms, prompt_tokens, completion_tokens FROM planner_calls WHERE created_at >= ?",
+                (since,),
+            ).fetchall()
+            issue_rows = conn.execute(
+                "SELECT issue_type, source, fallback_reason, COUNT(*) FROM planner_issues WHERE created_at >= ? GROUP BY issue_type, source, fallback_reason",
+                (since,),
+            ).fetchall()
+        finally:
+            conn.close()
+        groups = {}
+        for r in call_rows:
+            g = groups.setdefault(tuple(r[:len(names)]), {"durations": [], "prompt_tokens": 0, "completion_tokens": 0})
+            g["durations"].append(r[len(names)] or 0.0)
+            g["prompt_tokens"] += r[len(names) + 1] or 0
+            g["completion_tokens"] += r[len(names) + 2] or 0
+        calls = []
+        for key, g in groups.items():
+            durations = sorted(g["durations"])
+            item = {names[i]: key[i] for i in range(len(names))}
+            item.update({
+                "calls": len(durations),
+                "p50_ms": round(durations[(len(durations) - 1) // 2], 2),
+                "p95_ms": round(durations[min(len(durations) - 1, int(round(0.95 * (len(durations) - 1))))], 2),
+                "max_ms": round(durations[-1], 2),
+                "prompt_tokens": g["prompt_tokens"],
+                "completion_tokens": g["completion_tokens"],
+            })
+            calls.append(item)
+        calls.sort(key=lambda c: -c["calls"])
+        types = {}
+        for issue_type, source, reason, n in issue_rows:
+            row = types.setdefault(issue_type, {"issue_type": issue_type, "issues": 0, "batch": 0, "single": 0, "fallback": 0, "fallback_reasons": {}})
+            row["issues"] += n
+            row[source] = row.get(source, 0) + n
+            if source == "fallback":
+                row["fallback_reasons"][reason or "unknown"] = row["fallback_reasons"].get(reason or "unknown", 0) + n
+        for row in types.values():
+            row["fallback_rate"] = round(row["fallback"] / row["issues"], 4) if row["issues"] else 0.0
+        return {"calls": calls, "issue_types": sorted(types.values(), key=lambda r: -r["issues"])}
+
+    def _recent_runs_sql(self, page_path, bundle_name):
+        """生成“按页面/包名筛选最近运行”的子查询与参数"""
+        where = []
+        params = []
+        if page_path:
+            where.append("page_path = ?")
+            params.append(page_path)
+        if bundle_name:
+            where.append("bundle_name = ?")
+            params.append(bundle_name)
+        clause = ("WHERE " + " AND ".join(where)) if where else ""
+        return f"SELECT run_id FROM reports {clause} ORDER BY created_at DESC LIMIT ?", params
+
+    def trend(self, page_path=None, bundle_name=None, limit=200):
+        """查询最近若干次运行的问题数量趋势（按时间升序）
+
+        返回:
+        - list[dict]: 每次运行的 report_id/时间/问题总数/按类型计数/阶段耗时
+        """
+        runs_sql, params = self._recent_runs_sql(page_path, bundle_name)
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT run_id, report_id, created_at, page_path, bundle_name, matched, missing, added, issue_count FROM reports WHERE run_id IN ({runs_sql}) ORDER BY created_at",
+                params + [int(limit)],
+            ).fetchall()
+            by_type = {}
+            for run_id, t, n in conn.execute(
+                f"SELECT run_id, type, COUNT(*) FROM issues WHERE run_id IN ({runs_sql}) GROUP BY run_id, type",
+                params + [int(limit)],
+            ):
+                by_type.setdefault(run_id, {})[t] = n
+            timings = {}
+            for run_id, stage, ms in conn.execute(
+                f"SELECT run_id, stage, duration_ms FROM stage_timings WHERE run_id IN ({runs_sql})",
+                params + [int(limit)],
+            ):
+                timings.setdefault(run_id, {})[stage] = ms
+        finally:
+            conn.close()
+        return [{
+            "run_id": r[0],
+            "report_id": r[1],
+            "created_at": r[2],
+            "page_path": r[3],
+            "bundle_name": r[4],
+            "matched": r[5],
+            "missing": r[6],
+            "added": r[7],
+            "issue_count": r[8],
+            "by_type": by_type.get(r[0], {}),
+            "timings": timings.get(r[0], {}),
+        } for r in rows]
+
+    def top_issues(self, page_path=None, bundle_name=None, runs=200, limit=20, group_by=("type", "widget_role")):
+        """查询最近若干次运行中反复出现的问题
+
+        参数:
+        - group_by: 分组字段，可选 type/widget_role/node/severity
+
+        返回:
+        - list[dict]: 分组字段、出现的运行次数与问题总数，按运行次数降序
+        """
+        cols = [_GROUP_COLUMNS[g] for g in group_by if g in _GROUP_COLUMNS] or ["type"]
+        names = [g for g in group_by if g in _GROUP_COLUMNS] or ["type"]
+        runs_sql, params = self._recent_runs_sql(page_path, bundle_name)
+        sel = ", ".join(cols)
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {sel}, COUNT(DISTINCT run_id) AS runs, COUNT(*) AS total FROM issues WHERE run_id IN ({runs_sql}) GROUP BY {sel} ORDER BY runs DESC, total DESC LIMIT ?",
+                params + [int(runs), int(limit)],
+            ).fetchall()
+        finally:
+            conn.close()
+        out = []
+        for r in rows:
+            item = {names[i]: r[i] for i in range(len(names))}
+            item["runs"] = r[len(names)]
+            item["total"] = r[len(names) + 1]
+            out.append(item)
+        return out
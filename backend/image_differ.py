@@ -0,0 +1,139 @@
+import base64
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+class ImageDecodeError(ValueError):
+    """请求中提供的截图无法解码或引用的上传截图不存在"""
+
+
+def decode_image(data):
+    """将截图数据解码为 BGR 像素数组
+
+    参数:
+    - data: bytes，或 base64 字符串（可带 data:image/...;base64, 前缀）
+
+    返回:
+    - numpy.ndarray|None: 形如 (H, W, 3) 的 uint8 数组，解码失败返回 None
+    """
+    if isinstance(data, str):
+        s = data.strip()
+        if s.startswith("data:") and "," in s:
+            s = s.split(",", 1)[1]
+        try:
+            data = base64.b64decode(s)
+        except Exception:
+            return None
+    if not isinstance(data, (bytes, bytearray, memoryview)) or len(data) == 0:
+        return None
+    buf = np.frombuffer(data, dtype=np.uint8)
+    img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    return img
+
+
+class UIImageDiffer:
+    """区域级像素差异分析器
+
+    对每个匹配对，从设计截图与运行时截图中裁剪对应元素区域，
+    降采样到固定尺寸后以向量化方式计算结构差异（SSIM）与颜色差异，
+    输出视觉类问题，补充到诊断报告中。
+    """
+    def __init__(self, config=None):
+        """初始化像素差异分析器
+
+        参数:
+        - config: 可选配置，包含降采样尺寸、阈值与并发数
+        """
+        self.config = config or {
+            "sample_size": 16,
+            "min_crop_px": 4,
+            "struct_threshold": 0.25,
+            "color_threshold": 0.12,
+            "workers": 4,
+        }
+
+    def _crop(self, img, node):
+        """按节点相对坐标从截图中裁剪区域（返回视图，不复制像素）"""
+        rel = node.get("geometry", {}).get("rel") or [0.0, 0.0, 0.0, 0.0]
+        h, w = img.shape[:2]
+        x1 = min(max(int(round(float(rel[0]) * w)), 0), w)
+        y1 = min(max(int(round(float(rel[1]) * h)), 0), h)
+        x2 = min(max(int(round(float(rel[2]) * w)), 0), w)
+        y2 = min(max(int(round(float(rel[3]) * h)), 0), h)
+        min_px = int(self.config["min_crop_px"])
+        if x2 - x1 < min_px or y2 - y1 < min_px:
+            return None
+        return img[y1:y2, x1:x2]
+
+    def _sample_pair(self, design_img, runtime_img, match):
+        """裁剪并降采样单个匹配对，返回 (设计样本, 运行时样本) 或 None"""
+        a = self._crop(design_img, match.get("design") or {})
+        b = self._crop(runtime_img, match.get("runtime") or {})
+        if a is None or b is None:
+            return None
+        s = int(self.config["sample_size"])
+        sa = cv2.resize(a, (s, s), interpolation=cv2.INTER_AREA)
+        sb = cv2.resize(b, (s, s), interpolation=cv2.INTER_AREA)
+        return sa, sb
+
+    def _metrics(self, A, B):
+        """在样本堆栈上批量计算结构差异与颜色差异
+
+        参数:
+        - A: 设计样本，形如 (n, s, s, 3)
+        - B: 运行时样本，形如 (n, s, s, 3)
+
+        返回:
+        - tuple: (结构差异 n, 颜色差异 n)，取值均在 [0, 1]
+        """
+        A = A.astype(np.float32)
+        B = B.astype(np.float32)
+        ga = A.mean(axis=3).reshape(A.shape[0], -1)
+        gb = B.mean(axis=3).reshape(B.shape[0], -1)
+        mu_a = ga.mean(axis=1)
+        mu_b = gb.mean(axis=1)
+        var_a = ga.var(axis=1)
+        var_b = gb.var(axis=1)
+        cov = ((ga - mu_a[:, None]) * (gb - mu_b[:, None])).mean(axis=1)
+        c1 = (0.01 * 255) ** 2
+        c2 = (0.03 * 255) ** 2
+        ssim = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a * mu_a + mu_b * mu_b + c1) * (var_a + var_b + c2))
+        struct = np.clip((1.0 - ssim) / 2.0, 0.0, 1.0)
+        color = np.abs(A.mean(axis=(1, 2)) - B.mean(axis=(1, 2))).mean(axis=1) / 255.0
+        return struct, color
+
+    def analyze(self, matches, design_img, runtime_img):
+        """对匹配对进行像素级比较
+
+        参数:
+        - matches: 匹配列表，每项含 design/runtime 节点
+        - design_img: 已解码的设计截图
+        - runtime_img: 已解码的运行时截图
+
+        返回:
+        - dict: {"checked": 比较的元素数, "issues": 视觉问题列表}
+        """
+        if design_img is None or runtime_img is None or not matches:
+            return {"checked": 0, "issues": []}
+        workers = max(1, int(self.config["workers"]))
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            samples = list(ex.map(lambda m: self._sample_pair(design_img, runtime_img, m), matches))
+        idx = [i for i, s in enumerate(samples) if s is not None]
+        if not idx:
+            return {"checked": 0, "issues": []}
+        A = np.stack([samples[i][0] for i in idx])
+        B = np.stack([samples[i][1] for i in idx])
+        struct, color = self._metrics(A, B)
+        st = float(self.config["struct_threshold"])
+        ct = float(self.config["color_threshold"])
+        issues = []
+        for k, i in enumerate(idx):
+            d = matches[i].get("design") or {}
+            metrics = {"structural_diff": round(float(struct[k]), 3), "color_diff": round(float(color[k]), 3)}
+            if struct[k] > st:
+                issues.append({"type": "VISUAL_MISMATCH", "severity": "major", "metrics": metrics, "node_id": d.get("id"), "widget_role": d.get("type", {}).get("label")})
+            elif color[k] > ct:
+                issues.append({"type": "COLOR_MISMATCH", "severity": "minor", "metrics": metrics, "node_id": d.get("id"), "widget_role": d.get("type", {}).get("label")})
+        return {"checked": len(idx), "issues": issues}
@@ -0,0 +1,334 @@
+"""对比服务压测工具
+
+以可配置的并发度或到达速率向 /api/compare 回放设计/运行时数据对，
+统计吞吐、延迟分位数（p50/p95/p99）、错误率与各阶段耗时分布：
+
+    python loadtest.py --concurrency 8 --requests 200
+    python loadtest.py --rate 5 --duration 60 --pairs /data/dumps
+    python loadtest.py --url http://127.0.0.1:5000 --concurrency 16 --requests 500
+
+未指定 --url 时在进程内以多线程 WSGI 服务启动 Flask 应用，产物与历史库写入临时目录；
+规划器使用本地桩模型（--llm-latency-ms / --llm-jitter-ms / --llm-error-rate，
+即环境变量 LLM_STUB_LATENCY_MS 等），不访问真实 LLM。
+数据对来自 --pairs 目录（同 batch.py 的命名规则），未指定时由 --base 转储随机扰动生成。
+"""
+import argparse
+import copy
+import gzip
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from batch import discover_pairs
+
+DEFAULT_BASE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '1.json'))
+BOUNDS_RE = re.compile(r"-?\d+")
+
+
+def _shift_bounds(bounds, dx, dy):
+    """平移 "[x1,y1][x2,y2]" 格式的 bounds"""
+    nums = [int(n) for n in BOUNDS_RE.findall(bounds)]
+    if len(nums) < 4:
+        return bounds
+    x1, y1, x2, y2 = nums[:4]
+    return f"[{x1 + dx},{y1 + dy}][{x2 + dx},{y2 + dy}]"
+
+def perturb(tree, rng, text_changes=3, shifts=2, drops=1):
+    """随机扰动原始树，模拟运行时与设计稿的差异
+
+    修改若干文本、平移若干子树、删除若干叶子节点，原树不被修改。
+    """
+    tree = copy.deepcopy(tree)
+    nodes = []
+    stack = [(tree, None)]
+    while stack:
+        node, parent = stack.pop()
+        if isinstance(node, dict):
+            if isinstance(node.get("attributes"), dict):
+                nodes.append((node, parent))
+            for c in node.get("children") or []:
+                stack.append((c, node))
+    texts = [n for n, _ in nodes if n["attributes"].get("text")]
+    for n in rng.sample(texts, min(text_changes, len(texts))):
+        n["attributes"]["text"] = n["attributes"]["text"] + "*"
+    for n, _ in rng.sample(nodes, min(shifts, len(nodes))):
+        dy = rng.choice([-24, -12, 12, 24])
+        sub = [n]
+        while sub:
+            m = sub.pop()
+            if isinstance(m, dict):
+                attrs = m.get("attributes")
+                if isinstance(attrs, dict) and isinstance(attrs.get("bounds"), str):
+                    attrs["bounds"] = _shift_bounds(attrs["bounds"], 0, dy)
+                sub.extend(m.get("children") or [])
+    leaves = [(n, p) for n, p in nodes if p is not None and not n.get("children")]
+    for n, p in rng.sample(leaves, min(drops, len(leaves))):
+        p["children"] = [c for c in p.get("children") or [] if c is not n]
+    return tree
+
+def generate_pairs(base, count, seed=0):
+    """由一份基础转储生成 count 个（设计, 运行时）数据对"""
+    rng = random.Random(seed)
+    return [{"pair": f"gen_{k}", "design": base, "runtime": perturb(base, rng)} for k in range(count)]
+
+def load_pairs(root):
+    """读取目录中的数据对（命名规则同 batch.discover_pairs）"""
+    out = []
+    for item in discover_pairs(root):
+        with open(item["design"], "r", encoding="utf-8") as f:
+            design = json.load(f)
+        with open(item["runtime"], "r", encoding="utf-8") as f:
+            runtime = json.load(f)
+        out.append({"pair": item["pair"], "design": design, "runtime": runtime})
+    return out
+
+def encode_bodies(pairs, compress=False, options=None):
+    """预先序列化请求体，避免压测期间客户端序列化开销计入延迟"""
+    bodies = []
+    for p in pairs:
+        body = {"design_json": p["design"], "code_json": p["runtime"]}
+        body.update(options or {})
+        raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        bodies.append(gzip.compress(raw, 6) if compress else raw)
+    return bodies
+
+
+class InProcessServer:
+    """在后台线程中以多线程 WSGI 服务运行 Flask 应用
+
+    运行期间产物、历史库与设计稿库替换为 scratch 目录下的实例，不污染 output/，
+    退出时恢复原实例。
+    """
+    def __init__(self, scratch):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+        import app as app_module
+        from artifacts import ArtifactStore
+        from design_library import DesignLibrary
+        from history import ReportHistory
+
+        self.app_module = app_module
+        self.replaced = {
+            "OUTPUT_ROOT": scratch,
+            "artifacts": ArtifactStore(scratch),
+            "history": ReportHistory(os.path.join(scratch, "history.sqlite3")),
+            "design_library": DesignLibrary(os.path.join(scratch, "library")),
+        }
+        self.saved = {}
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server("127.0.0.1", 0, app_module.app, threaded=True, request_handler=QuietHandler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        for name, value in self.replaced.items():
+            self.saved[name] = getattr(self.app_module, name)
+            setattr(self.app_module, name, value)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.thread.join(timeout=5)
+        for name, value in self.saved.items():
+            setattr(self.app_module, name, value)
+
+
+def _post(url, body, compress, timeout):
+    """发送一次对比请求，返回单条样本"""
+    headers = {"Content-Type": "application/json"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    req = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    t = time.perf_counter()
+    sample = {"start": time.time(), "status": 0, "timings": {}}
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            payload = resp.read()
+            sample["status"] = resp.status
+    except urllib.error.HTTPError as e:
+        payload = e.read()
+        sample["status"] = e.code
+    except Exception as e:
+        payload = b""
+        sample["error"] = f"{type(e).__name__}: {e}"
+    sample["latency_ms"] = (time.perf_counter() - t) * 1000.0
+    if sample["status"] == 200:
+        try:
+            sample["timings"] = json.loads(payload).get("timings") or {}
+        except ValueError:
+            pass
+    return sample
+
+def _percentiles(values):
+    """返回 p50/p95/p99/max/mean（毫秒，保留两位小数）"""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None, "mean": None}
+    arr = np.asarray(values, dtype=np.float64)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {k: round(float(v), 2) for k, v in (("p50", p50), ("p95", p95), ("p99", p99), ("max", arr.max()), ("mean", arr.mean()))}
+
+def summarize(samples, elapsed_s):
+    """汇总压测样本
+
+    返回:
+    - dict: requests、elapsed_s、throughput_rps、latency_ms 分位数、
+      error_rate、status 分布与各阶段耗时分位数（stages）
+    """
+    ok = [s for s in samples if s["status"] == 200]
+    status = {}
+    for s in samples:
+        key = str(s["status"]) if s["status"] else "network"
+        status[key] = status.get(key, 0) + 1
+    stages = {}
+    for s in ok:
+        for name, ms in (s.get("timings") or {}).items():
+            stages.setdefault(name, []).append(ms)
+    return {
+        "requests": len(samples),
+        "elapsed_s": round(elapsed_s, 3),
+        "throughput_rps": round(len(ok) / elapsed_s, 3) if elapsed_s > 0 else 0.0,
+        "latency_ms": _percentiles([s["latency_ms"] for s in ok]),
+        "error_rate": round(1.0 - len(ok) / len(samples), 4) if samples else 0.0,
+        "status": status,
+        "stages": {name: _percentiles(v) for name, v in sorted(stages.items())},
+    }
+
+def run_load(url, bodies, concurrency=4, total=None, duration_s=None, rate=None, compress=False, timeout=120.0, seed=0):
+    """执行压测
+
+    - 未指定 rate 时为闭环模式：concurrency 个客户端各自连续发送请求；
+    - 指定 rate（请求/秒）时为开环模式：按泊松过程到达，最多 concurrency 个请求在途，
+      在途已满时到达的请求排队等待，排队时间计入延迟。
+    total 与 duration_s 任一达到即停止（均未指定时发送 len(bodies) 个请求）。
+
+    返回:
+    - dict: summarize 的结果
+    """
+    endpoint = url.rstrip("/") + "/api/compare"
+    if total is None and duration_s is None:
+        total = len(bodies)
+    samples = []
+    lock = threading.Lock()
+    counter = {"next": 0}
+    started = time.perf_counter()
+    stop_at = started + duration_s if duration_s else None
+
+    def take():
+        with lock:
+            k = counter["next"]
+            if (total is not None and k >= total) or (stop_at is not None and time.perf_counter() >= stop_at):
+                return None
+            counter["next"] = k + 1
+            return k
+
+    def record(sample):
+        with lock:
+            samples.append(sample)
+
+    if rate:
+        rng = random.Random(seed)
+        with ThreadPoolExecutor(max_workers=concurrency) as ex:
+            due = started
+            while True:
+                k = take()
+                if k is None:
+                    break
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                queued = time.perf_counter()
+
+                def job(k=k, queued=queued):
+                    s = _post(endpoint, bodies[k % len(bodies)], compress, timeout)
+                    s["latency_ms"] = (time.perf_counter() - queued) * 1000.0
+                    record(s)
+
+                ex.submit(job)
+                due += rng.expovariate(rate)
+    else:
+        def client():
+            while True:
+                k = take()
+                if k is None:
+                    return
+                record(_post(endpoint, bodies[k % len(bodies)], compress, timeout))
+
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(max(1, concurrency))]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+    return summarize(samples, time.perf_counter() - started)
+
+def main(argv=None):
+    """命令行入口，输出 JSON 汇总；存在失败请求时退出码为 1"""
+    parser = argparse.ArgumentParser(description="Load test the /api/compare endpoint")
+    parser.add_argument("--url", help="target server (default: start the app in-process)")
+    parser.add_argument("--pairs", help="directory of <prefix>design.json / <prefix>runtime.json pairs")
+    parser.add_argument("--base", default=DEFAULT_BASE, help="dump used to generate pairs when --pairs is not given")
+    parser.add_argument("--generate", type=int, default=16, help="number of generated pairs")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=None, help="total requests")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    parser.add_argument("--rate", type=float, default=None, help="open-loop arrival rate (requests/s)")
+    parser.add_argument("--gzip", action="store_true", help="send gzip-compressed bodies")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request client timeout (s)")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="also write the summary JSON to this file")
+    args = parser.parse_args(argv)
+
+    if args.pairs:
+        pairs = load_pairs(args.pairs)
+    else:
+        with open(args.base, "r", encoding="utf-8") as f:
+            pairs = generate_pairs(json.load(f), args.generate, args.seed)
+    if not pairs:
+        sys.stderr.write("no dump pairs found\n")
+        return 1
+    bodies = encode_bodies(pairs, args.gzip)
+
+    def run(url):
+        return run_load(url, bodies, args.concurrency, args.requests, args.duration, args.rate, args.gzip, args.timeout, args.seed)
+
+    if args.url:
+        summary = run(args.url)
+    else:
+        os.environ["LLM_STUB_LATENCY_MS"] = str(args.llm_latency_ms)
+        os.environ["LLM_STUB_JITTER_MS"] = str(args.llm_jitter_ms)
+        os.environ["LLM_STUB_ERROR_RATE"] = str(args.llm_error_rate)
+        with tempfile.TemporaryDirectory(prefix="ui_compare_load_") as scratch:
+            with InProcessServer(scratch) as server:
+                summary = run(server.url)
+    summary["config"] = {
+        "target": args.url or "in-process",
+        "pairs": len(pairs),
+        "concurrency": args.concurrency,
+        "rate": args.rate,
+        "gzip": args.gzip,
+        "llm_latency_ms": None if args.url else args.llm_latency_ms,
+    }
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 1 if summary["error_rate"] > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,8 @@
 import math
+import os
+import time
+
+import numpy as np
 
 
 class UIFuzzyMatcher:
@@ -6,7 +10,8 @@ class UIFuzzyMatcher:
 
     在设计语义图与运行时语义图之间进行元素级匹配，
     综合几何位置、形状比例、文本相似度与类型兼容度计算成本，
-    采用匈牙利算法得到最优匹配，并输出匹配、缺失与新增列表。
+    采用匈牙利算法得到最优匹配（或在时间预算内由拍卖算法给出近似解），
+    并输出匹配、缺失与新增列表。
     """
     def __init__(self, config=None):
         """初始化匹配器
@@ -17,8 +22,11 @@ class UIFuzzyMatcher:
         self.config = config or {
             "weights": {"geo": 0.4, "shape": 0.2, "text": 0.3, "type": 0.1},
             "thresholds": {"match_cutoff": 0.65},
+            "solver": {"mode": "exact", "time_budget_ms": None},
+            "parallel": {"workers": int(os.getenv("UI_COMPARE_MATCH_WORKERS") or 0), "min_cells": 20000, "block_rows": 64, "split_min_cells": 40000},
         }
         self.soft_pairs = {("button", "text"), ("icon", "image"), ("input", "text")}
+        self.solver_stats = []
 
     def _center(self, node):
         """获取节点中心点坐标（归一化）"""
@@ -37,24 +45,6 @@ class UIFuzzyMatcher:
         h = float(g.get("height", 1.0))
         return w / max(h, 1.0)
 
-    def _iou_rel(self, a, b):
-        """计算两个相对框的 IoU"""
-        ax1, ay1, ax2, ay2 = self._rel(a)
-        bx1, by1, bx2, by2 = self._rel(b)
-        ix1 = max(ax1, bx1)
-        iy1 = max(ay1, by1)
-        ix2 = min(ax2, bx2)
-        iy2 = min(ay2, by2)
-        if ix2 <= ix1 or iy2 <= iy1:
-            return 0.0
-        inter = (ix2 - ix1) * (iy2 - iy1)
-        a_area = max(0.0, (ax2 - ax1)) * max(0.0, (ay2 - ay1))
-        b_area = max(0.0, (bx2 - bx1)) * max(0.0, (by2 - by1))
-        union = a_area + b_area - inter
-        if union <= 0:
-            return 0.0
-        return inter / union
-
     def _text(self, node):
         """提取节点文本内容（字符串）"""
         t = node.get("content", {}).get("text")
@@ -77,71 +67,71 @@ class UIFuzzyMatcher:
                 lcs += 1
         return max(0.0, min(1.0, lcs / max(la, lb)))
 
-    def _calc_geo_cost(self, a, b, y_offset=0.0):
-        """几何成本: 距离 + 1-IoU"""
-        ax, ay = self._center(a)
-        bx, by = self._center(b)
-        by = by + y_offset
-        dx = ax - bx
-        dy = ay - by
-        dist = math.sqrt(dx * dx + dy * dy)
-        dist_cost = min(dist * 2.0, 1.0)
-        iou = self._iou_rel(a, b)
-        return dist_cost + (1.0 - iou)
-
-    def _calc_shape_cost(self, a, b):
-        """形状成本: 宽高比差值裁剪到 [0,1]"""
-        ar_a = self._shape_ar(a)
-        ar_b = self._shape_ar(b)
-        return min(abs(ar_a - ar_b), 1.0)
-
-    def _calc_text_cost(self, a, b):
-        """文本成本: 1-相似度；空文本一致成本为 0"""
-        ta = self._text(a)
-        tb = self._text(b)
+    def _features(self, node):
+        """提取节点的匹配特征元组 (cx, cy, x1, y1, x2, y2, 宽高比, 文本, 小写类型)"""
+        cx, cy = self._center(node)
+        x1, y1, x2, y2 = self._rel(node)
+        label = (node.get("type", {}).get("label") or "").lower()
+        return (cx, cy, x1, y1, x2, y2, self._shape_ar(node), self._text(node), label)
+
+    def _pair_cost(self, fa, fb, y_offset=0.0):
+        """基于特征元组计算单对元素的加权成本
+
+        - 几何: 中心距离（×2 后裁剪到 1）+ 1-IoU，运行时一侧按 y_offset 校正；
+        - 形状: 宽高比差值裁剪到 [0,1]；
+        - 文本: 1-相似度，两侧均为空时为 0，仅一侧为空时为 1；
+        - 类型: 一致为 0，软兼容对为 0.3，其余为 1。
+        """
+        w = self.config["weights"]
+        dx = fa[0] - fb[0]
+        dy = fa[1] - (fb[1] + y_offset)
+        dist_cost = min(math.sqrt(dx * dx + dy * dy) * 2.0, 1.0)
+        iou = 0.0
+        ix1 = max(fa[2], fb[2])
+        iy1 = max(fa[3], fb[3])
+        ix2 = min(fa[4], fb[4])
+        iy2 = min(fa[5], fb[5])
+        if ix2 > ix1 and iy2 > iy1:
+            inter = (ix2 - ix1) * (iy2 - iy1)
+            a_area = max(0.0, (fa[4] - fa[2])) * max(0.0, (fa[5] - fa[3]))
+            b_area = max(0.0, (fb[4] - fb[2])) * max(0.0, (fb[5] - fb[3]))
+            union = a_area + b_area - inter
+            if union > 0:
+                iou = inter / union
+        c_geo = dist_cost + (1.0 - iou)
+        c_shape = min(abs(fa[6] - fb[6]), 1.0)
+        ta = fa[7]
+        tb = fb[7]
         if not ta and not tb:
-            return 0.0
-        if bool(ta) != bool(tb):
-            return 1.0
-        sim = self._seq_similarity(ta, tb)
-        return 1.0 - sim
-
-    def _calc_type_cost(self, a, b):
-        """类型成本: 完全一致为 0；软兼容对给定较低成本"""
-        la = (a.get("type", {}).get("label") or "").lower()
-        lb = (b.get("type", {}).get("label") or "").lower()
-        if la == lb:
-            return 0.0
-        pair = tuple(sorted((la, lb)))
-        if pair in self.soft_pairs:
-            return 0.3
-        return 1.0
+            c_text = 0.0
+        elif bool(ta) != bool(tb):
+            c_text = 1.0
+        else:
+            c_text = 1.0 - self._seq_similarity(ta, tb)
+        if fa[8] == fb[8]:
+            c_type = 0.0
+        elif tuple(sorted((fa[8], fb[8]))) in self.soft_pairs:
+            c_type = 0.3
+        else:
+            c_type = 1.0
+        return w["geo"] * c_geo + w["shape"] * c_shape + w["text"] * c_text + w["type"] * c_type
 
-    def _compute_cost_matrix(self, A, B, y_offset=0.0):
+    def _compute_cost_matrix(self, A, B, y_offset=0.0, fa=None, fb=None):
         """构建成本矩阵
 
         参数:
         - A: 设计元素列表
         - B: 运行时元素列表
         - y_offset: Y 方向偏移校正
+        - fa / fb: 可选的预计算特征列表（见 prepare），省略时现场提取
 
         返回:
         - list[list[float]]: 成本矩阵
         """
-        n = len(A)
-        m = len(B)
-        w = self.config["weights"]
-        M = [[0.0 for _ in range(m)] for _ in range(n)]
-        for i in range(n):
-            ai = A[i]
-            for j in range(m):
-                bj = B[j]
-                c_geo = self._calc_geo_cost(ai, bj, y_offset)
-                c_shape = self._calc_shape_cost(ai, bj)
-                c_text = self._calc_text_cost(ai, bj)
-                c_type = self._calc_type_cost(ai, bj)
-                M[i][j] = w["geo"] * c_geo + w["shape"] * c_shape + w["text"] * c_text + w["type"] * c_type
-        return M
+        fa = fa if fa is not None else [self._features(a) for a in A]
+        fb = fb if fb is not None else [self._features(b) for b in B]
+        cost = self._pair_cost
+        return [[cost(ai, bj, y_offset) for bj in fb] for ai in fa]
 
     def _hungarian(self, cost):
         """匈牙利算法求最小成本匹配
@@ -205,21 +195,131 @@ class UIFuzzyMatcher:
                 assignment.append((p[j] - 1, j - 1))
         return assignment
 
+    def _greedy(self, P):
+        """贪心初始解：按行最小成本升序，为每行分配当前最便宜的空闲列"""
+        size = P.shape[0]
+        col_of = np.full(size, -1, dtype=np.int64)
+        penalty = np.zeros(P.shape[1], dtype=np.float64)
+        for i in np.argsort(P.min(axis=1), kind="stable"):
+            j = int(np.argmin(P[i] + penalty))
+            col_of[i] = j
+            penalty[j] = np.inf
+        return col_of
+
+    def _auction(self, cost, deadline=None):
+        """ε 缩放拍卖算法求近似最小成本匹配（可随时中止）
+
+        以贪心解为初始可行解，随后逐轮缩小 ε 运行拍卖；每完成一轮即
+        得到一个完整分配并更新最优解。任意价格向量都给出对偶下界
+        sum_i min_j(c_ij + p_j) - sum_j p_j，据此报告最优性差距上界。
+        截止时间到达时，将当前轮的部分分配贪心补全，并返回已找到的最优分配。
+
+        参数:
+        - cost: n×m 成本矩阵
+        - deadline: 可选，time.perf_counter() 截止时刻
+
+        返回:
+        - tuple: (匹配下标对列表, {"gap_bound": 差距上界, "timed_out": 是否超时})
+        """
+        C = np.asarray(cost, dtype=np.float64)
+        n, m = C.shape
+        size = max(n, m)
+        P = np.zeros((size, size), dtype=np.float64)
+        P[:n, :m] = C
+        best = self._greedy(P)
+        best_cost = float(P[np.arange(size), best].sum())
+        prices = np.zeros(size, dtype=np.float64)
+        lower = float(P.min(axis=1).sum())
+        span = float(P.max() - P.min()) if size else 0.0
+        eps = max(span / 4.0, 1e-3)
+        eps_min = 1e-9 / max(size, 1)
+        timed_out = False
+        while True:
+            col_of = np.full(size, -1, dtype=np.int64)
+            row_of = np.full(size, -1, dtype=np.int64)
+            free = list(range(size - 1, -1, -1))
+            while free:
+                if deadline is not None and time.perf_counter() > deadline:
+                    timed_out = True
+                    break
+                i = free.pop()
+                w = P[i] + prices
+                if size > 1:
+                    two = np.argpartition(w, 1)[:2]
+                    j1, j2 = (int(two[0]), int(two[1])) if w[two[0]] <= w[two[1]] else (int(two[1]), int(two[0]))
+                    inc = float(w[j2] - w[j1]) + eps
+                else:
+                    j1 = 0
+                    inc = eps
+                prices[j1] += inc
+                prev = int(row_of[j1])
+                if prev >= 0:
+                    col_of[prev] = -1
+                    free.append(prev)
+                row_of[j1] = i
+                col_of[i] = j1
+            lower = max(lower, float((P + prices).min(axis=1).sum() - prices.sum()))
+            if timed_out:
+                rows = np.flatnonzero(col_of < 0)
+                cols = np.flatnonzero(row_of < 0)
+                if len(rows):
+                    sub = self._greedy(P[np.ix_(rows, cols)])
+                    col_of[rows] = cols[sub]
+            total = float(P[np.arange(size), col_of].sum())
+            if total < best_cost:
+                best_cost = total
+                best = col_of
+            if timed_out or best_cost - lower <= 1e-9 or eps <= eps_min:
+                break
+            eps = max(eps / 5.0, eps_min)
+        pairs = [(i, int(best[i])) for i in range(n) if int(best[i]) < m]
+        return pairs, {"gap_bound": max(0.0, best_cost - lower), "timed_out": timed_out}
+
+    def _solve(self, M, deadline=None):
+        """按配置选择精确（匈牙利）或快速（拍卖）求解，并记录求解统计"""
+        solver = self.config.get("solver") or {}
+        if solver.get("mode") == "fast":
+            pairs, info = self._auction(M, deadline)
+        else:
+            pairs, info = self._hungarian(M), {"gap_bound": 0.0, "timed_out": False}
+        info["size"] = [len(M), len(M[0]) if M else 0]
+        self.solver_stats.append(info)
+        return pairs
+
     def _bucket(self, elements, zone):
         """按页面区域过滤元素（header/body/footer）"""
         return [e for e in elements if (e.get("topology", {}).get("zone") or "") == zone]
 
-    def _y_offset(self, A, B):
+    def _y_offset(self, A, B, fa=None, fb=None):
         """估计 A 与 B 在 Y 方向的平均偏移量"""
         if not A or not B:
             return 0.0
-        ya = sum(self._center(a)[1] for a in A) / len(A)
-        yb = sum(self._center(b)[1] for b in B) / len(B)
+        ya = sum(f[1] for f in fa) / len(A) if fa is not None else sum(self._center(a)[1] for a in A) / len(A)
+        yb = sum(f[1] for f in fb) / len(B) if fb is not None else sum(self._center(b)[1] for b in B) / len(B)
         return ya - yb
 
-    def match_bucket(self, A, B):
+    def prepare(self, graph):
+        """预计算语义图的分区与匹配特征
+
+        同一张设计图需要与多份运行时图比较时，只需计算一次，
+        结果可传给 run(design_prepared=...) 复用。
+
+        返回:
+        - dict: zone -> {"elements": 元素列表, "features": 特征元组列表}
+        """
+        out = {}
+        for z in ("header", "body", "footer"):
+            els = self._bucket(graph.get("elements", []), z)
+            out[z] = {"elements": els, "features": [self._features(e) for e in els]}
+        return out
+
+    def match_bucket(self, A, B, fa=None, fb=None, deadline=None):
         """对同一区域的两组元素进行匹配，返回三元组
 
+        参数:
+        - fa / fb: 可选的预计算特征列表
+        - deadline: 可选，快速模式下的求解截止时刻（time.perf_counter）
+
         返回:
         - matched: 匹配对列表，每项包含 design/runtime/cost
         - missing: 设计中缺失的元素列表
@@ -229,9 +329,11 @@ class UIFuzzyMatcher:
             return [], A, B
         if not B:
             return [], A, B
-        yoff = self._y_offset(A, B)
-        M = self._compute_cost_matrix(A, B, yoff)
-        pairs = self._hungarian(M)
+        fa = fa if fa is not None else [self._features(a) for a in A]
+        fb = fb if fb is not None else [self._features(b) for b in B]
+        yoff = self._y_offset(A, B, fa, fb)
+        M = self._compute_cost_matrix(A, B, yoff, fa, fb)
+        pairs = self._solve(M, deadline)
         cutoff = float(self.config["thresholds"]["match_cutoff"])
         matched = []
         mi = set()
@@ -246,15 +348,68 @@ class UIFuzzyMatcher:
         added = [B[j] for j in range(len(B)) if j not in mj]
         return matched, missing, added
 
-    def run(self, design_graph, runtime_graph):
-        """对完整语义图进行分区匹配并汇总结果"""
+    def carry_forward(self, A, B, grid=0.01):
+        """为未变化区域的元素直接沿用匹配关系
+
+        不构建成本矩阵，仅按 (类型, 量化后的相对框) 做哈希配对，
+        配对结果以成本 0 标记为 carried。
+
+        返回:
+        - matched: 沿用的匹配对列表
+        - rest_a / rest_b: 未能配对的元素，调用方应与活跃元素一起交给 run 完整匹配
+        """
+        def key(node):
+            x1, y1, x2, y2 = self._rel(node)
+            label = (node.get("type", {}).get("label") or "").lower()
+            return (label, round(x1 / grid), round(y1 / grid), round(x2 / grid), round(y2 / grid))
+        pool = {}
+        for b in B:
+            pool.setdefault(key(b), []).append(b)
+        matched = []
+        rest_a = []
+        for a in A:
+            cands = pool.get(key(a))
+            if cands:
+                matched.append({"design": a, "runtime": cands.pop(0), "cost": 0.0, "carried": True})
+            else:
+                rest_a.append(a)
+        used = set(id(m["runtime"]) for m in matched)
+        rest_b = [b for b in B if id(b) not in used]
+        return matched, rest_a, rest_b
+
+    def run(self, design_graph, runtime_graph, design_prepared=None):
+        """对完整语义图进行分区匹配并汇总结果
+
+        参数:
+        - design_prepared: 可选，prepare(design_graph) 的结果，用于复用设计端特征
+        """
         res = {"matches": [], "missing": [], "added": []}
+        solver = self.config.get("solver") or {}
+        budget = solver.get("time_budget_ms")
+        deadline = time.perf_counter() + float(budget) / 1000.0 if budget else None
+        self.solver_stats = []
+        prepared = design_prepared or self.prepare(design_graph)
         zones = ["header", "body", "footer"]
+        buckets = []
         for z in zones:
-            da = self._bucket(design_graph.get("elements", []), z)
             rb = self._bucket(runtime_graph.get("elements", []), z)
-            m, miss, add = self.match_bucket(da, rb)
+            buckets.append((prepared[z]["elements"], prepared[z]["features"], rb))
+        par = self.config.get("parallel") or {}
+        cells = sum(len(a) * len(b) for a, _, b in buckets)
+        if int(par.get("workers") or 0) > 1 and cells >= int(par.get("min_cells") or 0):
+            from parallel_match import match_buckets_parallel
+            triples = match_buckets_parallel(self, [(a, fa, b, [self._features(x) for x in b]) for a, fa, b in buckets], deadline)
+        else:
+            triples = [self.match_bucket(a, b, fa, deadline=deadline) for a, fa, b in buckets]
+        for m, miss, add in triples:
             res["matches"].extend(m)
             res["missing"].extend(miss)
             res["added"].extend(add)
+        if solver.get("mode") == "fast":
+            res["solver"] = {
+                "mode": "fast",
+                "time_budget_ms": budget,
+                "gap_bound": round(sum(s["gap_bound"] for s in self.solver_stats), 6),
+                "timed_out": any(s["timed_out"] for s in self.solver_stats),
+            }
         return res
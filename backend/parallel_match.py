@@ -0,0 +1,336 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from matcher import UIFuzzyMatcher
+
+_POOL = None
+_POOL_SIZE = 0
+_POOL_PID = None
+_POOL_LOCK = threading.Lock()
+_WORKER_CACHE = {}
+
+
+def _after_fork_in_child():
+    """fork 出的子进程不能使用父进程的进程池，丢弃引用（不关闭，池归父进程所有）"""
+    global _POOL, _POOL_SIZE, _POOL_PID, _POOL_LOCK
+    _POOL, _POOL_SIZE, _POOL_PID = None, 0, None
+    _POOL_LOCK = threading.Lock()
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+def pool_size():
+    """进程级共享进程池的进程数：UI_COMPARE_MATCH_WORKERS（大于 0 时），否则为 CPU 核数"""
+    try:
+        n = int(os.getenv("UI_COMPARE_MATCH_WORKERS") or 0)
+    except ValueError:
+        n = 0
+    return n if n > 0 else (os.cpu_count() or 1)
+
+def parse_workers(value):
+    """解析请求中的 workers：缺省返回 None，其余限制在 [1, CPU 核数]
+
+    异常:
+    - ValueError: 不是整数
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"workers must be an integer, got {value!r}")
+    try:
+        n = int(value)
+    except ValueError:
+        raise ValueError(f"workers must be an integer, got {value!r}")
+    return max(1, min(n, os.cpu_count() or 1))
+
+def get_pool():
+    """获取（必要时创建）进程级共享的进程池，跨请求复用
+
+    进程数在创建时按 pool_size() 确定一次，之后不再调整：请求的并行度不会重建进程池，
+    也就不会关闭其他请求仍在提交任务的进程池（进程池只在 shutdown_pool 时关闭）。
+    工作进程经 forkserver 启动，不从多线程的服务进程直接 fork；
+    进程池属于创建它的进程，fork 出的子进程（如预加载后 fork 的 WSGI worker）会重新创建。
+    """
+    global _POOL, _POOL_SIZE, _POOL_PID
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_PID != os.getpid():
+            _POOL_SIZE = pool_size()
+            _POOL = ProcessPoolExecutor(max_workers=_POOL_SIZE, mp_context=multiprocessing.get_context("forkserver"))
+            _POOL_PID = os.getpid()
+        return _POOL
+
+def shutdown_pool(wait=True):
+    """关闭进程级共享的进程池（应用退出时调用），之后的 get_pool 会重新创建"""
+    global _POOL, _POOL_SIZE, _POOL_PID
+    with _POOL_LOCK:
+        pool, owned = _POOL, _POOL_PID == os.getpid()
+        _POOL, _POOL_SIZE, _POOL_PID = None, 0, None
+    if pool is not None and owned:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+def _attach(name):
+    """在工作进程中挂载共享内存段
+
+    工作进程与主进程共用同一个 resource_tracker（按段名去重），
+    段的释放统一由创建方 unlink 完成。
+    """
+    return shared_memory.SharedMemory(name=name)
+
+
+class SharedArrays:
+    """在单个共享内存段中按偏移布局多个 numpy 数组
+
+    spec 为可序列化的 {名称: (偏移, dtype, shape)}，连同段名传给工作进程，
+    工作进程据此以零拷贝视图访问数据。
+    """
+    def __init__(self, arrays):
+        """按给定数组创建共享内存段并拷贝数据
+
+        参数:
+        - arrays: {名称: numpy 数组}
+        """
+        spec = {}
+        offset = 0
+        for key, arr in arrays.items():
+            offset = (offset + 7) // 8 * 8
+            spec[key] = (offset, arr.dtype.str, arr.shape)
+            offset += arr.nbytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 8))
+        self.spec = spec
+        for key, arr in arrays.items():
+            self.view(key)[...] = arr
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def view(self, key):
+        """返回指定数组的视图"""
+        return view_of(self.shm, self.spec, key)
+
+    def close(self):
+        """释放共享内存段"""
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+def view_of(shm, spec, key):
+    """按 spec 在共享内存段上构造数组视图"""
+    offset, dtype, shape = spec[key]
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+
+def pack_features(features, labels):
+    """将特征元组列表打包为数值数组
+
+    文本按码点拼接为一维缓冲区，toff[i]:toff[i+1] 为第 i 个元素的文本，
+    内存与文本总长度成正比，不受最长文本影响。
+
+    参数:
+    - features: UIFuzzyMatcher._features 生成的元组列表
+    - labels: 标签词表（列表，就地追加新标签）
+
+    返回:
+    - dict: num(n×7 float64)、label(n int32)、toff(n+1 int64 偏移)、text(总长 int32 码点)
+    """
+    n = len(features)
+    index = {lb: k for k, lb in enumerate(labels)}
+    num = np.zeros((n, 7), dtype=np.float64)
+    lab = np.zeros(n, dtype=np.int32)
+    toff = np.zeros(n + 1, dtype=np.int64)
+    for i, f in enumerate(features):
+        num[i] = f[:7]
+        if f[8] not in index:
+            index[f[8]] = len(labels)
+            labels.append(f[8])
+        lab[i] = index[f[8]]
+        toff[i + 1] = toff[i] + len(f[7])
+    joined = "".join(f[7] for f in features)
+    text = np.frombuffer(joined.encode("utf-32-le"), dtype=np.int32) if joined else np.zeros(0, dtype=np.int32)
+    return {"num": num, "label": lab, "toff": toff, "text": text}
+
+def unpack_features(num, lab, toff, text, labels, start, stop):
+    """从数值数组还原 [start, stop) 范围内的特征元组"""
+    out = []
+    for i in range(start, stop):
+        t = text[toff[i]:toff[i + 1]].tobytes().decode("utf-32-le")
+        out.append(tuple(num[i].tolist()) + (t, labels[lab[i]]))
+    return out
+
+def _worker_matcher(config):
+    """工作进程内按配置缓存匹配器实例"""
+    key = repr(config)
+    m = _WORKER_CACHE.get(("matcher", key))
+    if m is None:
+        m = UIFuzzyMatcher(config)
+        _WORKER_CACHE[("matcher", key)] = m
+    return m
+
+def _worker_features(side, labels, start, stop):
+    """工作进程内读取某一侧指定范围的特征（按段名缓存，段名变化即失效）"""
+    name, spec = side
+    key = ("features", name, start, stop)
+    feats = _WORKER_CACHE.get(key)
+    if feats is None:
+        for k in [k for k in _WORKER_CACHE if k[0] == "features" and k[1] != name]:
+            del _WORKER_CACHE[k]
+        shm = _attach(name)
+        try:
+            feats = unpack_features(
+                view_of(shm, spec, "num"), view_of(shm, spec, "label"),
+                view_of(shm, spec, "toff"), view_of(shm, spec, "text"),
+                labels, start, stop,
+            )
+        finally:
+            shm.close()
+        _WORKER_CACHE[key] = feats
+    return feats
+
+def _cost_block_task(config, labels, design, runtime, out, zone, a_range, b_range, rows, y_offset):
+    """工作进程任务：计算成本矩阵的一个行块，直接写入共享输出矩阵"""
+    matcher = _worker_matcher(config)
+    fa = _worker_features(design, labels, a_range[0], a_range[1])
+    fb = _worker_features(runtime, labels, b_range[0], b_range[1])
+    shm = _attach(out[0])
+    try:
+        M = view_of(shm, out[1], zone)
+        cost = matcher._pair_cost
+        for i in range(rows[0], rows[1]):
+            fi = fa[i]
+            M[i] = [cost(fi, fj, y_offset) for fj in fb]
+        del M
+    finally:
+        shm.close()
+    return rows
+
+def _solve_task(config, out, zone, row_idx, col_idx, budget_s):
+    """工作进程任务：求解成本子矩阵的分配，返回全局下标对与求解统计"""
+    matcher = _worker_matcher(config)
+    shm = _attach(out[0])
+    try:
+        M = view_of(shm, out[1], zone)
+        sub = M[np.ix_(row_idx, col_idx)].tolist()
+        del M
+    finally:
+        shm.close()
+    matcher.solver_stats = []
+    deadline = time.perf_counter() + budget_s if budget_s is not None else None
+    pairs = matcher._solve(sub, deadline)
+    return [(int(row_idx[i]), int(col_idx[j])) for i, j in pairs], matcher.solver_stats[-1]
+
+def _components(feasible):
+    """求二分可行图（成本不超过阈值的边）的连通分量
+
+    返回:
+    - list[tuple]: (行下标数组, 列下标数组)，按最小行下标排序；孤立行/列不在其中
+    """
+    n, m = feasible.shape
+    parent = list(range(n + m))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    rows, cols = np.nonzero(feasible)
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        a = find(i)
+        b = find(n + j)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+    groups = {}
+    for i in sorted(set(rows.tolist())):
+        groups.setdefault(find(i), ([], []))[0].append(i)
+    for j in sorted(set(cols.tolist())):
+        groups.setdefault(find(n + j), ([], []))[1].append(j)
+    return [(np.array(r, dtype=np.int64), np.array(c, dtype=np.int64)) for _, (r, c) in sorted(groups.items(), key=lambda g: g[1][0][0])]
+
+def match_buckets_parallel(matcher, buckets, deadline=None):
+    """在进程池上并行完成各分区的成本矩阵构建与分配求解
+
+    - 元素特征打包进共享内存，工作进程按行块计算成本并写入共享成本矩阵；
+    - 每个分区作为独立任务求解；超过 split_min_cells 的大分区按
+      “成本不超过 match_cutoff 的边”拆分为连通分量分别求解
+      （跨分量的配对必然超过阈值，在串行流程中同样会被丢弃）；
+    - 结果按分区顺序、列下标顺序合并，与进程调度无关。
+
+    参数:
+    - matcher: UIFuzzyMatcher 实例（提供配置与统计）
+    - buckets: [(A, fa, B, fb)]，按分区顺序
+    - deadline: 可选，time.perf_counter() 截止时刻（快速模式）
+
+    返回:
+    - list[tuple]: 与 buckets 一一对应的 (matched, missing, added)
+    """
+    par = matcher.config.get("parallel") or {}
+    block_rows = max(1, int(par.get("block_rows") or 64))
+    split_min = int(par.get("split_min_cells") or 40000)
+    config = {k: v for k, v in matcher.config.items() if k != "parallel"}
+    cutoff = float(matcher.config["thresholds"]["match_cutoff"])
+    labels = []
+    fa_all = []
+    fb_all = []
+    ranges = []
+    for A, fa, B, fb in buckets:
+        ranges.append(((len(fa_all), len(fa_all) + len(fa)), (len(fb_all), len(fb_all) + len(fb))))
+        fa_all.extend(fa)
+        fb_all.extend(fb)
+    active = [z for z, (A, fa, B, fb) in enumerate(buckets) if A and B]
+    design = SharedArrays(pack_features(fa_all, labels))
+    runtime = SharedArrays(pack_features(fb_all, labels))
+    out = SharedArrays({str(z): np.zeros((len(buckets[z][0]), len(buckets[z][2])), dtype=np.float64) for z in active})
+    results = []
+    try:
+        pool = get_pool()
+        futures = []
+        for z in active:
+            A, fa, B, fb = buckets[z]
+            yoff = matcher._y_offset(A, B, fa, fb)
+            for r in range(0, len(A), block_rows):
+                futures.append(pool.submit(
+                    _cost_block_task, config, labels, (design.name, design.spec), (runtime.name, runtime.spec),
+                    (out.name, out.spec), str(z), ranges[z][0], ranges[z][1], (r, min(r + block_rows, len(A))), yoff,
+                ))
+        for f in futures:
+            f.result()
+        solves = []
+        for z in active:
+            n, m = len(buckets[z][0]), len(buckets[z][2])
+            if n * m >= split_min:
+                blocks = _components(out.view(str(z)) <= cutoff)
+            else:
+                blocks = [(np.arange(n, dtype=np.int64), np.arange(m, dtype=np.int64))]
+            for rows, cols in blocks:
+                budget_s = max(0.0, deadline - time.perf_counter()) if deadline is not None else None
+                solves.append((z, pool.submit(_solve_task, config, (out.name, out.spec), str(z), rows, cols, budget_s)))
+        pairs_by_zone = {z: [] for z in active}
+        for z, f in solves:
+            pairs, info = f.result()
+            pairs_by_zone[z].extend(pairs)
+            matcher.solver_stats.append(info)
+        for z, (A, fa, B, fb) in enumerate(buckets):
+            if z not in pairs_by_zone:
+                results.append(([], A, B))
+                continue
+            M = out.view(str(z)).copy()
+            matched = []
+            mi = set()
+            mj = set()
+            for i, j in sorted(pairs_by_zone[z], key=lambda p: (p[1], p[0])):
+                c = float(M[i, j])
+                if c <= cutoff:
+                    matched.append({"design": A[i], "runtime": B[j], "cost": c})
+                    mi.add(i)
+                    mj.add(j)
+            results.append((matched, [A[i] for i in range(len(A)) if i not in mi], [B[j] for j in range(len(B)) if j not in mj]))
+    finally:
+        design.close()
+        runtime.close()
+        out.close()
+    return results
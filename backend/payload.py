@@ -0,0 +1,121 @@
+import os
+import zlib
+
+try:
+    import zstandard
+except Exception:
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+CHUNK_SIZE = 1 << 16
+
+
+class PayloadTooLarge(ValueError):
+    """请求体（解压后）超过大小上限"""
+
+
+class UnsupportedEncoding(ValueError):
+    """不支持的内容编码（或缺少对应的解压依赖）"""
+
+
+class InvalidPayload(ValueError):
+    """请求体无法解析：压缩数据截断/损坏，或解析结果不是对象"""
+
+
+def max_payload_bytes():
+    """请求体大小上限（解压后字节数），读取 UI_COMPARE_MAX_BODY_BYTES，默认 64 MiB"""
+    try:
+        return int(float(os.getenv("UI_COMPARE_MAX_BODY_BYTES") or 64 * 1024 * 1024))
+    except ValueError:
+        return 64 * 1024 * 1024
+
+def sniff_encoding(head):
+    """按魔数识别压缩格式，返回 "gzip"/"zstd"/None"""
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+class _PrefixedStream:
+    """把已读出的魔数拼回流首部"""
+    def __init__(self, prefix, inner):
+        self.prefix = prefix
+        self.inner = inner
+
+    def read(self, n=-1):
+        if self.prefix:
+            out, self.prefix = self.prefix, b""
+            return out
+        return self.inner.read(n)
+
+
+def _read_limited(reader, limit):
+    """分块读取至 EOF，超过上限立即中止"""
+    buf = bytearray()
+    while True:
+        chunk = reader.read(CHUNK_SIZE)
+        if not chunk:
+            return bytes(buf)
+        buf += chunk
+        if len(buf) > limit:
+            raise PayloadTooLarge(f"payload exceeds {limit} bytes")
+
+def read_stream(stream, encoding=None, limit=None):
+    """从输入流分块读取并解压，返回解压后的字节
+
+    解压与读取交替进行，内存中只保留解压结果；解压后大小超过上限时立即中止，
+    可防御压缩炸弹。
+
+    参数:
+    - stream: 具有 read(n) 的文件对象（如 request.stream、上传文件流）
+    - encoding: "gzip"/"zstd"/"identity"/None；None 时按魔数自动识别
+    - limit: 解压后字节上限，默认 max_payload_bytes()
+
+    异常:
+    - PayloadTooLarge: 解压后超过上限
+    - UnsupportedEncoding: 不支持的编码
+    - InvalidPayload: 压缩数据截断或损坏
+    """
+    limit = max_payload_bytes() if limit is None else limit
+    encoding = (encoding or "").strip().lower() or None
+    head = b""
+    if encoding is None:
+        head = stream.read(4)
+        encoding = sniff_encoding(head) or "identity"
+    if encoding in ("identity", ""):
+        first = head
+        rest = _read_limited(stream, limit - len(first))
+        return first + rest
+    if encoding in ("gzip", "x-gzip"):
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        out = bytearray()
+        chunk = head or stream.read(CHUNK_SIZE)
+        try:
+            while chunk:
+                out += d.decompress(chunk, limit + 1 - len(out))
+                if len(out) > limit:
+                    raise PayloadTooLarge(f"payload exceeds {limit} bytes")
+                while d.unconsumed_tail:
+                    out += d.decompress(d.unconsumed_tail, limit + 1 - len(out))
+                    if len(out) > limit:
+                        raise PayloadTooLarge(f"payload exceeds {limit} bytes")
+                if d.eof:
+                    break
+                chunk = stream.read(CHUNK_SIZE)
+        except zlib.error as e:
+            raise InvalidPayload(f"corrupt gzip payload: {e}")
+        if not d.eof:
+            raise InvalidPayload("truncated gzip payload")
+        return bytes(out)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise UnsupportedEncoding("zstd payloads require the zstandard package")
+        reader = zstandard.ZstdDecompressor().stream_reader(_PrefixedStream(head, stream))
+        try:
+            return _read_limited(reader, limit)
+        except zstandard.ZstdError as e:
+            raise InvalidPayload(f"corrupt zstd payload: {e}")
+    raise UnsupportedEncoding(f"unsupported content encoding: {encoding}")
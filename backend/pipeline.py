@@ -0,0 +1,207 @@
+import os
+import pickle
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from semantic_graph import UISemanticBuilder, collapse_wrapper_chains
+from matcher import UIFuzzyMatcher
+from differ import UISemanticDiffer
+from visibility import VisibilityPruner
+from parallel_match import SharedArrays, get_pool
+from extractor import (
+    is_enhanced_schema,
+    extract_raw_detections_from_list,
+    extract_raw_detections_from_tree,
+    infer_resolution_from_graph_or_boxes,
+    pair_partitions,
+    partition_windows,
+)
+
+
+def build_semantic_graph(data, source_type, prune=True, collapse=False):
+    """将原始/增强输入规范化为语义图
+
+    参数:
+    - data: 已解析的输入（列表、树或增强语义图）
+    - source_type: "design" 或 "runtime"
+    - prune: 树形输入时是否先裁剪不可见/被遮挡节点，统计写入 meta.pruned
+    - collapse: 是否合并边界相同的单子节点包装链（见 collapse_wrapper_chains）
+
+    返回:
+    - dict: 语义图（meta/elements）
+    """
+    if is_enhanced_schema(data):
+        graph = data
+    elif isinstance(data, list):
+        raw = extract_raw_detections_from_list(data)
+        w, h = infer_resolution_from_graph_or_boxes(data, raw)
+        graph = UISemanticBuilder(w, h, source_type).build(raw)
+    else:
+        stats = None
+        tree = data
+        if prune:
+            tree, stats = VisibilityPruner().prune(data)
+        raw = extract_raw_detections_from_tree(tree)
+        w, h = infer_resolution_from_graph_or_boxes(data, raw)
+        graph = UISemanticBuilder(w, h, source_type).build(raw)
+        if stats is not None:
+            graph.setdefault("meta", {})["pruned"] = stats
+    if collapse:
+        graph = collapse_wrapper_chains(graph)
+    return graph
+
+_MATRIX_STATE = {}
+
+def _compare_device(design_graph, design_prepared, device_id, code_data):
+    """比较单台设备的运行时数据"""
+    runtime_graph = build_semantic_graph(code_data, "runtime")
+    matching = UIFuzzyMatcher().run(design_graph, runtime_graph, design_prepared)
+    report = UISemanticDiffer().analyze(matching, design_graph.get("meta"), runtime_graph.get("meta"))
+    return {
+        "device_id": device_id,
+        "resolution": runtime_graph.get("meta", {}).get("resolution"),
+        "matched": len(matching.get("matches", [])),
+        "missing": len(matching.get("missing", [])),
+        "added": len(matching.get("added", [])),
+        "issues": report.get("issues", []),
+    }
+
+def _compare_device_task(design_ref, device_id, code_data):
+    """工作进程任务：设计图与预计算特征从共享内存段读取，按段名缓存，每个进程每次请求只反序列化一次"""
+    name, size = design_ref
+    if _MATRIX_STATE.get("name") != name:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            design_graph, design_prepared = pickle.loads(bytes(shm.buf[:size]))
+        finally:
+            shm.close()
+        _MATRIX_STATE.update(name=name, design_graph=design_graph, design_prepared=design_prepared)
+    return _compare_device(_MATRIX_STATE["design_graph"], _MATRIX_STATE["design_prepared"], device_id, code_data)
+
+def compare_device_matrix(design_data, devices, workers=None):
+    """一份设计对比多台设备的运行时数据
+
+    设计图只规范化一次并预计算匹配特征，序列化后放入共享内存段，
+    各任务只携带段名；任务在进程级共享的进程池（parallel_match.get_pool）上执行，
+    不为每次请求新建进程。每台设备仅构建自身的运行时图并完成匹配与差异分析。
+
+    参数:
+    - design_data: 设计端输入（已解析）
+    - devices: [{"device_id": str, "code_json": 已解析的运行时输入}]，device_id 不可重复
+    - workers: 并行度，默认不超过设备数与 CPU 核数；大于 1 时在共享进程池上执行
+      （实际进程数由进程池大小决定，见 parallel_match.pool_size）
+
+    返回:
+    - dict: design 元信息、按设备的问题矩阵与所有设备共有的问题
+
+    异常:
+    - ValueError: device_id 重复
+    """
+    ids = [str(d.get("device_id") or f"device_{i}") for i, d in enumerate(devices)]
+    dup = sorted(set(i for i in ids if ids.count(i) > 1))
+    if dup:
+        raise ValueError(f"duplicate device_id: {', '.join(dup)}")
+    design_graph = build_semantic_graph(design_data, "design")
+    design_prepared = UIFuzzyMatcher().prepare(design_graph)
+    workers = workers or min(len(devices), os.cpu_count() or 1)
+    results = []
+    if workers <= 1 or len(devices) <= 1:
+        results = [_compare_device(design_graph, design_prepared, i, d.get("code_json")) for i, d in zip(ids, devices)]
+    elif devices:
+        blob = pickle.dumps((design_graph, design_prepared), protocol=pickle.HIGHEST_PROTOCOL)
+        shared = SharedArrays({"design": np.frombuffer(blob, dtype=np.uint8)})
+        try:
+            pool = get_pool()
+            futures = [pool.submit(_compare_device_task, (shared.name, len(blob)), i, d.get("code_json")) for i, d in zip(ids, devices)]
+            results = [f.result() for f in futures]
+        finally:
+            shared.close()
+    common = None
+    for res in results:
+        keys = set((it.get("type"), it.get("node_id")) for it in res["issues"])
+        common = keys if common is None else common & keys
+    common_issues = []
+    if results and common:
+        for it in results[0]["issues"]:
+            if (it.get("type"), it.get("node_id")) in common:
+                common_issues.append({"type": it.get("type"), "node_id": it.get("node_id"), "widget_role": it.get("widget_role"), "severity": it.get("severity")})
+    return {
+        "design": design_graph.get("meta"),
+        "devices": {res["device_id"]: res for res in results},
+        "common_issues": common_issues,
+    }
+
+def _split_pages(data, prune):
+    """裁剪（整棵树上进行，跨窗口遮挡同样生效）后按窗口拆分
+
+    列表与增强语义图输入不拆分，作为单个 "default" 分区。
+
+    返回:
+    - tuple: (分区列表, 裁剪统计或 None)
+    """
+    if is_enhanced_schema(data) or isinstance(data, list):
+        return [{"key": "default", "window_id": None, "bundle_name": None, "ability_name": None, "page_path": None, "tree": data}], None
+    stats = None
+    if prune:
+        data, stats = VisibilityPruner().prune(data)
+    return partition_windows(data), stats
+
+def _compare_page(key, design_tree, runtime_tree, collapse):
+    """在工作进程中比较一对分区"""
+    design_graph = build_semantic_graph(design_tree, "design", False, collapse)
+    runtime_graph = build_semantic_graph(runtime_tree, "runtime", False, collapse)
+    matching = UIFuzzyMatcher().run(design_graph, runtime_graph)
+    report = UISemanticDiffer().analyze(matching, design_graph.get("meta"), runtime_graph.get("meta"))
+    return {
+        "key": key,
+        "report_id": report.get("report_id"),
+        "resolution": {"design": design_graph.get("meta", {}).get("resolution"), "runtime": runtime_graph.get("meta", {}).get("resolution")},
+        "design_nodes": design_graph.get("meta", {}).get("node_count", 0),
+        "runtime_nodes": runtime_graph.get("meta", {}).get("node_count", 0),
+        "matched": len(matching.get("matches", [])),
+        "missing": len(matching.get("missing", [])),
+        "added": len(matching.get("added", [])),
+        "issues": report.get("issues", []),
+    }
+
+def compare_pages(design_data, code_data, workers=None, prune=True, collapse=False):
+    """按窗口/页面拆分后逐对比较
+
+    一份转储可能同时包含状态栏、弹窗与页面本身等多个窗口。两侧先按
+    partition_windows 拆分并按分区键配对，每对分区独立构建语义图、
+    匹配与差异分析（分辨率按分区各自推断），多对分区在进程级共享的进程池
+    （parallel_match.get_pool，forkserver 启动）上并行，跨窗口的节点不会进入同一个代价矩阵。
+
+    参数:
+    - design_data / code_data: 已解析的设计端与运行时输入
+    - workers: 并行度，默认不超过分区对数与 CPU 核数；大于 1 时在共享进程池上执行
+    - prune: 是否先裁剪不可见/被遮挡节点
+    - collapse: 是否合并包装链
+
+    返回:
+    - dict: pages（分区键 -> 比较结果与窗口信息）、unpaired（未配对的分区键）、pruned（裁剪统计）
+    """
+    design_parts, design_stats = _split_pages(design_data, prune)
+    runtime_parts, runtime_stats = _split_pages(code_data, prune)
+    pairs, design_only, runtime_only = pair_partitions(design_parts, runtime_parts)
+    keys = [d["key"] for d, _ in pairs]
+    workers = workers or min(len(pairs), os.cpu_count() or 1)
+    if workers <= 1 or len(pairs) <= 1:
+        results = [_compare_page(k, d["tree"], r["tree"], collapse) for k, (d, r) in zip(keys, pairs)]
+    else:
+        pool = get_pool()
+        futures = [pool.submit(_compare_page, k, d["tree"], r["tree"], collapse) for k, (d, r) in zip(keys, pairs)]
+        results = [f.result() for f in futures]
+    pages = {}
+    for (d, r), res in zip(pairs, results):
+        res["window"] = {
+            f: {"design": d.get(f), "runtime": r.get(f)}
+            for f in ("window_id", "bundle_name", "ability_name", "page_path")
+        }
+        pages[res["key"]] = res
+    return {
+        "pages": pages,
+        "unpaired": {"design": design_only, "runtime": runtime_only},
+        "pruned": {"design": design_stats, "runtime": runtime_stats},
+    }
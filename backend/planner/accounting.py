@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+def estimate_tokens(obj: Any) -> int:
+    """按约 3 字符/token 估算 token 数（与批量切分的估算口径一致）"""
+    if obj is None:
+        return 0
+    text = obj if isinstance(obj, str) else json.dumps(obj, ensure_ascii=False, default=str)
+    return len(text) // 3 + 1 if text else 0
+
+def usage_of(result: Any) -> Optional[Dict[str, int]]:
+    """从模型返回值中读取真实用量，不可得时返回 None
+
+    兼容 langchain 消息的 usage_metadata（input_tokens/output_tokens）
+    与 response_metadata["token_usage"]（prompt_tokens/completion_tokens）。
+    """
+    meta = getattr(result, "usage_metadata", None)
+    if isinstance(meta, dict) and "input_tokens" in meta:
+        return {"prompt_tokens": int(meta.get("input_tokens") or 0), "completion_tokens": int(meta.get("output_tokens") or 0)}
+    rmeta = getattr(result, "response_metadata", None)
+    usage = rmeta.get("token_usage") if isinstance(rmeta, dict) else None
+    if isinstance(usage, dict) and "prompt_tokens" in usage:
+        return {"prompt_tokens": int(usage.get("prompt_tokens") or 0), "completion_tokens": int(usage.get("completion_tokens") or 0)}
+    return None
+
+
+class PlannerLedger:
+    """规划器调用台账
+
+    记录两类数据：
+    - calls: 每次模型调用的类型（batch/single）、耗时、prompt/completion token
+      （模型未返回用量时按字符数估算并标记 estimated）、结果
+      （ok/partial/parse_error/empty/timeout/deadline/error）与错误信息；
+      熔断、截止时间或后台调用过多而未发起的调用不计入；
+    - issues: 每条问题最终蓝图的来源（batch/single/fallback）与回退原因
+      （含 circuit_open/deadline/saturated 等未发起调用的原因）。
+    线程安全，一个规划器实例对应一次报告。
+    """
+    def __init__(self, model: Optional[str] = None):
+        self.model = model
+        self.calls: List[Dict[str, Any]] = []
+        self.issues: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def start_call(self, kind: str, prompt: Any, issue_types: List[str]) -> Dict[str, Any]:
+        """开始记录一次调用，返回记录（由 finish_call 补全）"""
+        return {
+            "kind": kind,
+            "model": self.model,
+            "issue_types": sorted(set(t or "UNKNOWN" for t in issue_types)),
+            "issue_count": len(issue_types),
+            "outcome": None,
+            "error": None,
+            "prompt_tokens": estimate_tokens(prompt),
+            "completion_tokens": 0,
+            "estimated": True,
+            "duration_ms": 0.0,
+            "_t": time.perf_counter(),
+        }
+
+    def finish_call(self, rec: Dict[str, Any], outcome: str, result: Any = None, error: Optional[BaseException] = None):
+        """补全调用记录并写入台账"""
+        rec["duration_ms"] = round((time.perf_counter() - rec.pop("_t")) * 1000.0, 2)
+        rec["outcome"] = outcome
+        if error is not None:
+            rec["error"] = f"{type(error).__name__}: {error}"[:300]
+        if result is not None:
+            usage = usage_of(result)
+            if usage is not None:
+                rec.update(usage)
+                rec["estimated"] = False
+            else:
+                content = getattr(result, "content", None)
+                if content is None and isinstance(result, dict):
+                    content = result.get("output")
+                rec["completion_tokens"] = estimate_tokens(content if content is not None else result)
+        with self._lock:
+            self.calls.append(rec)
+
+    def resolve(self, issue: Dict[str, Any], source: str, reason: Optional[str] = None):
+        """记录一条问题的蓝图来源（batch/single/fallback）与回退原因"""
+        with self._lock:
+            self.issues.append({"issue_type": issue.get("type") or "UNKNOWN", "source": source, "fallback_reason": reason})
+
+    def summary(self) -> Dict[str, Any]:
+        """汇总本次规划：调用次数、结果分布、耗时分位数、token 合计、回退率与按问题类型的分布"""
+        with self._lock:
+            calls = list(self.calls)
+            issues = list(self.issues)
+        outcomes: Dict[str, int] = {}
+        for c in calls:
+            outcomes[c["outcome"]] = outcomes.get(c["outcome"], 0) + 1
+        durations = [c["duration_ms"] for c in calls]
+        latency = None
+        if durations:
+            arr = np.asarray(durations, dtype=np.float64)
+            p50, p95 = np.percentile(arr, [50, 95])
+            latency = {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "max": round(float(arr.max()), 2), "total": round(float(arr.sum()), 2)}
+        reasons: Dict[str, int] = {}
+        by_type: Dict[str, Dict[str, int]] = {}
+        for it in issues:
+            row = by_type.setdefault(it["issue_type"], {"issues": 0, "batch": 0, "single": 0, "fallback": 0})
+            row["issues"] += 1
+            row[it["source"]] = row.get(it["source"], 0) + 1
+            if it["source"] == "fallback":
+                key = it["fallback_reason"] or "unknown"
+                reasons[key] = reasons.get(key, 0) + 1
+        fallbacks = sum(reasons.values())
+        return {
+            "model": self.model,
+            "calls": len(calls),
+            "outcomes": outcomes,
+            "latency_ms": latency,
+            "prompt_tokens": sum(c["prompt_tokens"] for c in calls),
+            "completion_tokens": sum(c["completion_tokens"] for c in calls),
+            "tokens_estimated": any(c["estimated"] for c in calls),
+            "issues": len(issues),
+            "fallbacks": fallbacks,
+            "fallback_rate": round(fallbacks / len(issues), 4) if issues else 0.0,
+            "fallback_reasons": reasons,
+            "by_issue_type": by_type,
+        }
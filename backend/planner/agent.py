@@ -1,5 +1,8 @@
+import json
 import os
-from typing import List, Optional
+import random
+import time
+from typing import Any, List, Optional
 
 AGENT_AVAILABLE = True
 HAVE_AGENT_API = True
@@ -27,17 +30,83 @@ def system_prompt_text() -> str:
         "LAYOUT/SIZE 定位样式或组件定义；输出严格为 ModificationBlueprint JSON。"
     )
 
-def make_executor(tools: List, model: Optional[str] = None, temperature: float = 0.0):
-    """创建使用工具的代理执行器
+def batch_system_prompt_text() -> str:
+    """返回批量规划的系统提示词
 
-    参数:
-    - tools: 可用工具列表
-    - model: LLM 模型名称
-    - temperature: 采样温度
+    批量规划直接调用对话模型，不绑定工具：代码搜索由服务端按与代理相同的策略
+    预先执行，结果随每条问题的 search_hits 提供，提示词中不提及工具。
+    """
+    return (
+        "你是资深前端架构师，任务是根据 UI 诊断报告定位需要修改的代码文件。\n"
+        "本次请求包含多条问题：issues[i].context_ref 指向 contexts 中共享的上下文，"
+        "issues[i].search_hits 是服务端已执行的代码搜索结果（\"文件:行号:内容\"，"
+        "TEXT_MISMATCH 按 actual 搜索，MISSING_WIDGET 按 sibling_text 或 parent_role 搜索，其余按组件角色搜索）。\n"
+        "target_file 只能取自 search_hits 中的文件；没有合适结果时 target_file 留空且 confidence 为 low。\n"
+        "请为每条问题各输出一个 ModificationBlueprint，并附带该问题的 index 字段；\n"
+        "最终回答只能是 JSON 数组，不要输出其他文字。"
+    )
 
-    返回:
-    - AgentExecutor 或 None（当依赖不可用时）
+class StubChatModel:
+    """本地桩模型，用于压测与离线演示
+
+    按配置的延迟（含随机抖动）休眠后返回结构合法的蓝图，按错误率随机抛出异常，
+    不发起任何网络请求。同时兼容两种调用形式：
+    - invoke(messages): 批量规划，返回 content 为蓝图数组 JSON 的消息；
+    - invoke({"diagnostic_report": ...}): 代理执行器形式，返回 {"output": 蓝图 JSON}。
+    """
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0):
+        self.latency_ms = float(latency_ms)
+        self.jitter_ms = float(jitter_ms)
+        self.error_rate = float(error_rate)
+
+    def _blueprint(self, issue: Any) -> dict:
+        issue = issue if isinstance(issue, dict) else {}
+        return {
+            "target_file": "",
+            "confidence": "low",
+            "action_type": "MODIFY_TEXT" if issue.get("type") == "TEXT_MISMATCH" else "MODIFY_STYLE",
+            "location_hint": {"component_name": issue.get("widget_role") or "component"},
+            "reasoning": "stub model",
+        }
+
+    def invoke(self, inputs: Any) -> Any:
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(0.0, delay) / 1000.0)
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError("stub model error")
+        if isinstance(inputs, dict):
+            text = str(inputs.get("diagnostic_report") or "")
+            lines = text.splitlines()
+            try:
+                issue = json.loads(lines[1]).get("issue") if len(lines) > 1 else None
+            except ValueError:
+                issue = None
+            return {"output": json.dumps({"plan_id": "plan_stub", "parent_container_path": None, **self._blueprint(issue)})}
+        payload = json.loads(inputs[-1][1])
+        out = [{"index": it.get("index"), **self._blueprint(it.get("issue"))} for it in payload.get("issues", [])]
+        return type("StubMessage", (), {"content": json.dumps(out, ensure_ascii=False)})()
+
+
+def stub_from_env() -> Optional[StubChatModel]:
+    """设置了 LLM_STUB_LATENCY_MS 时返回桩模型（LLM_STUB_JITTER_MS / LLM_STUB_ERROR_RATE 可选）"""
+    latency = os.getenv("LLM_STUB_LATENCY_MS")
+    if latency is None or latency == "":
+        return None
+    try:
+        return StubChatModel(float(latency), float(os.getenv("LLM_STUB_JITTER_MS") or 0), float(os.getenv("LLM_STUB_ERROR_RATE") or 0))
+    except ValueError:
+        return None
+
+def make_chat_model(model: Optional[str] = None, temperature: float = 0.0, timeout: Optional[float] = None):
+    """创建对话模型（不带工具），依赖不可用时返回 None
+
+    参数:
+    - timeout: 可选，HTTP 请求超时秒数，超时后由客户端回收连接
+    设置 LLM_STUB_LATENCY_MS 时返回本地桩模型（见 StubChatModel）。
     """
+    stub = stub_from_env()
+    if stub is not None:
+        return stub
     if not AGENT_AVAILABLE:
         return None
     model = model or os.getenv("LLM_MODEL") or "gpt-4o"
@@ -45,7 +114,25 @@ def make_executor(tools: List, model: Optional[str] = None, temperature: float =
     if base:
         os.environ["OPENAI_BASE_URL"] = base
         os.environ["OPENAI_API_BASE"] = base
-    llm = ChatOpenAI(model=model, temperature=temperature)
+    if timeout is not None:
+        return ChatOpenAI(model=model, temperature=temperature, timeout=timeout, max_retries=0)
+    return ChatOpenAI(model=model, temperature=temperature)
+
+def make_executor(tools: List, model: Optional[str] = None, temperature: float = 0.0, timeout: Optional[float] = None):
+    """创建使用工具的代理执行器
+
+    参数:
+    - tools: 可用工具列表
+    - model: LLM 模型名称
+    - temperature: 采样温度
+    - timeout: 可选，单次 HTTP 请求超时秒数，同时作为代理循环（含工具调用）的 max_execution_time
+
+    返回:
+    - AgentExecutor 或 None（当依赖不可用时）
+    """
+    llm = make_chat_model(model, temperature, timeout)
+    if llm is None or isinstance(llm, StubChatModel):
+        return llm
     prompt = ChatPromptTemplate.from_messages([
         ("system", system_prompt_text()),
         ("user", "{diagnostic_report}"),
@@ -55,6 +142,8 @@ def make_executor(tools: List, model: Optional[str] = None, temperature: float =
         for t in tools:
             lc_tools.append(Tool(name=getattr(t, "__name__", "tool"), description="project helper", func=t))
         agent = create_openai_tools_agent(llm, lc_tools, prompt)
+        if timeout is not None:
+            return AgentExecutor(agent=agent, tools=lc_tools, verbose=False, max_execution_time=timeout)
         return AgentExecutor(agent=agent, tools=lc_tools, verbose=False)
     class SimpleExecutor:
         def __init__(self, llm, prompt):
@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+def env_float(name: str, default: float) -> float:
+    """读取数值型环境变量，非法时返回默认值"""
+    try:
+        return float(os.getenv(name) or default)
+    except ValueError:
+        return float(default)
+
+
+class CallTimeout(TimeoutError):
+    """单次调用超过超时时间"""
+
+
+class CircuitOpen(RuntimeError):
+    """熔断器处于打开状态，调用被直接拒绝"""
+
+
+class DeadlineExceeded(CallTimeout):
+    """请求级截止时间已到，调用未发起即被拒绝"""
+
+
+class CallsSaturated(RuntimeError):
+    """超时后仍在后台运行的调用过多，新的调用被直接拒绝"""
+
+
+class Deadline:
+    """请求级截止时间（基于 time.monotonic）"""
+    def __init__(self, seconds: Optional[float]):
+        """参数:
+        - seconds: 距现在的秒数；None 表示不限时
+        """
+        self.at = None if seconds is None else time.monotonic() + float(seconds)
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数（不小于 0）；不限时返回 None"""
+        if self.at is None:
+            return None
+        return max(0.0, self.at - time.monotonic())
+
+    def expired(self) -> bool:
+        """是否已到期"""
+        return self.at is not None and time.monotonic() >= self.at
+
+
+class CircuitBreaker:
+    """连续失败熔断器
+
+    - closed: 正常放行，连续失败达到阈值后转为 open；
+    - open: 直接拒绝，经过 reset_timeout_s 后转为 half_open；
+    - half_open: 只放行一个探测调用，成功则 closed，失败则重新 open。
+    线程安全，可在多个请求之间共享。
+    """
+    def __init__(self, failure_threshold: int = 3, reset_timeout_s: float = 30.0):
+        """初始化熔断器
+
+        参数:
+        - failure_threshold: 连续失败次数阈值
+        - reset_timeout_s: 打开后进入半开探测前的等待秒数
+        """
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout_s = float(reset_timeout_s)
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """判断当前是否允许发起调用"""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_timeout_s:
+                    return False
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open":
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self):
+        """记录一次成功调用"""
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        """记录一次失败调用（异常或超时）"""
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """结束一次不计成败的调用（如被请求截止时间提前打断），只释放半开探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回当前状态"""
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+def get_breaker(name: str = "llm") -> CircuitBreaker:
+    """获取进程内共享的命名熔断器（阈值与恢复时间读取环境变量）"""
+    with _BREAKERS_LOCK:
+        br = _BREAKERS.get(name)
+        if br is None:
+            br = CircuitBreaker(
+                int(env_float("PLANNER_BREAKER_FAILURES", 3)),
+                env_float("PLANNER_BREAKER_RESET_S", 30),
+            )
+            _BREAKERS[name] = br
+        return br
+
+_ABANDONED = {"count": 0}
+_ABANDONED_LOCK = threading.Lock()
+
+def abandoned_calls() -> int:
+    """返回超时后仍在后台线程中运行的调用数"""
+    with _ABANDONED_LOCK:
+        return _ABANDONED["count"]
+
+def effective_timeout(timeout_s: Optional[float], deadline: Optional[Deadline] = None) -> Optional[float]:
+    """单次调用的实际超时：timeout_s 与截止时间剩余时间中的较小值"""
+    remaining = deadline.remaining() if deadline is not None else None
+    if remaining is None:
+        return timeout_s
+    return remaining if timeout_s is None else min(timeout_s, remaining)
+
+def call_with_timeout(fn: Callable[..., Any], timeout_s: Optional[float], *args, **kwargs) -> Any:
+    """在守护线程中执行调用并限时等待
+
+    超时抛出 CallTimeout；被放弃的调用继续在后台线程中运行直至返回，
+    不会阻塞调用方（底层客户端与执行器自身的超时负责最终回收）。
+    被放弃且尚未结束的调用数计入 abandoned_calls()，供 guarded_call 限流。
+    """
+    if timeout_s is None:
+        return fn(*args, **kwargs)
+    box: Dict[str, Any] = {}
+    done = threading.Event()
+    state = {"abandoned": False}
+
+    def run():
+        try:
+            box["value"] = fn(*args, **kwargs)
+        except BaseException as e:
+            box["error"] = e
+        finally:
+            with _ABANDONED_LOCK:
+                done.set()
+                if state["abandoned"]:
+                    _ABANDONED["count"] -= 1
+
+    threading.Thread(target=run, daemon=True).start()
+    if not done.wait(max(0.0, timeout_s)):
+        with _ABANDONED_LOCK:
+            if not done.is_set():
+                state["abandoned"] = True
+                _ABANDONED["count"] += 1
+                raise CallTimeout(f"call exceeded {timeout_s:.3f}s")
+    if "error" in box:
+        raise box["error"]
+    return box.get("value")
+
+def guarded_call(breaker: CircuitBreaker, fn: Callable[..., Any], timeout_s: Optional[float], deadline: Optional[Deadline] = None, *args, **kwargs) -> Any:
+    """带熔断、单次超时与截止时间的调用
+
+    实际超时取 timeout_s 与截止时间剩余时间中的较小值；
+    熔断打开、截止时间已到或被放弃的后台调用数达到 PLANNER_MAX_ABANDONED（默认 8）时
+    不发起调用，直接抛出异常，避免对挂起的上游持续堆积线程与消耗配额。
+    超时只在用满调用自身的 timeout_s 时计入熔断失败；被截止时间缩短的超时
+    反映的是本请求剩余预算而非上游健康状况，不计成败。
+    """
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded("planning deadline exceeded")
+    if abandoned_calls() >= int(env_float("PLANNER_MAX_ABANDONED", 8)):
+        raise CallsSaturated("too many abandoned calls still running")
+    if not breaker.allow():
+        raise CircuitOpen("circuit open")
+    limit = effective_timeout(timeout_s, deadline)
+    cut_short = limit is not None and (timeout_s is None or limit < timeout_s)
+    try:
+        value = call_with_timeout(fn, limit, *args, **kwargs)
+    except CallTimeout:
+        if cut_short:
+            breaker.release()
+        else:
+            breaker.record_failure()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return value
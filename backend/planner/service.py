@@ -1,7 +1,7 @@
 import os
 import json
 import uuid
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 try:
     from dotenv import load_dotenv
     load_dotenv()
@@ -10,7 +10,16 @@ except Exception:
 
 from .schema import ModificationBlueprint
 from .tools import search_codebase, list_files
-from .agent import make_executor, AGENT_AVAILABLE
+from .agent import make_executor, make_chat_model, batch_system_prompt_text, AGENT_AVAILABLE
+from .accounting import PlannerLedger
+from .resilience import (CallTimeout, CallsSaturated, CircuitBreaker, CircuitOpen, Deadline, DeadlineExceeded,
+                         effective_timeout, env_float, get_breaker, guarded_call)
+
+BLUEPRINT_FIELDS = ("target_file", "confidence", "action_type", "location_hint", "reasoning")
+# 回退蓝图 reasoning 中的原因描述；未列出的调用结果原样使用
+FALLBACK_REASONS = {"circuit_open": "circuit open", "deadline": "deadline exceeded", "saturated": "too many abandoned calls"}
+# 未发起调用即被拒绝的结果
+REFUSED_OUTCOMES = ("circuit_open", "deadline", "saturated")
 
 def _index_elements(elements: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
     """按 id 建立元素索引"""
@@ -31,6 +40,7 @@ def build_issue_context(elements: List[Dict[str, Any]], node_id: Optional[str])
     """
     idx = _index_elements(elements or [])
     node = idx.get(node_id) if node_id else None
+    parent = None
     parent_role = None
     sibling_text = []
     if node:
@@ -45,24 +55,63 @@ def build_issue_context(elements: List[Dict[str, Any]], node_id: Optional[str])
                 t = (s.get("content", {}).get("text") or "").strip()
                 if t:
                     sibling_text.append(t)
-    return {"sibling_text": sibling_text, "parent_role": parent_role}
+    return {"sibling_text": sibling_text, "parent_role": parent_role, "parent_id": parent.get("id") if node and parent else None}
 
 class LangChainPlanner:
     """基于 LangChain 的修改蓝图规划器
 
     负责调用工具型代理，根据诊断问题与上下文生成 ModificationBlueprint。
     在依赖缺失或执行失败时，回退到规则驱动的方案。
+    每次模型调用都受单次超时（PLANNER_CALL_TIMEOUT_S）与进程内共享的熔断器保护：
+    连续失败达到阈值后熔断打开，后续问题直接走回退策略而不再等待模型。
+    每次模型调用与每条问题的蓝图来源记入 self.ledger（见 PlannerLedger）。
     """
-    def __init__(self, model: Optional[str] = None, temperature: float = 0.0):
-        """初始化规划器并构建代理执行器"""
+    def __init__(self, model: Optional[str] = None, temperature: float = 0.0, chat_model: Any = None,
+                 call_timeout_s: Optional[float] = None, breaker: Optional[CircuitBreaker] = None):
+        """初始化规划器并构建代理执行器
+
+        参数:
+        - chat_model: 可选，批量规划使用的对话模型（需提供 invoke(messages)）；
+          默认按 model/temperature 创建，依赖不可用时批量规划退化为逐条规划
+        - call_timeout_s: 可选，单次模型调用超时秒数，默认读取 PLANNER_CALL_TIMEOUT_S（20）
+        - breaker: 可选，熔断器；默认使用进程内共享的 "llm" 熔断器
+        """
         tools = []
         tools.append(search_codebase)
         tools.append(list_files)
         model = model or os.getenv("LLM_MODEL") or "gpt-4o"
-        self.executor = make_executor(tools, model=model, temperature=temperature)
+        self.call_timeout_s = call_timeout_s if call_timeout_s is not None else env_float("PLANNER_CALL_TIMEOUT_S", 20)
+        self.breaker = breaker if breaker is not None else get_breaker("llm")
+        self.executor = make_executor(tools, model=model, temperature=temperature, timeout=self.call_timeout_s)
+        self.chat_model = chat_model if chat_model is not None else make_chat_model(model, temperature, timeout=self.call_timeout_s)
+        self.ledger = PlannerLedger(model)
+
+    def _call(self, kind: str, fn: Any, payload: Any, deadline: Optional[Deadline], issues: List[Dict[str, Any]]) -> Tuple[Any, Dict[str, Any]]:
+        """经熔断与超时保护调用模型并记账
+
+        失败（超时、异常）时记录结果后重新抛出；熔断打开、截止时间已到或后台调用过多时
+        调用并未发起，不写入 ledger.calls，只由调用方以回退原因记入 ledger.issues。
+        成功时返回 (结果, 未完成的调用记录)，由调用方在解析后以 ok/partial/parse_error/empty 结束记录。
+        """
+        rec = self.ledger.start_call(kind, payload, [it.get("type") for it in issues])
+        try:
+            result = guarded_call(self.breaker, fn, self.call_timeout_s, deadline, payload)
+        except (CircuitOpen, CallsSaturated, DeadlineExceeded):
+            raise
+        except CallTimeout as e:
+            self.ledger.finish_call(rec, "deadline" if deadline is not None and deadline.expired() else "timeout", error=e)
+            raise
+        except Exception as e:
+            self.ledger.finish_call(rec, "error", error=e)
+            raise
+        return result, rec
 
-    def _fallback(self, issue: Dict[str, Any], ctx: Dict[str, Any]) -> Dict[str, Any]:
-        """在代理不可用或失败时的回退策略，生成保守的蓝图"""
+    def _fallback(self, issue: Dict[str, Any], ctx: Dict[str, Any], reason: Optional[str] = None) -> Dict[str, Any]:
+        """在代理不可用或失败时的回退策略，生成保守的蓝图
+
+        参数:
+        - reason: 可选，回退原因（超时、熔断、截止时间等），附加在 reasoning 中
+        """
         pid = uuid.uuid4().hex[:8]
         t = issue.get("type") or "UNKNOWN"
         role = issue.get("widget_role") or "component"
@@ -93,28 +142,217 @@ class LangChainPlanner:
             confidence=confidence,
             action_type=action_type,
             location_hint=location_hint,
-            reasoning="rule-based fallback",
+            reasoning=f"rule-based fallback ({reason})" if reason else "rule-based fallback",
             parent_container_path=None,
         ).dict()
 
-    def plan(self, issue_json: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
-        """根据单条问题与上下文生成修改蓝图"""
+    def plan(self, issue_json: Dict[str, Any], context: Dict[str, Any], deadline: Optional[Deadline] = None,
+             prior_reason: Optional[str] = None) -> Dict[str, Any]:
+        """根据单条问题与上下文生成修改蓝图
+
+        参数:
+        - deadline: 可选，请求级截止时间；单次调用超时取其剩余时间与 call_timeout_s 的较小值，
+          并作为代理执行器的 max_execution_time 下传；到期或熔断打开时不再调用模型，直接回退
+        - prior_reason: 可选，此前批量规划未能给出该问题蓝图的原因，回退时一并写入 reasoning
+        """
         user_input = (
             "请分析以下 UI 问题并生成修改蓝图：\n" +
             json.dumps({"issue": issue_json, "context": context}, ensure_ascii=False)
             + "\n最终回答必须严格符合 ModificationBlueprint 的 JSON 结构。"
         )
         if self.executor is None:
-            return self._fallback(issue_json, context)
+            self.ledger.resolve(issue_json, "fallback", "unavailable")
+            return self._fallback(issue_json, context, "; ".join(r for r in (prior_reason, "agent unavailable") if r))
+        budget = effective_timeout(self.call_timeout_s, deadline)
+        if budget is not None and hasattr(self.executor, "max_execution_time"):
+            self.executor.max_execution_time = max(0.0, budget)
+        outcome = "error"
         try:
-            result = self.executor.invoke({"diagnostic_report": user_input})
+            result, rec = self._call("single", self.executor.invoke, {"diagnostic_report": user_input}, deadline, [issue_json])
             out = result.get("output") if isinstance(result, dict) else None
+            outcome = "empty"
             if isinstance(out, str) and out.strip():
-                data = json.loads(out)
-                return data
+                try:
+                    data = json.loads(out)
+                except ValueError as e:
+                    outcome = "parse_error"
+                    self.ledger.finish_call(rec, outcome, result, e)
+                else:
+                    self.ledger.finish_call(rec, "ok", result)
+                    self.ledger.resolve(issue_json, "single")
+                    return data
+            else:
+                self.ledger.finish_call(rec, outcome, result)
+        except CircuitOpen:
+            outcome = "circuit_open"
+        except CallsSaturated:
+            outcome = "saturated"
+        except CallTimeout:
+            outcome = "deadline" if deadline is not None and deadline.expired() else "timeout"
         except Exception:
-            pass
-        return self._fallback(issue_json, context)
+            outcome = "error"
+        self.ledger.resolve(issue_json, "fallback", outcome)
+        reason = FALLBACK_REASONS.get(outcome, outcome)
+        if prior_reason and outcome not in REFUSED_OUTCOMES:
+            reason = f"{prior_reason}; {reason}"
+        return self._fallback(issue_json, context, reason)
+
+    def _group_key(self, issue: Dict[str, Any], ctx: Dict[str, Any], group_by: str) -> Any:
+        """批量规划的分组键：parent（父容器）、role（组件角色），其他取值不分组"""
+        if group_by == "parent":
+            return (ctx or {}).get("parent_id") or (ctx or {}).get("parent_role")
+        if group_by == "role":
+            return issue.get("widget_role")
+        return None
+
+    def _search_query(self, issue: Dict[str, Any], ctx: Dict[str, Any]) -> str:
+        """按代理提示词中的搜索策略确定问题的代码搜索词"""
+        t = issue.get("type")
+        if t == "TEXT_MISMATCH":
+            return (issue.get("actual") or "").strip() or (issue.get("expected") or "").strip()
+        if t == "MISSING_WIDGET":
+            sib = [s for s in (ctx or {}).get("sibling_text") or [] if s]
+            return sib[0] if sib else ((ctx or {}).get("parent_role") or "")
+        return issue.get("widget_role") or ""
+
+    def _batch_payload(self, indices: List[int], issues: List[Dict[str, Any]], contexts: List[Dict[str, Any]],
+                       searches: Optional[Dict[str, List[str]]] = None) -> str:
+        """构建一次批量请求的用户消息，相同的上下文只出现一次
+
+        批量请求不绑定工具，每条问题附带预先执行的代码搜索结果 search_hits（最多 5 行），
+        相同搜索词在一次规划内只搜索一次（searches 为跨批次共享的缓存）。
+        """
+        searches = searches if searches is not None else {}
+        refs: Dict[str, str] = {}
+        shared: Dict[str, Dict[str, Any]] = {}
+        items = []
+        for k in indices:
+            ctx = contexts[k] or {}
+            key = json.dumps(ctx, ensure_ascii=False, sort_keys=True)
+            if key not in refs:
+                refs[key] = f"c{len(refs)}"
+                shared[refs[key]] = ctx
+            query = self._search_query(issues[k], ctx)
+            if query not in searches:
+                hits = search_codebase(query) if query else ""
+                searches[query] = [] if not hits or hits == "No matches found." else hits.splitlines()[:5]
+            items.append({"index": k, "issue": issues[k], "context_ref": refs[key], "search_hits": searches[query]})
+        return json.dumps({"contexts": shared, "issues": items}, ensure_ascii=False)
+
+    def _chunks(self, groups: Dict[Any, List[int]], issues: List[Dict[str, Any]], contexts: List[Dict[str, Any]], token_budget: int) -> List[List[int]]:
+        """在每个分组内按估算 token 数（约 3 字符/token）切分批次"""
+        out = []
+        for indices in groups.values():
+            cur: List[int] = []
+            used = 0
+            for k in indices:
+                cost = len(json.dumps({"issue": issues[k], "context": contexts[k]}, ensure_ascii=False)) // 3 + 1
+                if cur and used + cost > token_budget:
+                    out.append(cur)
+                    cur, used = [], 0
+                cur.append(k)
+                used += cost
+            if cur:
+                out.append(cur)
+        return out
+
+    def _parse_batch(self, text: Any, indices: List[int]) -> Dict[int, Dict[str, Any]]:
+        """解析批量回答，返回 index -> 蓝图；缺字段或 index 不在本批次的条目被丢弃"""
+        if not isinstance(text, str):
+            return {}
+        body = text.strip()
+        if body.startswith("```"):
+            body = body.strip("`")
+            body = body[body.find("\n") + 1:] if "\n" in body else ""
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return {}
+        if isinstance(data, dict):
+            data = data.get("blueprints")
+        if not isinstance(data, list):
+            return {}
+        wanted = set(indices)
+        out = {}
+        for it in data:
+            if not isinstance(it, dict) or it.get("index") not in wanted:
+                continue
+            if any(f not in it for f in BLUEPRINT_FIELDS) or not isinstance(it.get("location_hint"), dict):
+                continue
+            bp = ModificationBlueprint(
+                plan_id=str(it.get("plan_id") or f"plan_{uuid.uuid4().hex[:8]}"),
+                target_file=str(it.get("target_file") or ""),
+                confidence=str(it.get("confidence")),
+                action_type=str(it.get("action_type")),
+                location_hint=it.get("location_hint"),
+                reasoning=str(it.get("reasoning") or ""),
+                parent_container_path=it.get("parent_container_path"),
+            )
+            out[it["index"]] = bp.dict()
+        return out
+
+    def plan_batch(self, issues: List[Dict[str, Any]], contexts: List[Dict[str, Any]], group_by: str = "parent", token_budget: int = 3000,
+                   deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """批量生成修改蓝图
+
+        按父容器（parent）、组件角色（role）或仅按 token 预算（budget）分组，
+        每批只发送一次系统提示词与去重后的上下文，要求模型返回蓝图数组。
+        批量调用不绑定工具，代码搜索在服务端预先执行并随问题发送（见 _batch_payload）。
+        整批解析失败或个别条目缺失时，对应问题回退到逐条规划 plan()，并把批量失败原因
+        （如 "batch timeout"）传入，最终回退蓝图的 reasoning 会记录该原因；
+        批量调用因熔断、截止时间或后台调用过多而失败时逐条调用同样会被拒绝，直接使用规则回退。
+        截止时间到期后不再发起新的模型调用：已完成的蓝图原样返回，
+        其余问题使用规则回退蓝图补齐。
+
+        参数:
+        - issues: 诊断问题列表
+        - contexts: 与 issues 一一对应的上下文（build_issue_context 的结果）
+        - group_by: "parent" / "role" / "budget"
+        - token_budget: 单批估算 token 上限
+        - deadline: 可选，请求级截止时间
+
+        返回:
+        - list: 与 issues 顺序一致的蓝图列表
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(issues)
+        failures: Dict[int, str] = {}
+        if self.chat_model is not None:
+            groups: Dict[Any, List[int]] = {}
+            for k, it in enumerate(issues):
+                groups.setdefault(self._group_key(it, contexts[k], group_by), []).append(k)
+            searches: Dict[str, List[str]] = {}
+            for batch in self._chunks(groups, issues, contexts, token_budget):
+                messages = [("system", batch_system_prompt_text()), ("user", self._batch_payload(batch, issues, contexts, searches))]
+                try:
+                    res, rec = self._call("batch", self.chat_model.invoke, messages, deadline, [issues[k] for k in batch])
+                    parsed = self._parse_batch(getattr(res, "content", res), batch)
+                    outcome = "ok" if len(parsed) == len(batch) else ("partial" if parsed else "parse_error")
+                    self.ledger.finish_call(rec, outcome, res)
+                except CircuitOpen:
+                    parsed, outcome = {}, "circuit_open"
+                except CallsSaturated:
+                    parsed, outcome = {}, "saturated"
+                except CallTimeout:
+                    parsed, outcome = {}, "deadline" if deadline is not None and deadline.expired() else "timeout"
+                except Exception:
+                    parsed, outcome = {}, "error"
+                for k in batch:
+                    if k in parsed:
+                        results[k] = parsed[k]
+                        self.ledger.resolve(issues[k], "batch")
+                    else:
+                        failures[k] = outcome
+        for k, bp in enumerate(results):
+            if bp is not None:
+                continue
+            outcome = failures.get(k)
+            if outcome in REFUSED_OUTCOMES:
+                self.ledger.resolve(issues[k], "fallback", outcome)
+                results[k] = self._fallback(issues[k], contexts[k], FALLBACK_REASONS[outcome])
+            else:
+                prior = f"batch {outcome}" if outcome else None
+                results[k] = self.plan(issues[k], contexts[k], deadline, prior)
+        return results
 
 def _save_blueprints(out_path: str, report_id: str, blueprints: List[Dict[str, Any]]):
     """将蓝图结果保存为 JSON 文件"""
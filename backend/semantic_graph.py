@@ -1,4 +1,4 @@
-import uuid
+import hashlib
 
 
 class UISemanticBuilder:
@@ -19,9 +19,28 @@ class UISemanticBuilder:
         self.height = max(1, int(image_height))
         self.source_type = source_type
 
-    def _generate_id(self):
-        """生成节点唯一 ID"""
-        return f"node_{uuid.uuid4().hex[:8]}"
+    def _generate_id(self, item, geom, seen):
+        """生成确定性的节点 ID
+
+        树形输入按层级路径 key（见 extract_raw_detections_from_tree）生成，
+        与几何位置无关，无关节点的增删或整体位移不影响其 ID；
+        无 key 的扁平输入按类型、相对坐标框与文本生成。
+        同一张图内出现重复时按出现顺序追加序号消歧。
+
+        参数:
+        - item: 原始检测项
+        - geom: 该项的几何属性
+        - seen: 本次构建已分配 ID 的出现次数表（就地更新）
+        """
+        key = item.get("key")
+        if not key:
+            key = "|".join([str(item.get("label", "unknown")), ",".join(map(str, geom["rel"])), str(item.get("text") or "")])
+        base = f"{self.source_type}|{key}"
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        if n:
+            base = f"{base}#{n}"
+        return f"node_{hashlib.blake2b(base.encode('utf-8'), digest_size=6).hexdigest()}"
 
     def _calculate_geometry(self, box):
         """根据绝对坐标框计算几何属性（绝对/相对/中心/面积/宽高）"""
@@ -73,17 +92,21 @@ class UISemanticBuilder:
     def build(self, raw_detections):
         """从原始检测结果生成语义图
 
+        检测项带有 parent 字段（树形输入，见 extract_raw_detections_from_tree）时
+        直接按源树的父子关系建立拓扑，线性时间；扁平检测列表则按几何包含关系推断父节点。
+
         参数:
-        - raw_detections: 列表，每项包含 box/label/conf/text/ocr_conf
+        - raw_detections: 列表，每项包含 box/label/conf/text/ocr_conf，可选 key/parent
 
         返回:
         - dict: 语义图，包含 meta 与 elements
         """
         processed_nodes = []
+        seen = {}
         for item in raw_detections:
             geom = self._calculate_geometry(item["box"])
             node = {
-                "id": self._generate_id(),
+                "id": self._generate_id(item, geom, seen),
                 "type": {
                     "label": item.get("label", "unknown"),
                     "conf": float(item.get("conf", 0.0)),
@@ -103,6 +126,39 @@ class UISemanticBuilder:
             }
             processed_nodes.append(node)
 
+        if raw_detections and all("parent" in item for item in raw_detections):
+            self._link_native(processed_nodes, raw_detections)
+        else:
+            self._link_geometric(processed_nodes)
+
+        final_nodes = []
+        for node in processed_nodes:
+            del node["_area"]
+            final_nodes.append(node)
+
+        return {
+            "meta": {
+                "source": self.source_type,
+                "resolution": [self.width, self.height],
+                "node_count": len(final_nodes),
+            },
+            "elements": final_nodes,
+        }
+
+    def _link_native(self, processed_nodes, raw_detections):
+        """按检测项的 parent 下标建立父子关系（父项须先于子项出现，否则视为根）"""
+        for k, item in enumerate(raw_detections):
+            p = item.get("parent")
+            if not isinstance(p, int) or p < 0 or p >= k:
+                continue
+            child = processed_nodes[k]
+            parent = processed_nodes[p]
+            child["topology"]["parent_id"] = parent["id"]
+            child["topology"]["layer_level"] = parent["topology"]["layer_level"] + 1
+            parent["topology"]["children"].append(child["id"])
+
+    def _link_geometric(self, processed_nodes):
+        """按几何包含关系推断父节点：面积降序，取最近的包含者"""
         sorted_indices = sorted(range(len(processed_nodes)), key=lambda k: processed_nodes[k]["_area"], reverse=True)
 
         for i in range(len(sorted_indices)):
@@ -121,16 +177,77 @@ class UISemanticBuilder:
                 child["topology"]["layer_level"] = parent["topology"]["layer_level"] + 1
                 parent["topology"]["children"].append(child["id"])
 
-        final_nodes = []
-        for node in processed_nodes:
-            del node["_area"]
-            final_nodes.append(node)
 
-        return {
-            "meta": {
-                "source": self.source_type,
-                "resolution": [self.width, self.height],
-                "node_count": len(final_nodes),
-            },
-            "elements": final_nodes,
-        }
+def collapse_wrapper_chains(graph):
+    """合并边界相同的单子节点包装链
+
+    若某节点只有一个子节点且两者绝对坐标框完全一致，则视为包装节点，
+    整条链合并到最内层节点：被合并节点的类型与 ID 记录在
+    topology.merged_types / topology.merged_ids（由外到内），
+    最内层节点继承链顶的父节点，文本为空时取链上最近的非空文本。
+
+    参数:
+    - graph: 语义图（meta/elements），不修改原对象
+
+    返回:
+    - dict: 合并后的语义图，meta.collapsed 记录合并数量与 ID 映射
+    """
+    elements = graph.get("elements", [])
+    by_id = {e.get("id"): e for e in elements}
+
+    def is_wrapper(node):
+        children = (node.get("topology") or {}).get("children") or []
+        if len(children) != 1 or children[0] not in by_id:
+            return False
+        return node.get("geometry", {}).get("abs") == by_id[children[0]].get("geometry", {}).get("abs")
+
+    wrappers = {e.get("id") for e in elements if is_wrapper(e)}
+    kept_of = {}
+    out = []
+    for e in elements:
+        if e.get("id") in wrappers:
+            continue
+        chain = []
+        top = e
+        parent_id = (top.get("topology") or {}).get("parent_id")
+        while parent_id in wrappers:
+            top = by_id[parent_id]
+            chain.append(top)
+            parent_id = (top.get("topology") or {}).get("parent_id")
+        chain.reverse()
+        node = dict(e)
+        topo = dict(e.get("topology") or {})
+        topo["children"] = list(topo.get("children") or [])
+        topo["parent_id"] = parent_id
+        if chain:
+            topo["merged_types"] = [(w.get("type") or {}).get("label") for w in chain]
+            topo["merged_ids"] = [w.get("id") for w in chain]
+            content = node.get("content") or {}
+            if content.get("text") in (None, ""):
+                for w in reversed(chain):
+                    text = (w.get("content") or {}).get("text")
+                    if text not in (None, ""):
+                        node["content"] = dict(content, text=text)
+                        break
+            for w in chain:
+                kept_of[w.get("id")] = e.get("id")
+        node["topology"] = topo
+        out.append(node)
+    index = {n["id"]: n for n in out}
+    for n in out:
+        topo = n["topology"]
+        topo["children"] = [kept_of.get(c, c) for c in topo["children"]]
+    for n in out:
+        level = 0
+        p = n["topology"].get("parent_id")
+        while p in index and level <= len(out):
+            level += 1
+            p = index[p]["topology"].get("parent_id")
+        n["topology"]["layer_level"] = level
+    aliases = {}
+    for merged, kept in kept_of.items():
+        aliases.setdefault(kept, []).append(merged)
+    meta = dict(graph.get("meta") or {})
+    meta["node_count"] = len(out)
+    meta["collapsed"] = {"merged": len(kept_of), "aliases": aliases}
+    return {**graph, "meta": meta, "elements": out}
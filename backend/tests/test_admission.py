@@ -0,0 +1,95 @@
+import threading
+import time
+import pytest
+from admission import AdmissionController, AdmissionRejected, estimate_cost
+
+def _controller(**overrides):
+    config = {
+        "capacity": {"cpu": 4, "llm": 4},
+        "max_queue": 1,
+        "max_wait_s": 5,
+        "cells_per_unit": 100,
+        "issues_per_unit": 10,
+    }
+    config.update(overrides)
+    return AdmissionController(config)
+
+def test_estimate_cost_buckets_by_zone():
+    design = [
+        {"label": "Text", "box": [0, 0, 100, 100]},
+        {"label": "Text", "box": [0, 500, 100, 600]},
+        {"label": "Text", "box": [0, 700, 100, 800]},
+        {"label": "Button", "box": [0, 1900, 1000, 2000]},
+    ]
+    cost = estimate_cost(design, design[:2] + design[3:])
+    assert (cost["design_nodes"], cost["runtime_nodes"]) == (4, 3)
+    assert cost["cells"] == 1 * 1 + 2 * 1 + 1 * 1
+    assert cost["est_issues"] == 1
+    assert estimate_cost(None, design, 3)["cells"] == (1 + 4 + 1) * 4
+
+def test_heavy_request_is_capped_and_queue_is_fifo():
+    ctl = _controller(max_queue=2)
+    heavy = ctl.acquire({"cells": 10 ** 6, "est_issues": 0})
+    assert heavy["weights"] == {"cpu": 4, "llm": 1}
+    order = []
+    def worker(name, cells):
+        with ctl.admit({"cells": cells, "est_issues": 0}) as t:
+            order.append((name, t["weights"]["cpu"]))
+            time.sleep(0.05)
+    threads = [threading.Thread(target=worker, args=("big", 350))]
+    threads[0].start()
+    time.sleep(0.05)
+    threads.append(threading.Thread(target=worker, args=("small", 0)))
+    threads[1].start()
+    time.sleep(0.05)
+    snap = ctl.snapshot()
+    assert snap["queue_depth"] == 2 and snap["queued_weight"]["cpu"] == 5
+    ctl.release(heavy)
+    for t in threads:
+        t.join()
+    assert order == [("big", 4), ("small", 1)]
+    snap = ctl.snapshot()
+    assert snap["in_use"] == {"cpu": 0, "llm": 0}
+    assert snap["counts"]["admitted"] == 3 and snap["wait_ms"]["samples"] == 3
+
+def test_rejects_with_retry_hint_when_saturated():
+    ctl = _controller()
+    held = ctl.acquire({"cells": 10 ** 6, "est_issues": 0})
+    waiter = threading.Thread(target=lambda: pytest.raises(AdmissionRejected, ctl.acquire, {"cells": 0}, 0.3))
+    waiter.start()
+    time.sleep(0.05)
+    with pytest.raises(AdmissionRejected) as full:
+        ctl.acquire({"cells": 0})
+    assert full.value.reason == "queue_full" and full.value.retry_after_s >= 1
+    waiter.join()
+    with pytest.raises(AdmissionRejected) as late:
+        ctl.acquire({"cells": 0}, 0.05)
+    assert late.value.reason == "wait_timeout"
+    assert ctl.snapshot()["counts"] == {"admitted": 1, "completed": 0, "queue_full": 1, "wait_timeout": 2}
+    ctl.release(held)
+    with ctl.admit({"cells": 0}, 0) as t:
+        assert t["waited_ms"] >= 0
+
+def test_every_heavy_endpoint_is_admission_controlled(monkeypatch):
+    import app as app_module
+    ctl = _controller(max_queue=0)
+    monkeypatch.setattr(app_module, "admission", ctl)
+    client = app_module.app.test_client()
+    screen = [{"label": "Stack", "box": [0, 0, 1000, 2000]}, {"label": "Text", "box": [40, 60, 900, 140], "text": "hi"}]
+    bad = client.post("/api/compare", json={"design_json": screen, "code_json": screen, "admission_wait_s": "soon"})
+    assert bad.status_code == 400 and "admission_wait_s" in bad.get_json()["error"]
+    held = ctl.acquire({"cells": 10 ** 6, "est_issues": 0})
+    try:
+        for url, body in (
+            ("/api/compare-pages", {"design_json": screen, "code_json": screen}),
+            ("/api/compare-matrix", {"design_json": screen, "devices": [{"device_id": "a", "code_json": screen}]}),
+            ("/api/library/search", {"code_json": screen}),
+        ):
+            res = client.post(url, json=body)
+            assert res.status_code == 503, url
+            assert int(res.headers["Retry-After"]) >= 1
+            assert res.get_json()["reason"] == "queue_full"
+            assert client.post(url, json={**body, "admission_wait_s": "nan"}).status_code == 400
+    finally:
+        ctl.release(held)
+    assert ctl.snapshot()["counts"]["queue_full"] == 3
@@ -0,0 +1,49 @@
+import os
+import time
+from artifacts import ArtifactStore
+
+def _store(root, **overrides):
+    config = {
+        "max_age_days": 30,
+        "max_reports": 10,
+        "max_bytes": 10 ** 9,
+        "compact_after_hours": 24,
+        "maintain_interval_s": 600,
+        "blob_grace_s": 0,
+    }
+    config.update(overrides)
+    return ArtifactStore(str(root), config)
+
+def _age(path, seconds):
+    t = time.time() - seconds
+    os.utime(path, (t, t))
+
+def test_identical_graphs_share_one_blob(tmp_path):
+    store = _store(tmp_path)
+    graph = {"meta": {"node_count": 1}, "elements": [{"id": "a"}]}
+    p1 = store.write_report("r1", {"step1_design": graph}, {"step3_diagnostic": {"issues": []}})
+    p2 = store.write_report("r2", {"step1_design": graph}, {"step3_diagnostic": {"issues": []}})
+    assert p1["step1_design"] == p2["step1_design"]
+    digest = os.path.basename(p1["step1_design"]).split(".")[0]
+    assert store.get_blob(digest) == graph
+
+def test_maintain_compacts_expires_and_collects(tmp_path):
+    store = _store(tmp_path, max_reports=2)
+    for i in range(4):
+        paths = store.write_report(f"r{i}", {"step1_design": {"n": i}}, {"step3_diagnostic": {"issues": []}})
+        _age(paths["dir"], (4 - i) * 86400)
+    summary = store.maintain()
+    assert summary["compacted"] == 4
+    assert summary["over_count"] == 2
+    assert sorted(os.listdir(tmp_path / "archive")) == ["r2.manifest.json", "r2.tar.gz", "r3.manifest.json", "r3.tar.gz"]
+    assert summary["blobs_removed"] == 2
+    assert store.get_blob(store.put_blob({"n": 3})[0]) == {"n": 3}
+
+def test_maintain_expires_old_uploads(tmp_path):
+    store = _store(tmp_path, upload_ttl_hours=1)
+    os.makedirs(tmp_path / "uploads")
+    for name, age in (("old.img", 7200), ("new.img", 60)):
+        (tmp_path / "uploads" / name).write_bytes(b"x")
+        _age(tmp_path / "uploads" / name, age)
+    assert store.maintain()["uploads_removed"] == 1
+    assert os.listdir(tmp_path / "uploads") == ["new.img"]
@@ -0,0 +1,51 @@
+import json
+import os
+import batch
+from batch import main
+
+def _tree(text):
+    return {"attributes": {"type": "root", "bounds": "[0,0][100,200]"}, "children": [
+        {"attributes": {"type": "Text", "bounds": "[0,0][50,20]", "text": text}, "children": []},
+    ]}
+
+def test_batch_discovers_pairs_and_resumes(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "home_design.json").write_text(json.dumps(_tree("hi")))
+    (tmp_path / "a" / "home_runtime.json").write_text(json.dumps(_tree("hello")))
+    (tmp_path / "design.json").write_text(json.dumps(_tree("x")))
+    (tmp_path / "runtime.json").write_text("{broken")
+    (tmp_path / "lonely_design.json").write_text(json.dumps(_tree("x")))
+    out = tmp_path / "out" / "results.jsonl"
+    assert main([str(tmp_path), "--out", str(out), "--workers", "1", "--quiet"]) == 1
+    records = {r["pair"]: r for r in map(json.loads, out.read_text().splitlines())}
+    assert set(records) == {"a/home", "."}
+    assert records["a/home"]["ok"] and records["a/home"]["matched"] == 1
+    assert not records["."]["ok"]
+    with open(out, "a") as f:
+        f.write('{"pair": "a/ho')
+    assert main([str(tmp_path), "--out", str(out), "--workers", "1", "--quiet", "--resume"]) == 0
+    (tmp_path / "runtime.json").write_text(json.dumps(_tree("x")))
+    assert main([str(tmp_path), "--out", str(out), "--workers", "1", "--quiet", "--resume", "--retry-errors"]) == 0
+    lines = out.read_text().splitlines()
+    assert json.loads(lines[-1])["pair"] == "." and json.loads(lines[-1])["ok"]
+    assert len(lines) == 4
+
+_compare_pair = batch.compare_pair
+
+def _crash_on_boom(item, options=None):
+    if item["pair"].startswith("boom"):
+        os._exit(1)
+    return _compare_pair(item, options)
+
+def test_crashed_worker_is_recorded_as_failed_pair(tmp_path, monkeypatch):
+    names = ["boom"] + [f"fine{i:02d}" for i in range(11)]
+    for name in names:
+        (tmp_path / f"{name}_design.json").write_text(json.dumps(_tree("x")))
+        (tmp_path / f"{name}_runtime.json").write_text(json.dumps(_tree("x")))
+    monkeypatch.setattr(batch, "compare_pair", _crash_on_boom)
+    out = tmp_path / "results.jsonl"
+    summary = batch.run_batch(batch.discover_pairs(str(tmp_path)), str(out), workers=2, progress=None)
+    records = {r["pair"]: r for r in map(json.loads, out.read_text().splitlines())}
+    assert set(records) == set(names)
+    assert not records["boom"]["ok"] and "BrokenProcessPool" in records["boom"]["error"]
+    assert summary["total"] == 12 and summary["ok"] + summary["failed"] == 12 and summary["ok"] >= 1
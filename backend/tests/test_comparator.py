@@ -0,0 +1,31 @@
+import random
+from app import ComponentComparator
+
+def _brute_force(comparator, design, code):
+    remaining = list(range(len(code)))
+    pairs = []
+    for i, d in enumerate(design):
+        best, best_iou = None, 0
+        for k, j in enumerate(remaining):
+            iou = comparator.calculate_iou(d["bounding_box"], code[j]["bounding_box"])
+            if iou > best_iou and iou >= comparator.match_threshold:
+                best, best_iou = k, iou
+        if best is not None:
+            pairs.append((i, remaining.pop(best), best_iou))
+    return pairs
+
+def test_sweep_line_matches_brute_force():
+    rnd = random.Random(11)
+    def comp(i, x, y, w, h):
+        return {"id": str(i), "type": "box", "bounding_box": {"x": x, "y": y, "width": w, "height": h}}
+    design = [comp(i, rnd.randint(0, 500), rnd.randint(0, 900), rnd.randint(0, 120), rnd.randint(0, 80)) for i in range(80)]
+    code = []
+    for i, d in enumerate(design):
+        b = d["bounding_box"]
+        code.append(comp(i, b["x"] + rnd.randint(-4, 4), b["y"] + rnd.randint(-4, 4), b["width"], b["height"]))
+    rnd.shuffle(code)
+    comparator = ComponentComparator()
+    res = comparator.compare_components(design, code)
+    got = [(design.index(m["design_component"]), code.index(m["code_component"]), m["iou"]) for m in res["matches"]]
+    assert got == _brute_force(comparator, design, code)
+    assert res["matched_components"] + res["unmatched_code_count"] == len(code)
@@ -0,0 +1,74 @@
+import copy
+import json
+import multiprocessing
+import os
+
+from design_library import DesignLibrary, SIGNATURE_DIM
+from pipeline import build_semantic_graph
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+def _screen(title, rows, button_y):
+    items = [{"label": "Stack", "box": [0, 0, 1000, 2000]}, {"label": "Text", "box": [40, 60, 900, 140], "text": title}]
+    for i in range(rows):
+        items.append({"label": "Image", "box": [40, 200 + i * 220, 240, 400 + i * 220]})
+        items.append({"label": "Text", "box": [280, 240 + i * 220, 900, 300 + i * 220], "text": f"{title} 条目 {i}"})
+    items.append({"label": "Button", "box": [100, button_y, 900, button_y + 120], "text": "提交"})
+    return items
+
+def test_register_and_retrieve_top_candidate(tmp_path):
+    lib = DesignLibrary(str(tmp_path))
+    with open(os.path.join(ROOT, "1.json"), "r", encoding="utf-8") as f:
+        page = json.load(f)
+    ids = [lib.register(_screen(f"页面{k}", k % 5 + 1, 1400 + k * 10))["design_id"] for k in range(12)]
+    target = lib.register(page, name="index")
+    assert lib.register(page)["design_id"] == target["design_id"]
+    assert target["page_path"] == "pages/Index"
+    assert os.path.getsize(os.path.join(str(tmp_path), "signatures.f32")) == 13 * SIGNATURE_DIM * 4
+
+    runtime = copy.deepcopy(page)
+    runtime["children"] = runtime["children"][:1]
+    reopened = DesignLibrary(str(tmp_path))
+    hits = reopened.search(build_semantic_graph(runtime, "runtime"), k=3)
+    assert hits[0]["design_id"] == target["design_id"]
+    assert hits[0]["score"] >= hits[1]["score"] >= hits[2]["score"]
+
+    graph, candidates = reopened.lookup(build_semantic_graph(_screen("页面7", 3, 1470), "runtime"))
+    assert candidates[0]["design_id"] == ids[7]
+    assert graph["meta"]["source"] == "design"
+    assert all("match_ratio" in c for c in candidates)
+
+def _register_many(root, tag):
+    lib = DesignLibrary(root)
+    for k in range(6):
+        lib.register(_screen(f"{tag}{k}", k % 3 + 1, 1400 + k * 10))
+
+def test_concurrent_registration_from_processes_keeps_every_entry(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_register_many, args=(str(tmp_path), tag)) for tag in ("甲", "乙", "丙")]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+        assert p.exitcode == 0
+    entries = DesignLibrary(str(tmp_path)).entries()
+    assert len(entries) == 18
+    assert sorted(e["row"] for e in entries) == list(range(18))
+    assert os.path.getsize(os.path.join(str(tmp_path), "signatures.f32")) == 18 * SIGNATURE_DIM * 4
+
+def test_lookup_rejects_candidates_below_thresholds(tmp_path, monkeypatch):
+    lib = DesignLibrary(str(tmp_path))
+    for k in range(6):
+        lib.register(_screen(f"页面{k}", k % 5 + 1, 1400 + k * 10))
+    other = [{"label": "Stack", "box": [0, 0, 1000, 2000]}, {"label": "Input", "box": [10, 10, 500, 80], "text": "搜索"}]
+    other += [{"label": "Checkbox", "box": [20, 150 + i * 90, 80, 210 + i * 90]} for i in range(8)]
+    graph, candidates = lib.lookup(build_semantic_graph(other, "runtime"))
+    assert graph is None and candidates
+    assert all(c["score"] < lib.config["min_score"] or c["match_ratio"] < lib.config["min_match_ratio"] for c in candidates)
+    graph, _ = DesignLibrary(str(tmp_path), {"rerank": 3}).lookup(build_semantic_graph(other, "runtime"))
+    assert graph is not None
+
+    import app as app_module
+    monkeypatch.setattr(app_module, "design_library", lib)
+    res = app_module.app.test_client().post("/api/compare", json={"code_json": other})
+    assert res.status_code == 400 and "no design in library" in res.get_json()["error"]
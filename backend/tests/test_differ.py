@@ -0,0 +1,113 @@
+import random
+from differ import UISemanticDiffer
+
+def _node(i, x1, y1, x2, y2, text=None, label="Text"):
+    return {
+        "id": f"n{i}",
+        "type": {"label": label},
+        "geometry": {
+            "center": [round((x1 + x2) / 2, 4), round((y1 + y2) / 2, 4)],
+            "rel": [round(x1, 4), round(y1, 4), round(x2, 4), round(y2, 4)],
+        },
+        "content": {"text": text},
+    }
+
+def test_layout_batch_matches_per_pair():
+    rnd = random.Random(7)
+    matches = []
+    for i in range(40):
+        x1, y1 = rnd.random() * 0.8, rnd.random() * 0.8
+        d = _node(i, x1, y1, x1 + 0.1, y1 + 0.05)
+        dx, dy, dw = rnd.choice([0, 0.002, 0.01]), rnd.choice([0, -0.003, 0.02]), rnd.choice([0, 0.001, 0.03])
+        r = _node(i, x1 + dx, y1 + dy, x1 + 0.1 + dx + dw, y1 + 0.05 + dy)
+        matches.append({"design": d, "runtime": r, "cost": 0.1})
+    differ = UISemanticDiffer()
+    geom = differ._geometry_arrays(matches)
+    batch = differ._layout_diff_batch(geom, 1260, 2720, 0.001)
+    for m, issues in zip(matches, batch):
+        assert issues == differ._layout_diff(m["design"], m["runtime"], 1260, 2720, 0.001)
+
+def test_dynamic_content_combined_pattern():
+    differ = UISemanticDiffer()
+    assert differ._text_dynamic("¥100", "$2.5")
+    assert differ._text_dynamic("12:30", "9:05")
+    assert not differ._text_dynamic("12:30", "2024-01-02")
+    assert not differ._text_dynamic("", "")
+    d = _node(1, 0.1, 0.1, 0.2, 0.2, text="123")
+    r = _node(1, 0.1, 0.1, 0.2, 0.2, text="456")
+    report = differ.analyze({"matches": [{"design": d, "runtime": r, "cost": 0.0}]}, {"resolution": [100, 100]})
+    assert report["issues"] == []
+
+def test_dynamic_patterns_with_global_flags_or_groups_match_one_by_one():
+    config = {"text": {"dynamic_patterns": {"code": r"(?i)^abc\d+$", "pair": r"^(\d)-\1$"}}}
+    differ = UISemanticDiffer(config)
+    assert differ._dynamic_re is None
+    assert differ._text_dynamic("ABC12", "abc3")
+    assert differ._text_dynamic("7-7", "2-2")
+    assert not differ._text_dynamic("7-8", "2-2")
+    assert not differ._text_dynamic("ABC12", "7-7")
+
+def _tree_node(i, box, parent=None, label="Column"):
+    n = _node(i, *box, label=label)
+    n["topology"] = {"parent_id": f"n{parent}" if parent is not None else None}
+    return n
+
+def test_descendant_shifts_fold_into_ancestor_root_cause():
+    boxes = {0: (0.0, 0.0, 1.0, 1.0), 1: (0.1, 0.1, 0.9, 0.4), 2: (0.15, 0.15, 0.5, 0.2), 3: (0.15, 0.25, 0.5, 0.3), 4: (0.5, 0.25, 0.8, 0.3)}
+    parents = {0: None, 1: 0, 2: 1, 3: 1, 4: 3}
+    for i in range(5, 10):
+        boxes[i] = (0.1, 0.5 + i * 0.04, 0.9, 0.52 + i * 0.04)
+        parents[i] = 0
+    shift = {1: (0, 0.05), 2: (0, 0.05), 3: (0, 0.05), 4: (0.1, 0.05)}
+    matches = []
+    for i, box in boxes.items():
+        sx, sy = shift.get(i, (0, 0))
+        moved = (box[0] + sx, box[1] + sy, box[2] + sx, box[3] + sy)
+        matches.append({"design": _tree_node(i, box, parents[i]), "runtime": _tree_node(i, moved, parents[i]), "cost": 0.1})
+    differ = UISemanticDiffer()
+    report = differ.analyze({"matches": matches}, {"resolution": [1000, 1000]})
+    by_node = {}
+    for it in report["issues"]:
+        by_node.setdefault(it["node_id"], []).append(it)
+    assert set(by_node) == {"n1", "n4"}
+    assert by_node["n1"][0]["affected_nodes"] == ["n2", "n3"]
+    assert report["coalesced"] == {"folded": 2, "root_causes": 1}
+    differ.config["coalesce"]["enabled"] = False
+    assert len(differ.analyze({"matches": matches}, {"resolution": [1000, 1000]})["issues"]) == 5
+
+def test_report_id_tracks_content_not_just_node_ids():
+    from semantic_graph import UISemanticBuilder
+    from matcher import UIFuzzyMatcher
+    def run(text):
+        raw = [
+            {"label": "Text", "box": [0, 100, 500, 200], "text": text, "key": "/0"},
+            {"label": "Button", "box": [0, 300, 500, 400], "text": "ok", "key": "/1"},
+        ]
+        g = UISemanticBuilder(1000, 2000, "design").build(raw)
+        return UISemanticDiffer().analyze(UIFuzzyMatcher().run(g, g), g["meta"], g["meta"])["report_id"]
+    assert run("hello") == run("hello")
+    assert run("hello") != run("bonjour")
+
+def test_report_folder_covers_screenshots_and_tile_masks(monkeypatch, tmp_path):
+    import base64
+    import cv2
+    import numpy as np
+    import app as app_module
+    from artifacts import ArtifactStore
+    from history import ReportHistory
+    monkeypatch.setattr(app_module, "OUTPUT_ROOT", str(tmp_path))
+    monkeypatch.setattr(app_module, "artifacts", ArtifactStore(str(tmp_path)))
+    monkeypatch.setattr(app_module, "history", ReportHistory(str(tmp_path / "history.sqlite3")))
+    client = app_module.app.test_client()
+    screen = [{"label": "Stack", "box": [0, 0, 100, 200]}, {"label": "Image", "box": [10, 10, 90, 90]}]
+    def shot(value):
+        img = np.full((200, 100, 3), 255, np.uint8)
+        img[10:90, 10:90] = value
+        return base64.b64encode(cv2.imencode(".png", img)[1].tobytes()).decode("ascii")
+    def run(**extra):
+        body = {"design_json": screen, "code_json": screen, "design_image": shot(0), **extra}
+        return client.post("/api/compare", json=body).get_json()["diagnostic_report"]["report_id"]
+    same = run(runtime_image=shot(0))
+    assert run(runtime_image=shot(0)) == same
+    assert run(runtime_image=shot(128)) != same
+    assert run(runtime_image=shot(0), changed_tiles={"rows": 2, "cols": 1, "mask": [[1], [0]]}) != same
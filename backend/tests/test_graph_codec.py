@@ -0,0 +1,67 @@
+import json
+import struct
+import pytest
+from graph_codec import MAGIC, GraphValidationError, decode_graph, encode_graph
+from semantic_graph import UISemanticBuilder, collapse_wrapper_chains
+
+def _graph():
+    raw = [
+        {"label": "Column", "box": [0, 0, 100, 200]},
+        {"label": "Row", "box": [10, 10, 90, 50]},
+        {"label": "Text", "box": [10, 10, 90, 50], "text": "标题"},
+        {"label": "Image", "box": [10, 180, 90, 195]},
+    ]
+    return collapse_wrapper_chains(UISemanticBuilder(100, 200, "design").build(raw))
+
+def test_columnar_round_trip():
+    graph = _graph()
+    assert decode_graph(encode_graph(graph)) == graph
+
+def test_fractional_abs_coordinates_survive():
+    graph = _graph()
+    graph["elements"][1]["geometry"]["abs"] = [10.5, 10.25, 90.75, 50.0]
+    decoded = decode_graph(encode_graph(graph))
+    assert decoded["elements"][1]["geometry"]["abs"] == [10.5, 10.25, 90.75, 50.0]
+    assert decoded["elements"][0]["geometry"]["abs"] == [0.0, 0.0, 100.0, 200.0]
+
+def test_rejects_corrupt_payloads():
+    data = bytearray(encode_graph(_graph()))
+    with pytest.raises(GraphValidationError):
+        decode_graph(bytes(data[:40]))
+    bad = _graph()
+    bad["elements"][1]["topology"]["parent_id"] = "missing"
+    with pytest.raises(GraphValidationError):
+        encode_graph(bad)
+    with pytest.raises(GraphValidationError):
+        decode_graph(b'{"meta": {}, "elements": [{"id": 1}]}')
+
+def _patch_header(data, fn):
+    m = len(MAGIC)
+    (hlen,) = struct.unpack_from("<I", data, m)
+    start = m + 4
+    header = json.loads(data[start:start + hlen])
+    body = bytearray(data[start + hlen + (-(start + hlen)) % 8:])
+    fn(header, body)
+    h = json.dumps(header).encode("utf-8")
+    return MAGIC + struct.pack("<I", len(h)) + h + b"\0" * ((-(start + len(h))) % 8) + bytes(body)
+
+def test_rejects_untrusted_column_dtypes_and_meta():
+    data = encode_graph(_graph())
+    assert decode_graph(_patch_header(data, lambda h, b: None)) == _graph()
+
+    def float_labels(h, b):
+        h["columns"]["label"][0] = "<f4"
+
+    def negative_zone(h, b):
+        h["columns"]["zone"][0] = "|i1"
+        b[h["columns"]["zone"][2]] = 0xFF
+
+    def bad_resolution(h, b):
+        h["meta"]["resolution"] = ["wide", 200]
+
+    def object_column(h, b):
+        h["columns"]["parent"][0] = "|O"
+
+    for patch in (float_labels, negative_zone, bad_resolution, object_column):
+        with pytest.raises(GraphValidationError):
+            decode_graph(_patch_header(data, patch))
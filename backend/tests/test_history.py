@@ -0,0 +1,46 @@
+from history import ReportHistory
+
+def test_trend_and_top_issues(tmp_path):
+    h = ReportHistory(str(tmp_path / "history.sqlite3"))
+    matching = {"matches": [1, 2], "missing": [], "added": []}
+    for i in range(3):
+        issues = [{"type": "LAYOUT_SHIFT_Y", "severity": "major", "node_id": "n1", "widget_role": "Text"}]
+        if i == 2:
+            issues.append({"type": "TEXT_MISMATCH", "severity": "major", "node_id": "n2", "widget_role": "Button"})
+        run_id = h.record_report({"report_id": f"r{i}", "issues": issues}, matching, page_path="pages/Index", bundle_name="com.demo", created_at=100 + i)
+        h.record_timings(run_id, {"match": 1.5, "diff": 0.5})
+    h.record_report({"report_id": "other", "issues": []}, matching, page_path="pages/Other", created_at=50)
+    runs = h.trend(page_path="pages/Index", limit=2)
+    assert [r["report_id"] for r in runs] == ["r1", "r2"]
+    assert runs[1]["by_type"] == {"LAYOUT_SHIFT_Y": 1, "TEXT_MISMATCH": 1}
+    assert runs[0]["timings"] == {"match": 1.5, "diff": 0.5}
+    top = h.top_issues(bundle_name="com.demo", group_by=("type", "node"))
+    assert top[0] == {"type": "LAYOUT_SHIFT_Y", "node": "n1", "runs": 3, "total": 3}
+
+def test_planner_stats_groups_calls_and_fallbacks(tmp_path):
+    h = ReportHistory(str(tmp_path / "history.sqlite3"))
+    calls = [
+        {"kind": "batch", "model": "m", "issue_types": ["LAYOUT_SHIFT_Y"], "issue_count": 2, "outcome": "ok", "duration_ms": 100.0, "prompt_tokens": 300, "completion_tokens": 80},
+        {"kind": "batch", "model": "m", "issue_types": ["TEXT_MISMATCH"], "issue_count": 1, "outcome": "timeout", "duration_ms": 2000.0, "prompt_tokens": 150, "completion_tokens": 0},
+    ]
+    issues = [
+        {"issue_type": "LAYOUT_SHIFT_Y", "source": "batch", "fallback_reason": None},
+        {"issue_type": "LAYOUT_SHIFT_Y", "source": "batch", "fallback_reason": None},
+        {"issue_type": "TEXT_MISMATCH", "source": "fallback", "fallback_reason": "timeout"},
+    ]
+    h.record_planner(1, calls, issues, created_at=100)
+    h.record_planner(2, calls[:1], issues[:1], created_at=10)
+    stats = h.planner_stats(since=50)
+    assert {(c["kind"], c["outcome"], c["calls"]) for c in stats["calls"]} == {("batch", "ok", 1), ("batch", "timeout", 1)}
+    text = next(r for r in stats["issue_types"] if r["issue_type"] == "TEXT_MISMATCH")
+    assert text["fallback_rate"] == 1.0 and text["fallback_reasons"] == {"timeout": 1}
+    assert h.planner_stats(group_by=("model",))["calls"][0] == {"model": "m", "calls": 3, "p50_ms": 100.0, "p95_ms": 2000.0, "max_ms": 2000.0, "prompt_tokens": 750, "completion_tokens": 160}
+
+def test_memory_database_persists_across_calls():
+    h = ReportHistory(":memory:")
+    run_id = h.record_report({"report_id": "r1", "issues": [{"type": "TEXT_MISMATCH", "node_id": "n1"}]}, {"matches": [], "missing": [], "added": []}, page_path="p", created_at=1)
+    h.record_timings(run_id, {"match": 1.0})
+    assert h.planner_stats() == {"calls": [], "issue_types": []}
+    assert [r["report_id"] for r in h.trend(page_path="p")] == ["r1"]
+    assert h.top_issues()[0]["total"] == 1
+    assert ReportHistory(":memory:").trend() == []
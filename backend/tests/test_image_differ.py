@@ -0,0 +1,35 @@
+import os
+import numpy as np
+from image_differ import UIImageDiffer
+
+def _node(i, rel):
+    return {"id": i, "type": {"label": "Image"}, "geometry": {"rel": rel}}
+
+def test_region_diff_flags_changed_element_only():
+    design = np.full((200, 100, 3), 255, dtype=np.uint8)
+    design[20:60, 10:90] = (0, 0, 255)
+    runtime = design.copy()
+    runtime[120:180, 10:90] = 0
+    runtime[130:170, 20:80] = 255
+    matches = [
+        {"design": _node("same", [0.1, 0.1, 0.9, 0.3]), "runtime": _node("r1", [0.1, 0.1, 0.9, 0.3]), "cost": 0.0},
+        {"design": _node("changed", [0.1, 0.6, 0.9, 0.9]), "runtime": _node("r2", [0.1, 0.6, 0.9, 0.9]), "cost": 0.0},
+    ]
+    res = UIImageDiffer().analyze(matches, design, runtime)
+    assert res["checked"] == 2
+    assert [it["node_id"] for it in res["issues"]] == ["changed"]
+
+def test_compare_rejects_undecodable_or_unknown_images(monkeypatch, tmp_path):
+    import io
+    import cv2
+    import app as app_module
+    monkeypatch.setattr(app_module, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    client = app_module.app.test_client()
+    png = cv2.imencode(".png", np.zeros((20, 10, 3), np.uint8))[1].tobytes()
+    up = client.post("/api/upload-image", data={"image": (io.BytesIO(png), "shot.jpeg")}, content_type="multipart/form-data").get_json()
+    assert os.listdir(tmp_path / "uploads") == [up["image_id"] + ".img"]
+    assert app_module.load_request_image({"runtime_image_id": up["image_id"]}, "runtime_image").shape == (20, 10, 3)
+    screen = [{"label": "Text", "box": [0, 0, 10, 10], "text": "a"}]
+    for extra in ({"runtime_image": "bm90IGFuIGltYWdl"}, {"design_image_id": "deadbeef"}, {"design_image_id": "../x"}):
+        res = client.post("/api/compare", json={"design_json": screen, "code_json": screen, **extra})
+        assert res.status_code == 400, extra
@@ -0,0 +1,30 @@
+import os
+import random
+
+from loadtest import InProcessServer, encode_bodies, generate_pairs, perturb, run_load
+
+def _tree():
+    rows = [
+        {"attributes": {"type": "Text", "bounds": f"[40,{200 + i * 150}][900,{300 + i * 150}]", "text": f"条目 {i}"}, "children": []}
+        for i in range(6)
+    ]
+    return {"attributes": {"type": "Column", "bounds": "[0,0][1000,2000]"}, "children": rows}
+
+def test_perturb_changes_copy_only():
+    base = _tree()
+    out = perturb(base, random.Random(1), text_changes=2, shifts=1, drops=1)
+    assert [c["attributes"]["text"] for c in base["children"]] == [f"条目 {i}" for i in range(6)]
+    assert len(out["children"]) == 5
+    assert sum(c["attributes"]["text"].endswith("*") for c in out["children"]) >= 1
+
+def test_run_load_reports_latency_and_stages(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_STUB_LATENCY_MS", "5")
+    bodies = encode_bodies(generate_pairs(_tree(), 3), compress=True)
+    with InProcessServer(str(tmp_path)) as server:
+        closed = run_load(server.url, bodies, concurrency=2, total=6, compress=True)
+        opened = run_load(server.url, bodies, concurrency=2, total=4, rate=50.0, compress=True)
+    assert closed["requests"] == 6 and closed["error_rate"] == 0.0
+    assert closed["latency_ms"]["p50"] <= closed["latency_ms"]["p99"]
+    assert {"build", "match", "diff", "plan"} <= set(closed["stages"])
+    assert opened["status"] == {"200": 4}
+    assert os.path.exists(os.path.join(str(tmp_path), "history.sqlite3"))
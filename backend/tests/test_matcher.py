@@ -0,0 +1,77 @@
+import itertools
+import random
+import time
+from matcher import UIFuzzyMatcher
+
+def _optimum(C):
+    n, m = len(C), len(C[0])
+    if n <= m:
+        return min(sum(C[i][p[i]] for i in range(n)) for p in itertools.permutations(range(m), n))
+    return min(sum(C[p[j]][j] for j in range(m)) for p in itertools.permutations(range(n), m))
+
+def test_auction_within_reported_gap():
+    rnd = random.Random(3)
+    matcher = UIFuzzyMatcher()
+    for _ in range(100):
+        n, m = rnd.randint(1, 6), rnd.randint(1, 6)
+        C = [[round(rnd.random() * 2, 3) for _ in range(m)] for _ in range(n)]
+        pairs, info = matcher._auction(C)
+        total = sum(C[i][j] for i, j in pairs)
+        best = _optimum(C)
+        assert len(pairs) == min(n, m)
+        assert best - 1e-9 <= total <= best + info["gap_bound"] + 1e-9
+
+def test_auction_returns_assignment_when_budget_expired():
+    rnd = random.Random(4)
+    C = [[rnd.random() for _ in range(60)] for _ in range(60)]
+    pairs, info = UIFuzzyMatcher()._auction(C, deadline=time.perf_counter() - 1)
+    assert info["timed_out"]
+    assert sorted(j for _, j in pairs) == list(range(60))
+    assert info["gap_bound"] >= 0
+
+def test_parallel_buckets_match_serial():
+    rnd = random.Random(5)
+    def elems(shift):
+        out = []
+        for i in range(30):
+            x, y = (i % 5) * 0.2, (i // 5) * 0.15 + 0.05
+            rel = [x, y + shift, x + 0.15, y + 0.1 + shift]
+            out.append({"id": f"n{i}", "type": {"label": rnd.choice(["Text", "Button"])}, "content": {"text": f"t{i % 7}"},
+                        "topology": {"zone": "body"},
+                        "geometry": {"rel": rel, "center": [x + 0.075, rel[1] + 0.05]}})
+        return out
+    design = {"elements": elems(0)}
+    runtime = {"elements": elems(0.01)}
+    key = lambda r: [(m["design"]["id"], m["runtime"]["id"], m["cost"]) for m in r["matches"]]
+    serial = UIFuzzyMatcher().run(design, runtime)
+    matcher = UIFuzzyMatcher()
+    matcher.config["parallel"] = {"workers": 2, "min_cells": 0, "block_rows": 8, "split_min_cells": 10 ** 9}
+    assert key(matcher.run(design, runtime)) == key(serial)
+
+def test_packed_text_is_flat_and_round_trips():
+    from parallel_match import pack_features, unpack_features
+    texts = ["", "确定", "x" * 5000, "🙂ok"] + ["a"] * 100
+    feats = [(0.1, 0.2, 0.0, 0.0, 0.5, 0.5, 1.0, t, "text") for t in texts]
+    labels = []
+    packed = pack_features(feats, labels)
+    assert packed["text"].shape == (sum(len(t) for t in texts),)
+    assert unpack_features(packed["num"], packed["label"], packed["toff"], packed["text"], labels, 0, len(feats)) == feats
+
+def test_shared_pool_is_sized_once_and_never_replaced(monkeypatch):
+    import parallel_match
+    pool = parallel_match.get_pool()
+    size = parallel_match._POOL_SIZE
+    monkeypatch.setenv("UI_COMPARE_MATCH_WORKERS", str(size + 8))
+    assert parallel_match.pool_size() == size + 8
+    again = parallel_match.get_pool()
+    assert again is pool and parallel_match._POOL_SIZE == size
+    assert again.submit(abs, -3).result() == 3
+
+def test_fast_mode_rejects_bad_time_budget():
+    import app as app_module
+    client = app_module.app.test_client()
+    screen = [{"label": "Text", "box": [0, 0, 100, 100], "text": "a"}]
+    for bad in ("soon", 0, -5, "inf"):
+        res = client.post("/api/compare", json={"design_json": screen, "code_json": screen, "match_mode": "fast", "time_budget_ms": bad})
+        assert res.status_code == 400 and "time_budget_ms" in res.get_json()["error"]
+    assert app_module.time_budget_ms({}) == 200.0 and app_module.time_budget_ms({"time_budget_ms": "50"}) == 50.0
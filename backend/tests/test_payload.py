@@ -0,0 +1,33 @@
+import gzip
+import io
+import pytest
+from payload import InvalidPayload, PayloadTooLarge, UnsupportedEncoding, read_stream
+
+def test_read_stream_sniffs_and_decompresses():
+    body = b'{"a": "' + b"x" * 200000 + b'"}'
+    assert read_stream(io.BytesIO(gzip.compress(body)), None, 10 ** 6) == body
+    assert read_stream(io.BytesIO(gzip.compress(body)), "gzip", 10 ** 6) == body
+    assert read_stream(io.BytesIO(body), None, 10 ** 6) == body
+
+def test_read_stream_enforces_decompressed_limit():
+    bomb = gzip.compress(b"\0" * (4 * 1024 * 1024))
+    with pytest.raises(PayloadTooLarge):
+        read_stream(io.BytesIO(bomb), None, 1024 * 1024)
+    with pytest.raises(PayloadTooLarge):
+        read_stream(io.BytesIO(b"x" * 2048), "identity", 1024)
+    with pytest.raises(UnsupportedEncoding):
+        read_stream(io.BytesIO(b"x"), "br", 1024)
+
+def test_corrupt_or_non_object_bodies_are_rejected_with_400():
+    body = gzip.compress(b'{"design_json": [], "code_json": []}')
+    with pytest.raises(InvalidPayload):
+        read_stream(io.BytesIO(body[:-12]), "gzip", 10 ** 6)
+    with pytest.raises(InvalidPayload):
+        read_stream(io.BytesIO(body[:10] + b"\xff" * 20 + body[30:]), "gzip", 10 ** 6)
+    import app as app_module
+    client = app_module.app.test_client()
+    headers = {"Content-Encoding": "gzip", "Content-Type": "application/json"}
+    for route in ("/api/compare", "/api/compare-pages", "/api/compare-matrix"):
+        assert client.post(route, data=body[:-12], headers=headers).status_code == 400
+        res = client.post(route, json=[1, 2])
+        assert res.status_code == 400 and "object" in res.get_json()["error"]
@@ -0,0 +1,89 @@
+import pytest
+from pipeline import compare_device_matrix, compare_pages
+
+def _dump(scale, drop_button=False):
+    items = [
+        {"label": "Text", "box": [0, 300 * scale, 500 * scale, 400 * scale], "text": "标题"},
+        {"label": "Image", "box": [0, 500 * scale, 1000 * scale, 1500 * scale]},
+        {"label": "Text", "box": [0, 1600 * scale, 400 * scale, 1700 * scale], "text": "说明"},
+    ]
+    if not drop_button:
+        items.append({"label": "Button", "box": [100 * scale, 1800 * scale, 900 * scale, 1900 * scale], "text": "提交"})
+    items.append({"label": "Stack", "box": [0, 0, 1000 * scale, 2000 * scale]})
+    return items
+
+def test_device_matrix_per_device_and_common_issues():
+    devices = [
+        {"device_id": "small", "code_json": _dump(1, drop_button=True)},
+        {"device_id": "large", "code_json": _dump(2, drop_button=True)},
+        {"device_id": "ok", "code_json": _dump(3)},
+    ]
+    res = compare_device_matrix(_dump(1), devices, workers=2)
+    assert set(res["devices"]) == {"small", "large", "ok"}
+    assert [it["type"] for it in res["devices"]["small"]["issues"]] == ["MISSING_WIDGET"]
+    assert res["devices"]["large"]["issues"] == res["devices"]["small"]["issues"]
+    assert res["devices"]["ok"]["issues"] == []
+    assert res["common_issues"] == []
+    res = compare_device_matrix(_dump(1), devices[:2], workers=1)
+    assert [it["widget_role"] for it in res["common_issues"]] == ["Button"]
+
+def test_device_matrix_rejects_duplicate_ids():
+    devices = [{"device_id": "a", "code_json": _dump(1)}, {"device_id": "a", "code_json": _dump(2)}]
+    with pytest.raises(ValueError, match="duplicate device_id: a"):
+        compare_device_matrix(_dump(1), devices, workers=2)
+
+def test_matrix_workers_are_clamped_or_rejected(monkeypatch):
+    import os
+    import app as app_module
+    from parallel_match import parse_workers
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+    assert parse_workers(None) is None and parse_workers("2") == 2
+    assert parse_workers(2000) == 4 and parse_workers(-3) == 1
+    for bad in ("many", 2.5, True):
+        with pytest.raises(ValueError):
+            parse_workers(bad)
+    client = app_module.app.test_client()
+    body = {"design_json": _dump(1), "devices": [{"device_id": "a", "code_json": _dump(1)}]}
+    assert client.post("/api/compare-matrix", json={**body, "workers": "many"}).status_code == 400
+    assert client.post("/api/compare-matrix", json={**body, "workers": 2000}).status_code == 200
+
+def _node(t, bounds, wid, children=(), **attrs):
+    a = {"type": t, "bounds": bounds, "hostWindowId": wid, "visible": True}
+    a.update(attrs)
+    return {"attributes": a, "children": list(children)}
+
+def _windows(page_wid, bar_wid, with_button=True, dialog=False):
+    page_children = [_node("Text", "[40,200][600,260]", page_wid, text="标题")]
+    if with_button:
+        page_children.append(_node("Button", "[40,1800][1000,1900]", page_wid, text="提交"))
+    wins = [
+        _node("WindowScene", "[0,0][1080,120]", bar_wid, [_node("Text", "[20,20][200,100]", bar_wid, text="12:00")], bundleName="com.ohos.sceneboard"),
+        _node("root", "[0,120][1080,2340]", page_wid, [_node("Column", "[0,120][1080,2340]", page_wid, page_children)], bundleName="com.example.app", pagePath="pages/Index"),
+    ]
+    if dialog:
+        wins.append(_node("Dialog", "[100,800][980,1400]", "99", [_node("Text", "[150,900][900,1000]", "99", text="确认")], bundleName="com.example.app", abilityName="DialogAbility", pagePath="pages/Dialog"))
+    return {"attributes": {"type": "", "bounds": "[0,0][1080,2340]", "hostWindowId": ""}, "children": wins}
+
+def test_compare_pages_pairs_windows_across_dumps():
+    res = compare_pages(_windows("5", "2"), _windows("31", "7", with_button=False, dialog=True), workers=2)
+    assert set(res["pages"]) == {"pages/Index", "com.ohos.sceneboard"}
+    assert res["unpaired"] == {"design": [], "runtime": ["pages/Dialog"]}
+    page = res["pages"]["pages/Index"]
+    assert [(it["type"], it["widget_role"]) for it in page["issues"]] == [("MISSING_WIDGET", "Button")]
+    assert page["window"]["window_id"] == {"design": "5", "runtime": "31"}
+    assert res["pages"]["com.ohos.sceneboard"]["issues"] == []
+    assert res["pages"]["com.ohos.sceneboard"]["resolution"]["design"] == [1080, 120]
+
+def test_compare_pages_runs_on_the_shared_pool(monkeypatch):
+    import pipeline
+    import app as app_module
+    import parallel_match
+    calls = []
+    monkeypatch.setattr(pipeline.os, "cpu_count", lambda: 4)
+    monkeypatch.setattr(pipeline, "get_pool", lambda: calls.append(1) or parallel_match.get_pool())
+    client = app_module.app.test_client()
+    body = {"design_json": _windows("5", "2"), "code_json": _windows("31", "7")}
+    assert client.post("/api/compare-pages", json={**body, "workers": "lots"}).status_code == 400
+    res = client.post("/api/compare-pages", json={**body, "workers": 2000})
+    assert res.status_code == 200 and len(res.get_json()["pages"]) == 2
+    assert calls == [1]
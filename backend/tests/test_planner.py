@@ -1,4 +1,10 @@
 import json
+import threading
+import time
+import urllib.request
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from planner.resilience import CallTimeout, CircuitBreaker, Deadline, abandoned_calls, guarded_call
 from planner.service import build_issue_context, LangChainPlanner
 
 def test_context_extraction_minimal():
@@ -41,3 +47,229 @@ def test_planner_fallback_text_mismatch():
     bp = planner.plan(issue, {"sibling_text": ["合计: ¥100"], "parent_role": "container"})
     assert isinstance(bp, dict)
     assert bp.get("action_type") == "MODIFY_TEXT"
+
+class _FakeChatModel:
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = []
+
+    def invoke(self, messages):
+        self.calls.append(messages)
+        payload = json.loads(messages[-1][1])
+        return type("Msg", (), {"content": self.reply(payload)})()
+
+def _issues():
+    issues = [
+        {"type": "TEXT_MISMATCH", "severity": "major", "widget_role": "Text", "node_id": "a", "actual": "去下单", "expected": "立即下单"},
+        {"type": "LAYOUT_SHIFT", "severity": "minor", "widget_role": "Button", "node_id": "b"},
+        {"type": "SIZE_MISMATCH", "severity": "minor", "widget_role": "Image", "node_id": "c"},
+    ]
+    contexts = [
+        {"sibling_text": ["合计"], "parent_role": "Row", "parent_id": "p1"},
+        {"sibling_text": ["合计"], "parent_role": "Row", "parent_id": "p1"},
+        {"sibling_text": [], "parent_role": "Column", "parent_id": "p2"},
+    ]
+    return issues, contexts
+
+def _answer(payload):
+    return "```json\n" + json.dumps([
+        {"index": it["index"], "target_file": "pages/Index.ets", "confidence": "high", "action_type": "MODIFY_STYLE",
+         "location_hint": {"component_name": it["issue"]["widget_role"]}, "reasoning": "batched"}
+        for it in payload["issues"]
+    ]) + "\n```"
+
+def test_plan_batch_groups_by_parent_and_shares_context():
+    model = _FakeChatModel(_answer)
+    planner = LangChainPlanner(chat_model=model)
+    issues, contexts = _issues()
+    out = planner.plan_batch(issues, contexts, group_by="parent")
+    assert len(model.calls) == 2
+    first = json.loads(model.calls[0][-1][1])
+    assert len(first["issues"]) == 2 and len(first["contexts"]) == 1
+    assert [bp["location_hint"]["component_name"] for bp in out] == ["Text", "Button", "Image"]
+    assert all(bp["reasoning"] == "batched" for bp in out)
+    assert all(isinstance(it["search_hits"], list) for it in first["issues"])
+    assert "search_codebase" not in model.calls[0][0][1]
+
+def test_batch_payload_carries_prefetched_search_hits():
+    planner = LangChainPlanner(chat_model=_FakeChatModel(_answer))
+    issues = [{"type": "TEXT_MISMATCH", "actual": "class LangChainPlanner", "widget_role": "Text"}]
+    payload = json.loads(planner._batch_payload([0], issues, [{}]))
+    assert any("planner/service.py" in hit for hit in payload["issues"][0]["search_hits"])
+
+def test_plan_batch_falls_back_per_issue_on_bad_output():
+    planner = LangChainPlanner(chat_model=_FakeChatModel(lambda payload: "not json"))
+    issues, contexts = _issues()
+    out = planner.plan_batch(issues, contexts, group_by="budget", token_budget=10)
+    assert len(planner.chat_model.calls) == 3
+    assert out[0]["action_type"] == "MODIFY_TEXT"
+    assert all(bp["reasoning"] == "rule-based fallback (batch parse_error; agent unavailable)" for bp in out)
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        srv = self.server
+        with srv.lock:
+            srv.hits += 1
+            n = srv.hits
+        status, delay = srv.behaviour(n)
+        time.sleep(delay)
+        reply = _answer(json.loads(body)).encode("utf-8") if status == 200 else b"error"
+        try:
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+def _stub_server(behaviour):
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    srv.daemon_threads = True
+    srv.behaviour = behaviour
+    srv.hits = 0
+    srv.lock = threading.Lock()
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+class _HttpChatModel:
+    def __init__(self, url):
+        self.url = url
+
+    def invoke(self, messages):
+        req = urllib.request.Request(self.url, data=messages[-1][1].encode("utf-8"), method="POST")
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return type("Msg", (), {"content": resp.read().decode("utf-8")})()
+
+def _planner_for(srv, **kw):
+    url = f"http://127.0.0.1:{srv.server_address[1]}/v1/chat"
+    return LangChainPlanner(chat_model=_HttpChatModel(url), **kw)
+
+def test_plan_batch_call_timeout_falls_back_quickly():
+    srv = _stub_server(lambda n: (200, 1.0))
+    try:
+        planner = _planner_for(srv, call_timeout_s=0.2, breaker=CircuitBreaker(5, 30))
+        issues, contexts = _issues()
+        t = time.monotonic()
+        out = planner.plan_batch(issues, contexts, group_by="role")
+        assert time.monotonic() - t < 0.9
+        assert all(bp["reasoning"].startswith("rule-based fallback") for bp in out)
+    finally:
+        srv.shutdown()
+
+def test_circuit_breaker_stops_calling_failing_server():
+    srv = _stub_server(lambda n: (500, 0.0))
+    try:
+        breaker = CircuitBreaker(2, 30)
+        planner = _planner_for(srv, call_timeout_s=2, breaker=breaker)
+        issues, contexts = _issues()
+        out = planner.plan_batch(issues, contexts, group_by="budget", token_budget=10)
+        assert srv.hits == 2
+        assert breaker.snapshot()["state"] == "open"
+        assert len(out) == 3 and out[0]["action_type"] == "MODIFY_TEXT"
+    finally:
+        srv.shutdown()
+
+def test_deadline_keeps_finished_blueprints():
+    srv = _stub_server(lambda n: (200, 0.0 if n == 1 else 1.0))
+    try:
+        planner = _planner_for(srv, call_timeout_s=5, breaker=CircuitBreaker(5, 30))
+        issues, contexts = _issues()
+        t = time.monotonic()
+        out = planner.plan_batch(issues, contexts, group_by="budget", token_budget=10, deadline=Deadline(0.4))
+        assert time.monotonic() - t < 0.9
+        assert out[0]["reasoning"] == "batched"
+        assert [bp["reasoning"] for bp in out[1:]] == ["rule-based fallback (deadline exceeded)"] * 2
+        assert srv.hits == 2
+    finally:
+        srv.shutdown()
+
+def test_expiring_deadline_leaves_breaker_closed():
+    release = threading.Event()
+    breaker = CircuitBreaker(1, 30)
+    try:
+        for _ in range(2):
+            with pytest.raises(CallTimeout):
+                guarded_call(breaker, release.wait, 5, Deadline(0.05), 5)
+        assert breaker.snapshot() == {"state": "closed", "failures": 0}
+        with pytest.raises(CallTimeout):
+            guarded_call(breaker, release.wait, 0.05, Deadline(5), 5)
+        assert breaker.snapshot() == {"state": "open", "failures": 1}
+    finally:
+        release.set()
+    _wait_for_abandoned_calls()
+
+def _wait_for_abandoned_calls():
+    for _ in range(300):
+        if abandoned_calls() == 0:
+            return
+        time.sleep(0.01)
+
+def test_abandoned_calls_are_capped(monkeypatch):
+    monkeypatch.setenv("PLANNER_MAX_ABANDONED", "1")
+    release = threading.Event()
+    hung = {"n": 0}
+
+    def hang(payload):
+        hung["n"] += 1
+        release.wait(5)
+        return _answer(payload)
+
+    _wait_for_abandoned_calls()
+    try:
+        planner = LangChainPlanner(chat_model=_FakeChatModel(hang), call_timeout_s=0.1, breaker=CircuitBreaker(5, 30))
+        issues, contexts = _issues()
+        out = planner.plan_batch(issues, contexts, group_by="budget", token_budget=10)
+        assert hung["n"] == 1 and abandoned_calls() == 1
+        assert out[0]["reasoning"] == "rule-based fallback (batch timeout; agent unavailable)"
+        assert out[1]["reasoning"] == "rule-based fallback (too many abandoned calls)"
+    finally:
+        release.set()
+    _wait_for_abandoned_calls()
+    assert abandoned_calls() == 0
+
+def test_ledger_accounts_calls_tokens_and_fallbacks():
+    class _Usage:
+        def __init__(self, content):
+            self.content = content
+            self.usage_metadata = {"input_tokens": 120, "output_tokens": 40}
+
+    calls = {"n": 0}
+
+    def reply(messages):
+        calls["n"] += 1
+        if calls["n"] == 2:
+            raise RuntimeError("upstream 502")
+        return _Usage(_answer(json.loads(messages[-1][1])))
+
+    model = type("M", (), {"invoke": staticmethod(reply)})()
+    planner = LangChainPlanner(chat_model=model, breaker=CircuitBreaker(5, 30))
+    issues, contexts = _issues()
+    planner.plan_batch(issues, contexts, group_by="parent")
+    summary = planner.ledger.summary()
+    assert summary["calls"] == 2
+    assert summary["outcomes"] == {"ok": 1, "error": 1}
+    assert summary["prompt_tokens"] >= 120 and summary["completion_tokens"] >= 40
+    assert summary["fallbacks"] == 1 and summary["fallback_rate"] == round(1 / 3, 4)
+    assert summary["by_issue_type"]["SIZE_MISMATCH"]["fallback"] == 1
+    assert summary["by_issue_type"]["TEXT_MISMATCH"]["batch"] == 1
+    failed = next(c for c in planner.ledger.calls if c["outcome"] == "error")
+    assert "upstream 502" in failed["error"]
+
+def test_refused_calls_are_not_recorded_as_calls():
+    breaker = CircuitBreaker(1, 30)
+    breaker.record_failure()
+    model = _FakeChatModel(_answer)
+    planner = LangChainPlanner(chat_model=model, breaker=breaker)
+    issues, contexts = _issues()
+    out = planner.plan_batch(issues, contexts, group_by="budget", token_budget=10)
+    assert model.calls == [] and planner.ledger.calls == []
+    assert all(bp["reasoning"] == "rule-based fallback (circuit open)" for bp in out)
+
+    planner = LangChainPlanner(chat_model=model, breaker=CircuitBreaker(5, 30))
+    planner.plan_batch(issues, contexts, deadline=Deadline(0))
+    summary = planner.ledger.summary()
+    assert summary["calls"] == 0 and summary["fallback_reasons"] == {"deadline": 3}
@@ -0,0 +1,64 @@
+from semantic_graph import UISemanticBuilder, collapse_wrapper_chains
+
+def test_collapse_merges_same_bounds_chain_and_keeps_aliases():
+    raw = [
+        {"label": "Column", "box": [0, 0, 100, 200]},
+        {"label": "Stack", "box": [10, 10, 90, 50], "text": "title"},
+        {"label": "Row", "box": [10, 10, 90, 50]},
+        {"label": "Text", "box": [10, 10, 90, 50]},
+        {"label": "Image", "box": [10, 60, 90, 120]},
+    ]
+    graph = UISemanticBuilder(100, 200, "design").build(raw)
+    ids = [e["id"] for e in graph["elements"]]
+    collapsed = collapse_wrapper_chains(graph)
+    assert collapsed["meta"]["node_count"] == 3
+    assert graph["meta"]["node_count"] == 5
+    text = next(e for e in collapsed["elements"] if e["type"]["label"] == "Text")
+    assert text["id"] == ids[3]
+    assert text["topology"]["merged_types"] == ["Stack", "Row"]
+    assert text["topology"]["merged_ids"] == ids[1:3]
+    assert text["topology"]["parent_id"] == ids[0]
+    assert text["topology"]["layer_level"] == 1
+    assert text["content"]["text"] == "title"
+    root = next(e for e in collapsed["elements"] if e["id"] == ids[0])
+    assert sorted(root["topology"]["children"]) == sorted([ids[3], ids[4]])
+    assert collapsed["meta"]["collapsed"]["aliases"] == {ids[3]: ids[1:3]}
+
+def _tree(children):
+    return {"attributes": {"type": "root", "bounds": "[0,0][100,200]"}, "children": [
+        {"attributes": {"type": t, "bounds": b, **extra}, "children": []} for t, b, extra in children
+    ]}
+
+def test_node_ids_are_stable_across_runs_and_unrelated_changes():
+    from pipeline import build_semantic_graph
+    base = [("Text", "[0,0][50,20]", {}), ("Image", "[0,30][50,80]", {}), ("Button", "[0,90][50,120]", {"id": "ok"})]
+    ids = [e["id"] for e in build_semantic_graph(_tree(base), "design")["elements"]]
+    assert ids == [e["id"] for e in build_semantic_graph(_tree(base), "design")["elements"]]
+    assert len(set(ids)) == 3
+    changed = [("Divider", "[0,0][100,5]", {}), ("Text", "[0,10][50,30]", {}), ("Image", "[0,40][50,90]", {}), ("Button", "[0,95][50,125]", {"id": "ok"})]
+    moved = [e["id"] for e in build_semantic_graph(_tree(changed), "design")["elements"]]
+    assert moved[1:] == ids
+    assert build_semantic_graph(_tree(base), "runtime")["elements"][0]["id"] != ids[0]
+
+def test_tree_input_keeps_native_parents_through_skipped_nodes():
+    from pipeline import build_semantic_graph
+    data = {"attributes": {"type": "root", "bounds": "[0,0][100,200]"}, "children": [
+        {"attributes": {"type": "Column", "bounds": "[0,0][100,200]"}, "children": [
+            {"attributes": {"type": "Image", "bounds": "[0,0][100,100]"}, "children": []},
+            {"attributes": {"type": "Stack", "bounds": "[0,0][0,0]"}, "children": [
+                {"attributes": {"type": "Text", "bounds": "[10,10][90,40]", "text": "overlay"}, "children": []},
+            ]},
+        ]},
+    ]}
+    graph = build_semantic_graph(data, "design")
+    by_label = {e["type"]["label"]: e for e in graph["elements"]}
+    column, image, text = by_label["Column"], by_label["Image"], by_label["Text"]
+    assert text["topology"]["parent_id"] == column["id"]
+    assert text["topology"]["layer_level"] == 1
+    assert column["topology"]["children"] == [image["id"], text["id"]]
+    flat = UISemanticBuilder(100, 200, "design").build([
+        {"label": "Column", "box": [0, 0, 100, 200]},
+        {"label": "Image", "box": [0, 0, 100, 100]},
+        {"label": "Text", "box": [10, 10, 90, 40]},
+    ])
+    assert flat["elements"][2]["topology"]["parent_id"] == flat["elements"][1]["id"]
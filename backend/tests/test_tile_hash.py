@@ -0,0 +1,47 @@
+import numpy as np
+from tile_hash import changed_tile_mask, parse_tile_mask, split_by_tiles
+
+def _node(i, rel):
+    return {"id": i, "geometry": {"rel": rel}}
+
+def test_changed_tiles_restrict_elements():
+    a = np.full((160, 80, 3), 255, dtype=np.uint8)
+    b = a.copy()
+    b[130:150, 10:30] = 0
+    tiles = changed_tile_mask(a, b, rows=8, cols=4)
+    assert tiles["changed"] == 4
+    mask = parse_tile_mask(tiles)
+    active, idle = split_by_tiles([_node("top", [0.0, 0.0, 1.0, 0.2]), _node("bottom", [0.1, 0.8, 0.4, 0.95])], mask)
+    assert [e["id"] for e in active] == ["bottom"]
+    assert [e["id"] for e in idle] == ["top"]
+
+def test_size_mismatch_marks_everything_changed():
+    tiles = changed_tile_mask(np.zeros((10, 10, 3), np.uint8), np.zeros((20, 10, 3), np.uint8), rows=2, cols=2)
+    assert tiles["changed"] == 4
+
+def _scratch_app(monkeypatch, tmp_path):
+    import app as app_module
+    from artifacts import ArtifactStore
+    from history import ReportHistory
+    monkeypatch.setattr(app_module, "OUTPUT_ROOT", str(tmp_path))
+    monkeypatch.setattr(app_module, "artifacts", ArtifactStore(str(tmp_path)))
+    monkeypatch.setattr(app_module, "history", ReportHistory(str(tmp_path / "history.sqlite3")))
+    return app_module.app.test_client()
+
+def test_idle_elements_missing_the_carry_key_are_still_matched(monkeypatch, tmp_path):
+    client = _scratch_app(monkeypatch, tmp_path)
+    design = [
+        {"label": "Text", "box": [0, 100, 500, 200], "text": "title"},
+        {"label": "Button", "box": [100, 1800, 900, 1900], "text": "ok"},
+        {"label": "Stack", "box": [0, 0, 1000, 2000]},
+    ]
+    runtime = [dict(design[0], box=[0, 160, 500, 260]), design[1], design[2]]
+    mask = [[0, 0]] * 4 + [[1, 1]] * 4
+    res = client.post("/api/compare", json={"design_json": design, "code_json": runtime, "changed_tiles": {"rows": 8, "cols": 2, "mask": mask}}).get_json()
+    m = res["matching"]
+    assert len(m["matches"]) + len(m["missing"]) == 3
+    assert len(m["matches"]) + len(m["added"]) == 3
+    assert res["matching"]["matches"] and res["diagnostic_report"]["issues"]
+    bad = client.post("/api/compare", json={"design_json": design, "code_json": runtime, "changed_tiles": {"rows": 3, "cols": 2, "mask": mask}})
+    assert bad.status_code == 400
+    assert parse_tile_mask({"mask": [[1, 0]]}).shape == (1, 2)
@@ -0,0 +1,65 @@
+import json
+from artifacts import ArtifactStore
+from viewport_index import ViewportIndex
+
+def _dense_graph(n_side=100, cell=10):
+    elements = []
+    for i in range(n_side):
+        for j in range(n_side):
+            x, y = j * cell, i * cell
+            elements.append({
+                "id": f"n{i}_{j}",
+                "type": {"label": "text" if (i + j) % 2 else "button"},
+                "geometry": {"abs": [x, y, x + cell - 2, y + cell - 2]},
+                "content": {"text": f"{i},{j}"},
+            })
+    return {"meta": {"resolution": [n_side * cell, n_side * cell]}, "elements": elements}
+
+def test_zoomed_out_query_is_clustered_and_bounded():
+    graph = _dense_graph()
+    index = ViewportIndex(graph)
+    overview = index.query(scale=0.1)
+    assert overview["total"] == 10000
+    assert overview["boxes"] == []
+    assert 0 < len(overview["clusters"]) < 200
+    assert sum(c["count"] for c in overview["clusters"]) == 10000
+    assert len(json.dumps(overview)) < 40000
+
+def test_zoomed_in_query_returns_individual_boxes():
+    index = ViewportIndex(_dense_graph())
+    detail = index.query([0, 0, 95, 95], scale=2.0)
+    ids = {b["id"] for b in detail["boxes"]}
+    assert "n0_0" in ids and "n9_9" in ids
+    assert "n50_50" not in ids
+    assert not detail["truncated"]
+    capped = index.query([0, 0, 95, 95], scale=2.0, limit=10)
+    assert len(capped["boxes"]) == 10 and capped["truncated"]
+
+def test_issue_markers_follow_matches_to_runtime(tmp_path):
+    design = _dense_graph(4)
+    runtime = {"meta": {"resolution": [40, 40]}, "elements": [{"id": "r1", "type": {"label": "text"}, "geometry": {"abs": [20, 20, 28, 28]}}]}
+    matching = {"matches": [{"design": {"id": "n0_0"}, "runtime": {"id": "r1"}, "cost": 0.1}]}
+    issues = [{"type": "TEXT_MISMATCH", "severity": "error", "node_id": "n0_0"}]
+    store = ArtifactStore(str(tmp_path))
+    store.write_report("report_1", {"step1_design": design, "step1_runtime": runtime}, {"step2_matching": matching, "step3_diagnostic": {"issues": issues}})
+    assert store.load("report_1", "step1_runtime") == runtime
+    index = ViewportIndex(store.load("report_1", "step1_runtime"), issues, store.load("report_1", "step2_matching"), "runtime")
+    marks = index.query()["issues"]
+    assert [(m["node_id"], m["box"]) for m in marks] == [("r1", [20, 20, 28, 28])]
+    assert ViewportIndex(design, issues).query([0, 0, 5, 5])["issues"][0]["node_id"] == "n0_0"
+    assert store.load("missing", "step1_design") is None
+
+def test_viewport_cache_follows_rewritten_and_removed_reports(monkeypatch, tmp_path):
+    import shutil
+    import app as app_module
+    store = ArtifactStore(str(tmp_path))
+    monkeypatch.setattr(app_module, "artifacts", store)
+    monkeypatch.setattr(app_module, "_viewport_cache", type(app_module._viewport_cache)())
+    client = app_module.app.test_client()
+    for n_side in (3, 5):
+        graph = _dense_graph(n_side)
+        store.write_report("report_1", {"step1_design": graph, "step1_runtime": graph}, {"step2_matching": {}, "step3_diagnostic": {"issues": []}})
+        res = client.get("/api/reports/report_1/viewport").get_json()
+        assert res["total"] == n_side * n_side
+    shutil.rmtree(tmp_path / "report_1")
+    assert client.get("/api/reports/report_1/viewport").status_code == 404
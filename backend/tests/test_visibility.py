@@ -0,0 +1,36 @@
+from extractor import extract_raw_detections_from_tree
+from visibility import VisibilityPruner
+
+def _node(t, bounds, children=(), **attrs):
+    a = {"type": t, "bounds": bounds, "origBounds": bounds, "visible": "true", "opacity": "1.000000",
+         "zIndex": "0", "backgroundColor": "#00000000"}
+    a.update(attrs)
+    return {"attributes": a, "children": list(children)}
+
+def _labels(tree):
+    return sorted(it["label"] for it in extract_raw_detections_from_tree(tree))
+
+def test_prunes_hidden_transparent_clipped_and_offscreen():
+    tree = _node("root", "[0,0][100,200]", [
+        _node("Hidden", "[0,0][50,50]", [_node("HiddenChild", "[0,0][10,10]")], visible="false"),
+        _node("Fade", "[0,50][50,100]", [_node("FadeChild", "[0,50][10,60]")], opacity="0.000000"),
+        _node("Clipped", "[0,0][0,0]", origBounds="[0,210][50,260]"),
+        _node("Offscreen", "[120,0][150,50]", [_node("Inside", "[10,10][20,20]")]),
+        _node("Text", "[50,0][100,50]"),
+    ])
+    pruned, stats = VisibilityPruner().prune(tree)
+    assert _labels(pruned) == ["Inside", "Text"]
+    assert (stats["invisible"], stats["transparent"], stats["clipped"], stats["offscreen"]) == (2, 2, 1, 1)
+    assert _labels(tree) == sorted(["Hidden", "HiddenChild", "Fade", "FadeChild", "Offscreen", "Inside", "Text"])
+
+def test_occlusion_follows_z_order_and_spares_ancestors():
+    dialog = _node("Dialog", "[0,0][100,100]", [_node("Button", "[10,10][90,40]")], backgroundColor="#FFFFFFFF", zIndex="1")
+    tree = _node("root", "[0,0][100,200]", [
+        dialog,
+        _node("Under", "[20,50][80,90]"),
+        _node("Partly", "[20,80][80,150]"),
+        _node("Card", "[0,100][100,200]", [_node("Cover", "[0,100][100,200]", backgroundColor="#FF000000")]),
+    ])
+    pruned, stats = VisibilityPruner().prune(tree)
+    assert stats["occluded"] == 1
+    assert _labels(pruned) == sorted(["Dialog", "Button", "Partly", "Card", "Cover"])
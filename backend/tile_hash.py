@@ -0,0 +1,121 @@
+import hashlib
+
+import cv2
+import numpy as np
+
+
+def _tile_edges(length, parts):
+    """将长度均分为 parts 段，返回 parts+1 个边界坐标"""
+    return [int(round(length * k / parts)) for k in range(parts + 1)]
+
+def _dhash(tile):
+    """计算瓦片的 64 位差值感知哈希（dHash）"""
+    gray = tile if tile.ndim == 2 else cv2.cvtColor(tile, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).reshape(-1)
+    return int(np.packbits(bits).view(">u8")[0])
+
+def tile_hashes(img, rows, cols):
+    """计算截图的分块哈希
+
+    参数:
+    - img: 已解码的截图数组
+    - rows / cols: 网格行数与列数
+
+    返回:
+    - tuple: (精确哈希 rows×cols 列表, 感知哈希 rows×cols uint64 数组)
+    """
+    h, w = img.shape[:2]
+    ys = _tile_edges(h, rows)
+    xs = _tile_edges(w, cols)
+    exact = []
+    perceptual = np.zeros((rows, cols), dtype=np.uint64)
+    for r in range(rows):
+        row = []
+        for c in range(cols):
+            tile = img[ys[r]:ys[r + 1], xs[c]:xs[c + 1]]
+            row.append(hashlib.blake2b(tile.tobytes(), digest_size=8).digest())
+            if tile.size:
+                perceptual[r, c] = _dhash(tile)
+        exact.append(row)
+    return exact, perceptual
+
+def _popcount64(arr):
+    """逐元素统计 uint64 数组中置位的比特数"""
+    b = arr.astype(">u8").view(np.uint8).reshape(arr.shape + (8,))
+    return np.unpackbits(b, axis=-1).sum(axis=-1)
+
+def changed_tile_mask(img_a, img_b, rows=16, cols=8, phash_threshold=None):
+    """比较两张截图，返回发生变化的瓦片掩码
+
+    精确哈希不同的瓦片视为变化；若给定 phash_threshold，
+    则感知哈希汉明距离不超过该值的瓦片视为压缩噪声而忽略。
+    两图尺寸不一致时全部视为变化。
+
+    返回:
+    - dict: rows/cols/mask(二维 0/1 列表)/changed/distance(感知哈希汉明距离)
+    """
+    rows = max(1, int(rows))
+    cols = max(1, int(cols))
+    if img_a is None or img_b is None or img_a.shape != img_b.shape:
+        mask = np.ones((rows, cols), dtype=bool)
+        dist = np.full((rows, cols), 64, dtype=np.int64)
+    else:
+        ea, pa = tile_hashes(img_a, rows, cols)
+        eb, pb = tile_hashes(img_b, rows, cols)
+        mask = np.array([[ea[r][c] != eb[r][c] for c in range(cols)] for r in range(rows)], dtype=bool)
+        dist = _popcount64(np.bitwise_xor(pa, pb))
+        if phash_threshold is not None:
+            mask &= dist > int(phash_threshold)
+    return {
+        "rows": rows,
+        "cols": cols,
+        "mask": mask.astype(int).tolist(),
+        "changed": int(mask.sum()),
+        "distance": dist.astype(int).tolist(),
+    }
+
+class TileMaskError(ValueError):
+    """外部传入的瓦片掩码结构非法"""
+
+
+def parse_tile_mask(obj):
+    """校验并解析外部传入的瓦片掩码 {rows, cols, mask}
+
+    非法时抛出 TileMaskError，而不是静默退化为全量比较。
+    """
+    if not isinstance(obj, dict):
+        raise TileMaskError("changed_tiles must be an object with a mask")
+    try:
+        arr = np.asarray(obj.get("mask"), dtype=bool)
+    except Exception:
+        raise TileMaskError("changed_tiles.mask must be a 2-D 0/1 array")
+    if arr.ndim != 2 or arr.size == 0:
+        raise TileMaskError("changed_tiles.mask must be a non-empty 2-D array")
+    for key, size in (("rows", arr.shape[0]), ("cols", arr.shape[1])):
+        if obj.get(key) is not None and str(obj[key]) != str(size):
+            raise TileMaskError(f"changed_tiles.{key} does not match the mask shape")
+    return arr
+
+def split_by_tiles(elements, mask):
+    """按变化瓦片划分元素
+
+    元素相对框与任一变化瓦片相交则为活跃元素，否则为未变化区域元素。
+
+    返回:
+    - tuple: (活跃元素列表, 未变化元素列表)
+    """
+    rows, cols = mask.shape
+    active = []
+    idle = []
+    for e in elements:
+        rel = e.get("geometry", {}).get("rel") or [0.0, 0.0, 0.0, 0.0]
+        c1 = min(max(int(float(rel[0]) * cols), 0), cols - 1)
+        r1 = min(max(int(float(rel[1]) * rows), 0), rows - 1)
+        c2 = min(max(int(np.ceil(float(rel[2]) * cols)) - 1, c1), cols - 1)
+        r2 = min(max(int(np.ceil(float(rel[3]) * rows)) - 1, r1), rows - 1)
+        if mask[r1:r2 + 1, c1:c2 + 1].any():
+            active.append(e)
+        else:
+            idle.append(e)
+    return active, idle
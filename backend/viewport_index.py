@@ -0,0 +1,178 @@
+import numpy as np
+
+
+def _issue_boxes(graph, issues, matching, source):
+    """把问题定位到指定一侧的元素框
+
+    问题的 node_id 为设计端节点（ADDED_WIDGET 为运行时节点）；
+    运行时一侧通过匹配结果把设计端节点映射到对应的运行时节点。
+
+    返回:
+    - list[dict]: {index, type, severity, node_id, box}
+    """
+    boxes = {e.get("id"): (e.get("geometry") or {}).get("abs") for e in graph.get("elements", [])}
+    to_runtime = {}
+    if source == "runtime":
+        for m in (matching or {}).get("matches", []):
+            d, r = m.get("design") or {}, m.get("runtime") or {}
+            if d.get("id") and r.get("id"):
+                to_runtime[d["id"]] = r["id"]
+    out = []
+    for k, it in enumerate(issues or []):
+        node = it.get("node_id")
+        if source == "runtime" and it.get("type") != "ADDED_WIDGET":
+            node = to_runtime.get(node)
+        elif source == "design" and it.get("type") == "ADDED_WIDGET":
+            node = None
+        box = boxes.get(node)
+        if box:
+            out.append({"index": k, "type": it.get("type"), "severity": it.get("severity"), "node_id": node, "box": list(box)})
+    return out
+
+
+class ViewportIndex:
+    """语义图元素框的四叉树视口索引
+
+    静态构建的松散四叉树：节点区域四等分，元素按中心点下沉到子象限
+    （跨越分界线的元素不会滞留在上层节点），每个节点记录子树元素数与
+    外接框，查询以外接框判断相交，并用于低缩放级别下的聚合。
+
+    查询时只访问与视口相交的节点：
+    - 子树外接框在屏幕上小于 cluster_px 的节点整体输出为一个聚合块；
+    - 屏幕尺寸小于 min_px 的元素按所在节点聚合；
+    - 其余可见元素逐个输出。
+    因此返回的条目数由视口像素尺寸决定，与页面元素总数基本无关。
+    问题标记数量较少，视口内的全部问题总是逐个返回。
+    """
+    def __init__(self, graph, issues=None, matching=None, source="design", config=None):
+        """构建索引
+
+        参数:
+        - graph: 语义图（meta/elements）
+        - issues: 可选，诊断问题列表
+        - matching: 可选，匹配结果（运行时一侧定位问题时需要）
+        - source: "design" 或 "runtime"
+        - config: 可选，{"capacity", "max_depth", "min_px", "cluster_px", "limit"}
+        """
+        self.config = config or {
+            "capacity": 16,
+            "max_depth": 12,
+            "min_px": 4.0,
+            "cluster_px": 48.0,
+            "limit": 4000,
+        }
+        self.source = source
+        elements = [e for e in graph.get("elements", []) if (e.get("geometry") or {}).get("abs")]
+        self.items = [{"id": e.get("id"), "label": (e.get("type") or {}).get("label"), "text": (e.get("content") or {}).get("text")} for e in elements]
+        self.boxes = np.array([e["geometry"]["abs"] for e in elements], dtype=np.float64).reshape(-1, 4)
+        res = (graph.get("meta") or {}).get("resolution") or [1, 1]
+        self.resolution = [int(res[0]), int(res[1])]
+        self.issues = _issue_boxes(graph, issues, matching, source)
+        self.nodes = []
+        if len(self.boxes):
+            lo = np.minimum(self.boxes[:, :2].min(axis=0), 0.0)
+            hi = np.maximum(self.boxes[:, 2:].max(axis=0), self.resolution)
+            self._build([float(lo[0]), float(lo[1]), float(hi[0]), float(hi[1])], np.arange(len(self.boxes)), 0)
+
+    def _build(self, rect, idx, depth):
+        """递归构建节点，返回节点下标"""
+        k = len(self.nodes)
+        node = {"rect": rect, "items": idx, "children": [], "count": int(len(idx)), "bbox": None}
+        self.nodes.append(node)
+        if len(idx) > self.config.get("capacity", 16) and depth < self.config.get("max_depth", 12):
+            x1, y1, x2, y2 = rect
+            mx, my = (x1 + x2) / 2.0, (y1 + y2) / 2.0
+            b = self.boxes[idx]
+            cx, cy = (b[:, 0] + b[:, 2]) / 2.0, (b[:, 1] + b[:, 3]) / 2.0
+            left, right = cx < mx, cx >= mx
+            top, bottom = cy < my, cy >= my
+            quads = [
+                ([x1, y1, mx, my], left & top),
+                ([mx, y1, x2, my], right & top),
+                ([x1, my, mx, y2], left & bottom),
+                ([mx, my, x2, y2], right & bottom),
+            ]
+            for qrect, mask in quads:
+                if mask.any():
+                    node["children"].append(self._build(qrect, idx[mask], depth + 1))
+            node["items"] = idx[:0]
+        b = self.boxes[idx]
+        node["bbox"] = [float(b[:, 0].min()), float(b[:, 1].min()), float(b[:, 2].max()), float(b[:, 3].max())]
+        labels = self._labels(node["items"])
+        for c in node["children"]:
+            for lb, n in self.nodes[c]["labels"].items():
+                labels[lb] = labels.get(lb, 0) + n
+        node["labels"] = labels
+        return k
+
+    def _labels(self, idx):
+        """统计元素类型计数"""
+        labels = {}
+        for i in idx:
+            lb = self.items[i]["label"]
+            labels[lb] = labels.get(lb, 0) + 1
+        return labels
+
+    def _cluster(self, bbox, count, labels):
+        """生成聚合块：外接框、元素数与数量最多的三种类型"""
+        top = sorted(labels.items(), key=lambda kv: (-kv[1], str(kv[0])))[:3]
+        return {"box": [round(v, 1) for v in bbox], "count": int(count), "labels": dict(top)}
+
+    def query(self, rect=None, scale=1.0, limit=None):
+        """查询视口内的元素框
+
+        参数:
+        - rect: 视口 [x1,y1,x2,y2]（页面像素坐标），默认整页
+        - scale: 屏幕像素 / 页面像素（缩放级别）
+        - limit: 可选，逐个返回的元素上限，超出部分并入聚合
+
+        返回:
+        - dict: source、resolution、boxes（{id,label,text,box}）、clusters、issues 与 truncated 标记
+        """
+        limit = int(limit or self.config.get("limit", 4000))
+        scale = max(float(scale), 1e-6)
+        min_px = float(self.config.get("min_px", 4.0))
+        cluster_px = float(self.config.get("cluster_px", 48.0))
+        if rect is None:
+            rect = [0.0, 0.0, float(self.resolution[0]), float(self.resolution[1])]
+        vx1, vy1, vx2, vy2 = [float(v) for v in rect]
+        boxes, clusters = [], []
+        truncated = False
+        stack = [0] if self.nodes else []
+        while stack:
+            k = stack.pop()
+            node = self.nodes[k]
+            bx1, by1, bx2, by2 = node["bbox"]
+            if bx2 < vx1 or bx1 > vx2 or by2 < vy1 or by1 > vy2:
+                continue
+            if node["count"] > 1 and max(bx2 - bx1, by2 - by1) * scale < cluster_px:
+                clusters.append(self._cluster(node["bbox"], node["count"], node["labels"]))
+                continue
+            idx = node["items"]
+            if len(idx):
+                b = self.boxes[idx]
+                visible = (b[:, 2] >= vx1) & (b[:, 0] <= vx2) & (b[:, 3] >= vy1) & (b[:, 1] <= vy2)
+                big = np.maximum(b[:, 2] - b[:, 0], b[:, 3] - b[:, 1]) * scale >= min_px
+                small = idx[visible & ~big]
+                for i in idx[visible & big]:
+                    if len(boxes) >= limit:
+                        truncated = True
+                        small = np.append(small, i)
+                        continue
+                    it = self.items[i]
+                    boxes.append({"id": it["id"], "label": it["label"], "text": it["text"], "box": self.boxes[i].tolist()})
+                if len(small):
+                    sb = self.boxes[small]
+                    bbox = [float(sb[:, 0].min()), float(sb[:, 1].min()), float(sb[:, 2].max()), float(sb[:, 3].max())]
+                    clusters.append(self._cluster(bbox, len(small), self._labels(small)))
+            stack.extend(reversed(node["children"]))
+        issues = [it for it in self.issues if it["box"][2] >= vx1 and it["box"][0] <= vx2 and it["box"][3] >= vy1 and it["box"][1] <= vy2]
+        return {
+            "source": self.source,
+            "resolution": self.resolution,
+            "boxes": boxes,
+            "clusters": clusters,
+            "issues": issues,
+            "total": int(len(self.boxes)),
+            "truncated": truncated,
+        }
@@ -0,0 +1,205 @@
+import numpy as np
+
+from extractor import parse_bounds
+
+
+def _as_float(value, default):
+    """将属性值转为浮点数，空串/非法值返回默认值"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+def _is_false(value):
+    """判断布尔型属性是否显式为假（兼容 "false"/False）"""
+    return value is False or (isinstance(value, str) and value.strip().lower() == "false")
+
+def _box(bounds):
+    """解析 bounds 为 [x1,y1,x2,y2]，失败返回 None"""
+    bb = parse_bounds(bounds) if isinstance(bounds, str) and bounds else None
+    if not bb:
+        return None
+    return [bb["x"], bb["y"], bb["x"] + bb["width"], bb["y"] + bb["height"]]
+
+def _opaque_color(color):
+    """判断颜色是否完全不透明（支持 #AARRGGBB 与 #RRGGBB）"""
+    if not isinstance(color, str) or not color.startswith("#"):
+        return False
+    hexpart = color[1:]
+    if len(hexpart) == 6:
+        return True
+    return len(hexpart) == 8 and hexpart[:2].upper() == "FF"
+
+def _count_nodes(node):
+    """统计子树中带 attributes 的节点数"""
+    total = 0
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if isinstance(n, dict):
+            if isinstance(n.get("attributes"), dict):
+                total += 1
+            if isinstance(n.get("children"), list):
+                stack.extend(n["children"])
+        elif isinstance(n, list):
+            stack.extend(n)
+    return total
+
+
+class VisibilityPruner:
+    """渲染可见性裁剪
+
+    在构建语义图之前剔除不会被渲染出来的节点：
+    - visible=false 或有效不透明度（祖先连乘）低于阈值的节点连同子树剔除；
+    - bounds 被裁剪为空而 origBounds 非空的节点（滚动容器外）连同子树剔除；
+    - bounds 完全位于视口之外的节点仅剔除自身，子节点单独判断；
+    - 按绘制顺序（先序遍历、兄弟节点按 zIndex 稳定排序）逆序扫描，
+      完全落在某个后绘制的不透明背景节点内的节点视为被遮挡，仅剔除自身。
+      后绘制节点不包括自身后代，因此子节点不会遮挡父容器。
+    """
+    def __init__(self, config=None):
+        """初始化裁剪配置
+
+        参数:
+        - config: 可选，{"min_opacity", "offscreen", "occlusion"}
+        """
+        self.config = config or {
+            "min_opacity": 0.01,
+            "offscreen": True,
+            "occlusion": True,
+        }
+
+    def _viewport(self, data):
+        """取根节点 bounds 作为视口，缺失时返回 None"""
+        stack = [data]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                attrs = node.get("attributes") if isinstance(node.get("attributes"), dict) else None
+                box = _box(attrs.get("bounds")) if attrs else None
+                if box and box[2] > box[0] and box[3] > box[1]:
+                    return box
+                if isinstance(node.get("children"), list):
+                    stack.extend(reversed(node["children"]))
+            elif isinstance(node, list):
+                stack.extend(reversed(node))
+        return None
+
+    def _paint_order(self, data, stats):
+        """先序遍历生成绘制序列，同时剔除不可见/透明/被裁剪的子树
+
+        返回:
+        - tuple: (绘制序列 [{node, box, alpha, opaque, end}], 被整棵剔除的节点 id 集合)
+        """
+        min_opacity = float(self.config.get("min_opacity", 0.01))
+        order = []
+        gone = set()
+
+        def rec(node, alpha):
+            if isinstance(node, list):
+                for it in node:
+                    rec(it, alpha)
+                return
+            if not isinstance(node, dict):
+                return
+            attrs = node.get("attributes") if isinstance(node.get("attributes"), dict) else None
+            children = node.get("children") if isinstance(node.get("children"), list) else []
+            entry = None
+            if attrs:
+                alpha = alpha * _as_float(attrs.get("opacity"), 1.0)
+                reason = None
+                box = _box(attrs.get("bounds"))
+                orig = _box(attrs.get("origBounds"))
+                if _is_false(attrs.get("visible")):
+                    reason = "invisible"
+                elif alpha < min_opacity:
+                    reason = "transparent"
+                elif orig and orig[2] > orig[0] and orig[3] > orig[1] and (not box or box[2] <= box[0] or box[3] <= box[1]):
+                    reason = "clipped"
+                if reason:
+                    stats[reason] += _count_nodes(node)
+                    gone.add(id(node))
+                    return
+                entry = {
+                    "node": node,
+                    "box": box,
+                    "alpha": alpha,
+                    "opaque": alpha >= 1.0 - 1e-6 and _opaque_color(attrs.get("backgroundColor")),
+                    "end": 0,
+                }
+                order.append(entry)
+            ranked = sorted(
+                enumerate(children),
+                key=lambda kv: (_as_float((kv[1].get("attributes") or {}).get("zIndex") if isinstance(kv[1], dict) else None, 0.0), kv[0]),
+            )
+            for _, child in ranked:
+                rec(child, alpha)
+            if entry is not None:
+                entry["end"] = len(order) - 1
+
+        rec(data, 1.0)
+        return order, gone
+
+    def prune(self, data):
+        """裁剪原始树中不会被渲染的节点
+
+        被剔除的节点不从树中删除，而是在浅拷贝上标记 _pruned
+        （"subtree" 整棵剔除 / "node" 仅剔除自身），保持兄弟序号不变，
+        原数据不被修改。
+
+        参数:
+        - data: 原始层级数据（attributes/children）
+
+        返回:
+        - tuple: (标记后的树, 统计 dict)
+        """
+        stats = {"invisible": 0, "transparent": 0, "clipped": 0, "offscreen": 0, "occluded": 0}
+        order, gone = self._paint_order(data, stats)
+        hidden = set()
+        viewport = self._viewport(data)
+        if self.config.get("offscreen", True) and viewport:
+            vx1, vy1, vx2, vy2 = viewport
+            for e in order:
+                b = e["box"]
+                if b and b[2] > b[0] and b[3] > b[1] and (b[2] <= vx1 or b[0] >= vx2 or b[3] <= vy1 or b[1] >= vy2):
+                    hidden.add(id(e["node"]))
+                    stats["offscreen"] += 1
+        if self.config.get("occlusion", True):
+            occ_idx = [k for k, e in enumerate(order) if e["opaque"] and e["box"] and id(e["node"]) not in hidden]
+            if occ_idx:
+                occ = np.array([order[k]["box"] for k in occ_idx], dtype=np.float64)
+                occ_at = np.array(occ_idx)
+                for k in range(len(order) - 1, -1, -1):
+                    e = order[k]
+                    b = e["box"]
+                    if not b or id(e["node"]) in hidden:
+                        continue
+                    later = occ_at > e["end"]
+                    if not later.any():
+                        continue
+                    o = occ[later]
+                    covered = (o[:, 0] <= b[0]) & (o[:, 1] <= b[1]) & (o[:, 2] >= b[2]) & (o[:, 3] >= b[3])
+                    if covered.any():
+                        hidden.add(id(e["node"]))
+                        stats["occluded"] += 1
+        stats["pruned"] = sum(stats.values())
+        stats["kept"] = len(order) - len(hidden)
+        if not gone and not hidden:
+            return data, stats
+
+        def rebuild(node):
+            if isinstance(node, list):
+                return [rebuild(it) for it in node]
+            if not isinstance(node, dict):
+                return node
+            out = dict(node)
+            if id(node) in gone:
+                out["_pruned"] = "subtree"
+                return out
+            if isinstance(node.get("children"), list):
+                out["children"] = rebuild(node["children"])
+            if id(node) in hidden:
+                out["_pruned"] = "node"
+            return out
+
+        return rebuild(data), stats